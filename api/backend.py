@@ -1,20 +1,78 @@
-import concurrent.futures
+import queue
+import threading
+from time import perf_counter
 
-from fastapi import FastAPI, APIRouter
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 import yaml
 
 from api_libs.logger import Logger, log
 
 import libs.helper as helper
-from libs.core import SCTManager, filter_services
+import libs.memory as mem
+import libs.metrics as metrics
+from libs.accounting import accounting
+from libs.core import RolloutSession, SCTManager, diff_fleet, filter_services, get_environments_list
+from libs.envqueue import EnvWriteQueue
+from libs.executor import BoundedExecutor, ExecutorOverloaded
+from libs.jobs import Job, JobLimitError, JobManager
+from libs.output import to_ndjson
+from libs.pool import ManagerPool
+from libs.reconcile import Reconciler, reconcile_env
+from libs.singleflight import SingleFlight
+from libs.timing import Timings
+from libs.tracing import in_current_context, span
 
 logger = Logger()
 
+# catalog, ADS client and shared envs live as long as the process, SCT login is renewed when it expires
+session = RolloutSession()
+manager_pool = ManagerPool(factory=lambda env_name: SCTManager(env_name, session=session),
+                           ttl=helper.get_ff('MANAGER_POOL_TTL', 300),
+                           max_size=helper.get_ff('MANAGER_POOL_SIZE', 32))
+# one worker pool for per-service work of all requests and jobs
+executor = BoundedExecutor(max_workers=helper.get_ff('API_MAX_WORKERS', 10),
+                           max_queue=helper.get_ff('API_MAX_QUEUE', 200),
+                           retry_after=helper.get_ff('API_RETRY_AFTER', 30))
+# envs diffed at the same time by one fleet request, their per-service work goes to the shared executor
+FLEET_MAX_WORKERS = helper.get_ff('API_FLEET_MAX_WORKERS', 8)
+# concurrent identical reads share one computation, writes to the same env run one by one in arrival order
+reads_flight = SingleFlight()
+env_writes = EnvWriteQueue(merge=helper.get_ff('API_MERGE_UPDATES', True))
+
+job_manager = JobManager(max_workers=helper.get_ff('JOBS_MAX_WORKERS', 2),
+                         max_jobs=helper.get_ff('JOBS_MAX_COUNT', 100),
+                         ttl=helper.get_ff('JOBS_TTL', 3600))
+
+# drift correction in background, enable on one replica only
+reconciler = Reconciler(lambda env_name: run_reconcile(env_name), get_environments_list,
+                        interval=helper.get_ff('RECONCILE_INTERVAL', 600),
+                        jitter=helper.get_ff('RECONCILE_JITTER', 0.1),
+                        max_backoff=helper.get_ff('RECONCILE_MAX_BACKOFF', 21600),
+                        max_workers=helper.get_ff('RECONCILE_WORKERS', 4))
+
+metrics.EXECUTOR_PENDING.set_function(lambda: executor.stats()['pending'])
+metrics.EXECUTOR_QUEUED.set_function(lambda: executor.stats()['queued'])
+metrics.ENV_WRITES_QUEUED.set_function(lambda: env_writes.stats()['queued'])
+metrics.JOBS_ACTIVE.set_function(lambda: sum(job.active for job in job_manager.list()))
+
 
 app = FastAPI(title='HappySCT', version="1.0", description="Manage SCT records")
 services_router = APIRouter(tags=["services"])
 schemes_router = APIRouter(tags=["schemes"])
+jobs_router = APIRouter(tags=["jobs"])
+reconcile_router = APIRouter(tags=["reconcile"])
+
+
+@app.on_event("startup")
+def start_reconcile() -> None:
+    if helper.get_ff('RECONCILE_ENABLED', False):
+        reconciler.start()
+
+
+@app.on_event("shutdown")
+def stop_reconcile() -> None:
+    reconciler.stop(timeout=5)
 
 
 @app.exception_handler(Exception)
@@ -25,6 +83,37 @@ async def generic_exception_handler(request, exc):
     )
 
 
+def admit_heavy() -> None:
+    """Admission control for heavy requests: shared executor queue and memory usage of the pod"""
+    executor.admit()
+    pressure = mem.get_memory_pressure(max_age=helper.get_ff('MEMORY_REFRESH_INTERVAL', 1))
+    if pressure > helper.get_ff('MEMORY_ADMISSION_THRESHOLD', 0.85):
+        metrics.MEMORY_REJECTED.inc()
+        raise ExecutorOverloaded(f"Server is busy, memory usage is {pressure:.0%} of limit",
+                                 retry_after=executor.retry_after)
+
+
+@app.middleware("http")
+async def observe_request_latency(request, call_next):
+    start = perf_counter()
+    with span(f'{request.method} {request.url.path}'):
+        response = await call_next(request)
+    route = request.scope.get('route')
+    metrics.REQUEST_LATENCY.labels(
+        route.path if route else 'unmatched', request.method, response.status_code
+    ).observe(perf_counter() - start)
+    return response
+
+
+@app.exception_handler(ExecutorOverloaded)
+async def overloaded_exception_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # Redirect root path to /docs
 @app.get("/", include_in_schema=False)
 async def redirect_to_docs():
@@ -38,7 +127,9 @@ def update(
     force: bool = False,
     only: str = '',
     group: str = '',
-    exclude: str = ''
+    exclude: str = '',
+    timings: bool = False,
+    calls: bool = False
 ):
     """
     Parameters:
@@ -47,6 +138,8 @@ def update(
     - `only` (str, optional): Services to include in the update
     - `group` (str, optional): Group of services to include in the update by source service
     - `exclude` (str, optional): Services to exclude from the update
+    - `timings` (bool, optional): If True - adds stages durations in seconds per service and env
+    - `calls` (bool, optional): If True - adds SCT and ADS calls by endpoint and calls repeated with the same arguments
 
     Examples:
     - /update/lab-lem-ams
@@ -56,48 +149,14 @@ def update(
     - /update/lab-lem-ams?group=pwr
     - /update/lab-lem-ams?exclude=jws
     """
-    sct_manager = SCTManager(env_name)
-    services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force)
-
-    result = {
-        'force_mode': force,
-        'services_to_process': services_to_process,
-        'failed': [],
-        'added': [],
-        'recreated': [],
-        'skipped': [],
-        'by_service': {}
-    }
-
-    def _process_service(service):
-        update_result = sct_manager.update(service=service, force=force)
-        if not update_result.get("status", False) and 'not present' in update_result.get('message', ''):
-            result['skipped'].append(service)
-        elif not update_result.get("status", False):
-            result['failed'].append(service)
-        elif update_result.get("status", True) and not update_result.get("updated", False):
-            result['skipped'].append(service)
-        elif update_result.get("old_deleted", False):
-            result['recreated'].append(service)
-        elif update_result.get("updated", True):
-            result['added'].append(service)
-
-        result['by_service'][service] = update_result
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        for service in services_to_process:
-            executor.submit(_process_service, service)
-
-    return result
+    admit_heavy()
+    return run_update(env_name, force, only, group, exclude, timings=timings, calls=calls)
 
 
 @schemes_router.get("/update/{env_name}/schemes", summary="Update default deployment schemes")
 @log(logger)
 def update_schemes(env_name: str):
-    sct_manager = SCTManager(env_name)
-    schemes_result = sct_manager.update_deployment_schemes()
-
-    return schemes_result
+    return run_update_schemes(env_name)
 
 
 @services_router.get("/show/{env_name}", summary="Show services current config")
@@ -108,13 +167,8 @@ def show(
     group: str = '',
     exclude: str = ''
 ):
-    sct_manager = SCTManager(env_name)
-    services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=None)
-
-    result = dict()
-    for service in services_to_process:
-        result[service] = sct_manager.get_current(service)
-    return result
+    return reads_flight.do(request_key('show', env_name, only, group, exclude),
+                           lambda: run_show(env_name, only, group, exclude))
 
 
 @services_router.get("/diff/{env_name}", summary="Difference between current services config and new generated one")
@@ -123,41 +177,313 @@ def diff(
     env_name: str,
     only: str = '',
     group: str = '',
-    exclude: str = ''
+    exclude: str = '',
+    timings: bool = False,
+    calls: bool = False
+):
+    admit_heavy()
+    return reads_flight.do(request_key('diff', env_name, only, group, exclude, timings, calls),
+                           lambda: run_diff(env_name, only, group, exclude, timings=timings, calls=calls))
+
+
+@services_router.get("/diff", summary="Fleet-wide difference between current and new services config")
+@log(logger)
+def fleet_diff(
+    envs: str = '',
+    only: str = '',
+    group: str = '',
+    exclude: str = '',
+    workers: int = Query(4, ge=1, le=FLEET_MAX_WORKERS),
+    calls: bool = False
+):
+    """
+    Parameters:
+    - `envs` (str, optional): Envs to diff, all Lab envs if not set
+    - `only`, `group`, `exclude` (str, optional): Services filters, same as /diff/{env_name}
+    - `workers` (int, optional): Number of envs processed at the same time, up to API_FLEET_MAX_WORKERS
+    - `calls` (bool, optional): If True - adds SCT and ADS calls of all envs, same as /update/{env_name}
+
+    Returns changes matrix: `envs` - changes by env, `services` - changes by service and env,
+    `failed_envs` - envs failed to diff.
+
+    Examples:
+    - /diff?envs=lab-lem-ams,lab-lem-sjc&only=ace
+    - /diff?group=pwr
+    """
+    admit_heavy()
+    env_list = helper.arg_to_list(envs) if envs else get_environments_list()
+    return reads_flight.do(
+        request_key('fleet_diff', ','.join(sorted(env_list)), only, group, exclude, workers, calls),
+        lambda: with_calls(calls, lambda: diff_fleet(env_list, only, group, exclude, max_workers=workers,
+                                                     session=session, manager_factory=manager_pool.get,
+                                                     executor=executor))
+    )
+
+
+@services_router.get("/update/{env_name}/stream", summary="Add or recreate services config in SCT, stream progress")
+@log(logger)
+def update_stream(
+    env_name: str,
+    force: bool = False,
+    only: str = '',
+    group: str = '',
+    exclude: str = '',
+    timings: bool = False,
+    calls: bool = False
+):
+    """
+    Same parameters as /update/{env_name}. Streams NDJSON: `start` record with services to process,
+    `service` record as soon as each service is done, and `summary` record at the end.
+    """
+    admit_heavy()
+    return stream_operation(env_name, lambda on_start, on_result: run_update_locked(
+        env_name, force, only, group, exclude, on_start=on_start, on_result=on_result, timings=timings,
+        calls=calls
+    ))
+
+
+@services_router.get("/diff/{env_name}/stream", summary="Difference between current and new services config, stream progress")
+@log(logger)
+def diff_stream(
+    env_name: str,
+    only: str = '',
+    group: str = '',
+    exclude: str = '',
+    timings: bool = False,
+    calls: bool = False
+):
+    """
+    Same parameters as /diff/{env_name}. Streams NDJSON: `start` record with services to process,
+    `service` record as soon as each service is done, and `summary` record at the end.
+    """
+    admit_heavy()
+    return stream_operation(env_name, lambda on_start, on_result: run_diff(
+        env_name, only, group, exclude, on_start=on_start, on_result=on_result, timings=timings, calls=calls
+    ))
+
+
+@jobs_router.post("/jobs/update/{env_name}", summary="Submit background update of services config in SCT")
+@log(logger)
+def submit_update_job(
+    env_name: str,
+    force: bool = False,
+    only: str = '',
+    group: str = '',
+    exclude: str = '',
+    timings: bool = False,
+    calls: bool = False
 ):
-    sct_manager = SCTManager(env_name)
-    services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=True)
-
-    result = {
-        'fail': [],
-        'add': [],
-        'recreate': [],
-        'skip': [],
-        'by_service': {}
-    }
-
-    def _process_service(service):
-        diff_result = sct_manager.get_diff(service)
-        if not diff_result.get("status", False) and 'not present' in diff_result.get('message', ''):
-            result['skip'].append(service)
-        elif not diff_result.get("status", False):
-            result['fail'].append(service)
-        elif not diff_result.get('config_diff', {}):
-            result['skip'].append(service)
-        elif diff_result.get('config_diff', {}) and service not in sct_manager.env_services:
-            result['add'].append(service)
-        elif diff_result.get('config_diff', {}) and service in sct_manager.env_services:
-            result['recreate'].append(service)
-
-        result['by_service'][service] = diff_result
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        for service in services_to_process:
-            executor.submit(_process_service, service)
+    """
+    Same parameters as /update/{env_name}. Returns job id right away,
+    poll /jobs/{job_id} for progress and /jobs/{job_id}/result for result.
+    Submitting the same active update again returns the existing job.
+    """
+    admit_heavy()
+    params = {'env_name': env_name, 'force': force, 'only': only, 'group': group, 'exclude': exclude,
+              'timings': timings, 'calls': calls}
+    return submit_job('update', params, lambda job: run_update(env_name, force, only, group, exclude,
+                                                               job=job, timings=timings, calls=calls))
+
+
+@jobs_router.post("/jobs/update/{env_name}/schemes", summary="Submit background update of deployment schemes")
+@log(logger)
+def submit_update_schemes_job(env_name: str):
+    return submit_job('update_schemes', {'env_name': env_name},
+                      lambda job: run_update_schemes(env_name))
+
+
+@jobs_router.get("/jobs", summary="List background jobs")
+@log(logger)
+def list_jobs():
+    return [job.to_dict() for job in job_manager.list()]
+
+
+@jobs_router.get("/jobs/{job_id}", summary="Background job status and per-service progress")
+@log(logger)
+def get_job(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+
+@jobs_router.get("/jobs/{job_id}/result", summary="Background job result")
+@log(logger)
+def get_job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    if job.active:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}, result is not ready yet")
+    return job.to_dict(with_result=True)
+
+
+@reconcile_router.get("/reconcile", summary="Background reconcile status")
+@log(logger)
+def reconcile_status():
+    return reconciler.stats()
+
+
+@reconcile_router.get("/reconcile/{env_name}", summary="Background reconcile status of env")
+@log(logger)
+def reconcile_env_status(env_name: str):
+    status = reconciler.env_status(env_name)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Env {env_name} is not reconciled")
+    return status
+
+
+@reconcile_router.post("/reconcile/start", summary="Start background reconcile")
+@log(logger)
+def reconcile_start():
+    reconciler.start()
+    return reconciler.stats()
+
+
+@reconcile_router.post("/reconcile/stop", summary="Stop background reconcile")
+@log(logger)
+def reconcile_stop():
+    reconciler.stop(timeout=5)
+    return reconciler.stats()
+
+
+def request_key(operation: str, env_name: str, only: str, group: str, exclude: str, *args) -> tuple:
+    """Requests with the same key are identical, filters order doesn't matter"""
+    filters = tuple(tuple(sorted(helper.arg_to_list(value))) if value else () for value in (only, group, exclude))
+    return (operation, env_name) + filters + args
 
+
+def run_show(env_name: str, only: str, group: str, exclude: str) -> dict:
+    sct_manager = manager_pool.get(env_name)
+    services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=None,
+                                          all_services=session.services_config)
+
+    result = dict()
+    for service in services_to_process:
+        result[service] = sct_manager.get_current(service)
+    return result
+
+
+def with_calls(calls: bool, func) -> dict:
+    """Run func, add report of SCT and ADS calls it made to its result if calls is set"""
+    with accounting(calls) as calls_accounting:
+        result = func()
+    if calls_accounting:
+        result['calls'] = calls_accounting.report()
     return result
 
 
+def run_diff(env_name: str, only: str, group: str, exclude: str, on_start=None, on_result=None,
+             timings: bool = False, calls: bool = False) -> dict:
+    def _diff():
+        sct_manager = manager_pool.get(env_name)
+        services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=True,
+                                              all_services=session.services_config)
+        if on_start:
+            on_start(services_to_process)
+        return sct_manager.diff_services(services_to_process, executor=executor, on_result=on_result,
+                                         timings=timings)
+
+    return with_calls(calls, _diff)
+
+
+def run_update(env_name: str, force: bool, only: str, group: str, exclude: str, job: Job | None = None,
+               timings: bool = False, calls: bool = False) -> dict:
+    # jobs are deduplicated by job manager and report their own progress, so they are not merged
+    if job:
+        return run_update_locked(env_name, force, only, group, exclude,
+                                 on_start=lambda services: job.set_total(len(services)),
+                                 on_result=job.add_progress, timings=timings, calls=calls)
+    return run_update_locked(env_name, force, only, group, exclude, timings=timings, calls=calls,
+                             merge_key=request_key('update', env_name, only, group, exclude, force, timings,
+                                                   calls))
+
+
+def run_update_locked(env_name: str, force: bool, only: str, group: str, exclude: str,
+                      on_start=None, on_result=None, timings: bool = False, calls: bool = False,
+                      merge_key: tuple | None = None) -> dict:
+    """
+    Update env after writes queued before it. Request with merge_key joins queued or running
+    update with the same key and gets its result instead of deleting and registering services again.
+    """
+    def _update():
+        # writes go on top of fresh current services, and leave them fresh for readers
+        refresh_timings = Timings()
+        sct_manager = manager_pool.get(env_name, fresh=True, timings=refresh_timings)
+        services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force,
+                                              all_services=session.services_config)
+        if on_start:
+            on_start(services_to_process)
+        try:
+            result = sct_manager.update_services(services_to_process, force=force, executor=executor,
+                                                 on_result=on_result, timings=timings)
+        finally:
+            if services_to_process:
+                manager_pool.refresh(env_name, timings=refresh_timings)
+        if timings:
+            result['timings'].update(refresh_timings.to_dict())
+        return result
+
+    return env_writes.run(env_name, lambda: with_calls(calls, _update), key=merge_key)
+
+
+def run_update_schemes(env_name: str) -> dict:
+    return env_writes.run(env_name, lambda: manager_pool.get(env_name).update_deployment_schemes(),
+                          key=('update_schemes', env_name))
+
+
+def run_reconcile(env_name: str) -> dict:
+    # reconcile yields to user requests: deferred when server is busy, env is retried after Retry-After
+    admit_heavy()
+    return env_writes.run(env_name, lambda: reconcile_env(manager_pool.get(env_name, fresh=True),
+                                                          add_only=helper.get_ff('RECONCILE_ADD_ONLY', False),
+                                                          executor=executor))
+
+
+def stream_operation(env_name: str, operation) -> StreamingResponse:
+    """
+    Run operation(on_start, on_result) in background thread and stream its progress as NDJSON.
+    Per-service results go out as soon as they are ready, summary without them goes last.
+    """
+    records = queue.Queue()
+    done = object()
+
+    def _on_start(services):
+        records.put({'type': 'start', 'env': env_name, 'services_to_process': services})
+
+    def _on_result(service, service_result, state):
+        records.put({'type': 'service', 'env': env_name, 'service': service, 'state': state,
+                     'result': service_result})
+
+    def _run():
+        try:
+            result = operation(_on_start, _on_result)
+            records.put({'type': 'summary', 'env': env_name,
+                         **{key: value for key, value in result.items() if key != 'by_service'}})
+        except Exception as error:
+            logger.log.exception(f'Exception: {error}')
+            records.put({'type': 'error', 'env': env_name, 'detail': str(error)})
+        records.put(done)
+
+    def _stream():
+        while (record := records.get()) is not done:
+            yield to_ndjson(record)
+
+    # spans of the operation stay in the request's trace
+    threading.Thread(target=in_current_context(_run), daemon=True).start()
+    return StreamingResponse(_stream(), media_type='application/x-ndjson')
+
+
+def submit_job(kind: str, params: dict, func) -> dict:
+    try:
+        job = job_manager.submit(kind, params, func)
+    except JobLimitError as error:
+        raise HTTPException(status_code=503, detail=str(error), headers={'Retry-After': '60'})
+    return job.to_dict()
+
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
 @app.get("/ops-metadata")
 @log(logger)
 def ops_metadata():
@@ -169,11 +495,26 @@ def ops_metadata():
     return metadata
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_export():
+    data, content_type = metrics.export()
+    return Response(content=data, media_type=content_type)
+
+
 @app.get("/health")
 @log(logger)
 def health():
-    return helper.get_health()
+    data = helper.get_health()
+    data['manager_pool'] = manager_pool.stats()
+    data['executor'] = executor.stats()
+    data['single_flight'] = {'reads': reads_flight.stats()}
+    data['env_writes'] = env_writes.stats()
+    data['cache'] = session.cache.stats()
+    data['reconcile'] = reconciler.stats()
+    return data
 
 
 app.include_router(services_router)
 app.include_router(schemes_router)
+app.include_router(jobs_router)
+app.include_router(reconcile_router)
@@ -0,0 +1,105 @@
+"""Local fakes of SCT and ADS for benchmarks, same interface as libs.sct.SCT and libs.ads_wrapper"""
+
+from collections import Counter
+import threading
+import time
+
+from benchmarks.generator import EnvDataset
+
+
+class FakeWorld(object):
+    """
+    State shared by fake clients: env dataset, services registered in SCT by env id and calls count.
+    latency - seconds every call sleeps, to model network round trips.
+    """
+    def __init__(self, dataset: EnvDataset | None = None, latency: float = 0) -> None:
+        self.dataset = dataset or EnvDataset()
+        self.latency = latency
+        self.services = dict()
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def call(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def env(self, name: str, **kwargs) -> 'FakeENV':
+        return FakeENV(self, name)
+
+    def ads(self, **kwargs) -> 'FakeADS':
+        return FakeADS(self)
+
+    def sct(self) -> 'FakeSCT':
+        return FakeSCT(self)
+
+
+class FakeENV(object):
+    def __init__(self, world: FakeWorld, name: str) -> None:
+        world.call('ads_env')
+        self.world = world
+        self.info = world.dataset.env_info(name)
+        self.id = self.info['id']
+        self.name = self.info['name']
+
+    def getlocation(self) -> str:
+        return self.info['location']
+
+    def get_shared_env(self) -> str:
+        return self.info['shared_env']
+
+    def get_service_host_by_pod(self, service: str) -> list:
+        self.world.call('ads_hosts')
+        return self.world.dataset.service_hosts(self.name, service)
+
+    def get_pop_server_location(self) -> dict:
+        self.world.call('ads_pops')
+        return self.info['pops']
+
+
+class FakeADS(object):
+    def __init__(self, world: FakeWorld) -> None:
+        self.world = world
+
+    def calculate_server_variables(self, host: str, variables: list) -> dict:
+        self.world.call('ads_variables')
+        return self.world.dataset.host_variables(host, variables)
+
+
+class FakeSCT(object):
+    def __init__(self, world: FakeWorld) -> None:
+        self.world = world
+
+    def get_services(self, envid: str = "") -> dict:
+        self.world.call('sct_get_services')
+        with self.world._lock:
+            return {service: [dict(item) for item in items]
+                    for service, items in self.world.services.get(envid, {}).items()}
+
+    def update_service(self, service: str, envid: str = "", input_data: list = []) -> bool:
+        self.world.call('sct_register')
+        # stored in SCT format, the way get_services returns it
+        items = [{
+            'name': item['serviceName'], 'version': item['serviceVersion'],
+            'serviceInterface': item['serviceInterface'], 'deploymentScheme': item['deploymentScheme'],
+            'location': item['location'], 'selectedPod': item['physicalEnv'], 'ssl': item['ssl'],
+            'group': item['group'], 'address': item['address'], 'port': item['port'], 'order': 0,
+            'newModel': True,
+        } for item in input_data]
+        with self.world._lock:
+            self.world.services.setdefault(envid, {})[service] = items
+        return True
+
+    def delete_service(self, service: str, envid: str = "") -> bool:
+        self.world.call('sct_delete')
+        with self.world._lock:
+            return self.world.services.get(envid, {}).pop(service, None) is not None
+
+    def get_deployment_schemes(self, envid: str = "") -> dict:
+        self.world.call('sct_get_schemes')
+        return {}
+
+    def update_deployment_schemes(self, envid: str = "", input_data: list = []) -> bool:
+        self.world.call('sct_register_schemes')
+        return True
@@ -0,0 +1,214 @@
+"""
+Synthetic services catalog and env datasets for benchmarks and scale testing.
+
+    python -m benchmarks.generator --services=5000 --output=services-5k.json
+    python -m benchmarks.generator --services=5000 --group_size=5 --shared_by_env=0.1 --output=services-5k.json \
+        --envs=20 --dataset=envs-20.json
+"""
+
+import json
+import os
+import random
+import zlib
+
+import fire
+from jsonschema import validate
+
+from libs.core import get_required_variables
+
+
+LOCATIONS = ['ams02', 'sjc01', 'iad41', 'fra01']
+SHARED_ENV = 'AMS02-Shared-Resources'
+DOMAIN = '.lab.local'
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'conf', 'services_schema.json')
+# placeholders by field, all of them are resolved by EnvDataset.host_variables
+PLACEHOLDERS = {
+    'location': ['{Server.location}'],
+    'physicalEnv': ['{ENV.POD}'],
+    'group': ['group0{TRA.pool.group}', 'group0{TSA.pool.group}'],
+    'port': ['{PWR.INTAPI_PORT}', '{PWR.PASAPI_PORT}'],
+}
+
+
+def make_catalog(services: int = 10, placeholder_density: float = 0.3, group_size: int = 1,
+                 shared_by_env: float = 0.0, shared_by_location: float = 0.0, extra_variables: int = 0,
+                 seed: int = 0) -> dict:
+    """
+    Catalog in services.json format, the same for the same arguments.
+
+    :param placeholder_density: Share of location, physicalEnv, group and port fields with placeholder.
+    :param group_size: Services per source_service group, the first one is the source of the rest.
+    :param shared_by_env: Share of services with shared_by_env address override.
+    :param shared_by_location: Share of services with shared_by_location address override.
+    :param extra_variables: Number of GEN.VARn variables used in groups, grows required variables list.
+    """
+    rng = random.Random(seed)
+
+    def _field(field: str, default):
+        if rng.random() >= placeholder_density:
+            return default
+        if field == 'group' and extra_variables:
+            return f'group{{GEN.VAR{rng.randrange(extra_variables)}}}'
+        return rng.choice(PLACEHOLDERS[field])
+
+    catalog = dict()
+    source_service = None
+    for index in range(services):
+        name = f'svc{index:05d}'
+        if group_size > 1 and index % group_size == 0:
+            source_service = name
+        address = {
+            'default': '{SERVER_FQDN}',
+            'shared_by_env': None,
+            'shared_by_location': None,
+            'source_service': source_service if group_size > 1 and source_service != name else None,
+        }
+        if rng.random() < shared_by_env:
+            address['shared_by_env'] = {'default': f'{name}-shared{DOMAIN}',
+                                        SHARED_ENV: f'{name}--{SHARED_ENV.lower()}{DOMAIN}'}
+        if rng.random() < shared_by_location:
+            address['shared_by_location'] = {'default': f'{name}-location{DOMAIN}',
+                                             **{location: f'{name}-{location}{DOMAIN}' for location in LOCATIONS[:2]}}
+        catalog[name] = [{
+            'serviceName': name,
+            'serviceVersion': f'v{rng.randint(1, 5)}',
+            'serviceInterface': rng.choice(['rest', 'grpc', 'soap']),
+            'deploymentScheme': rng.choice(['cl-1dc', 'cl-2dc', 'cl-2dc-active']),
+            'location': _field('location', None),
+            'physicalEnv': _field('physicalEnv', None),
+            'ssl': rng.random() < 0.5,
+            'group': _field('group', None),
+            'address': address,
+            'port': _field('port', rng.choice([80, 443, 8080, 8443])),
+        }]
+    return catalog
+
+
+def validate_catalog(catalog: dict) -> None:
+    """Raise jsonschema.ValidationError if catalog doesn't match conf/services_schema.json"""
+    with open(SCHEMA_FILE) as f:
+        validate(instance=catalog, schema=json.load(f))
+
+
+def env_names(envs: int = 1) -> list:
+    return [f'lab-bench-{index:03d}' for index in range(envs)]
+
+
+def stable_hash(*parts) -> int:
+    """Hash that is the same across runs, unlike hash() of str"""
+    return zlib.crc32(':'.join(str(part) for part in parts).encode())
+
+
+class EnvDataset(object):
+    """
+    Fake envs and hosts computed on demand, so even 500 envs x 10k services take no memory.
+    presence share of services has hosts on local env, the rest are looked up on shared env.
+    """
+    def __init__(self, hosts_per_service: int = 2, presence: float = 0.8) -> None:
+        self.hosts_per_service = hosts_per_service
+        self.presence = presence
+
+    def env_info(self, env_name: str) -> dict:
+        index = stable_hash(env_name)
+        location = LOCATIONS[index % len(LOCATIONS)]
+        return {
+            'id': str(1000 + index % 100000),
+            'name': env_name.upper(),
+            'location': location,
+            'shared_env': SHARED_ENV,
+            'pops': {pop: {'location': location, 'server_location': LOCATIONS[(index + pop) % len(LOCATIONS)]}
+                     for pop in (1, 2)},
+        }
+
+    def service_hosts(self, env_name: str, service: str) -> list:
+        if env_name.lower() != SHARED_ENV.lower() and stable_hash(env_name, service) % 100 >= self.presence * 100:
+            return []
+        return [f'{service}-{index}--{env_name.lower()}{DOMAIN}' for index in range(self.hosts_per_service)]
+
+    def host_variables(self, host: str, variables: list) -> dict:
+        env_name, index = host.split('--')[1][:-len(DOMAIN)], stable_hash(host)
+        values = {
+            'ENV.CLEANNAME': SHARED_ENV if env_name == SHARED_ENV.lower() else env_name.upper(),
+            'SERVER_FQDN': host,
+            'Server.location': LOCATIONS[index % len(LOCATIONS)],
+            'ENV.POD': f'0{index % 3 + 1}',
+        }
+        return {variable: values.get(variable) or self.default_value(variable, index) for variable in variables}
+
+    @staticmethod
+    def default_value(variable: str, index: int) -> str:
+        if variable.endswith('_PORT'):
+            return str(8000 + index % 100)
+        if variable.endswith('.group') or variable.startswith('GEN.'):
+            return str(index % 4 + 1)
+        return f'{variable.lower()}-value'
+
+    def to_dict(self, envs: list, catalog: dict) -> dict:
+        """Dataset of envs and the shared env with hosts of catalog services and their variables"""
+        variables = sorted(get_required_variables(catalog) + ['SERVER_FQDN'])
+        data = {'envs': dict(), 'hosts': dict()}
+        for env_name in envs + [SHARED_ENV]:
+            info = self.env_info(env_name)
+            info['services'] = {service: hosts for service in catalog
+                                if (hosts := self.service_hosts(env_name, service))}
+            data['envs'][env_name.lower()] = info
+            for hosts in info['services'].values():
+                for host in hosts:
+                    data['hosts'][host] = self.host_variables(host, variables)
+        return data
+
+
+class StaticEnvDataset(object):
+    """Dataset stored by EnvDataset.to_dict, same interface as EnvDataset"""
+    def __init__(self, data: dict) -> None:
+        self.data = data
+
+    @classmethod
+    def from_file(cls, file: str) -> 'StaticEnvDataset':
+        with open(file) as f:
+            return cls(json.load(f))
+
+    def env_info(self, env_name: str) -> dict:
+        info = self.data['envs'][env_name.lower()]
+        # JSON keys are strings, ADS returns pops by number
+        return {**info, 'pops': {int(pop): value for pop, value in info['pops'].items()}}
+
+    def service_hosts(self, env_name: str, service: str) -> list:
+        return self.data['envs'].get(env_name.lower(), {}).get('services', {}).get(service, [])
+
+    def host_variables(self, host: str, variables: list) -> dict:
+        values = self.data['hosts'].get(host, {})
+        return {variable: values[variable] for variable in variables if variable in values}
+
+
+def generate(services: int = 1000, output: str = 'services.json', placeholder_density: float = 0.3,
+             group_size: int = 1, shared_by_env: float = 0.0, shared_by_location: float = 0.0,
+             extra_variables: int = 0, seed: int = 0, envs: int = 0, dataset: str = '',
+             hosts_per_service: int = 2, presence: float = 0.8) -> None:
+    """
+    Write schema-valid catalog and, if envs and dataset are set, matching dataset of envs and host variables.
+    Catalog options are described in make_catalog.
+
+    :param envs: Number of envs in dataset, lab-bench-000 and so on, the shared env is added.
+    :param dataset: Dataset file, can be used in benchmarks with --dataset.
+    :param presence: Share of services with hosts on env, the rest are looked up on the shared env.
+    """
+    catalog = make_catalog(services, placeholder_density, group_size, shared_by_env, shared_by_location,
+                           extra_variables, seed)
+    validate_catalog(catalog)
+    with open(output, 'w') as f:
+        json.dump(catalog, f, indent=4)
+    print(f"Catalog: {output}, {services} services, {len(get_required_variables(catalog))} variables")
+    if envs and dataset:
+        data = EnvDataset(hosts_per_service, presence).to_dict(env_names(envs), catalog)
+        with open(dataset, 'w') as f:
+            json.dump(data, f)
+        print(f"Dataset: {dataset}, {envs} envs, {len(data['hosts'])} hosts")
+
+
+def main() -> None:
+    fire.Fire(generate)
+
+
+if __name__ == "__main__":
+    main()
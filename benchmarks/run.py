@@ -0,0 +1,285 @@
+"""
+Benchmarks against local fakes of SCT and ADS, results are stored and compared with baseline.
+
+    python -m benchmarks.run --scale=medium
+    python -m benchmarks.run --scale=medium --save_baseline
+    python -m benchmarks.run --scale=medium --baseline=benchmarks/results/baseline-medium.json --threshold=0.2
+    python -m benchmarks.run --scale=medium --catalog=services-5k.json --dataset=envs-20.json
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from time import perf_counter
+from unittest import mock
+
+import fire
+
+from benchmarks.fakes import FakeWorld
+from benchmarks.generator import EnvDataset, StaticEnvDataset, SHARED_ENV, env_names, make_catalog
+from libs.cache import MemoryCache
+from libs.core import RolloutSession, SCTManager, diff_fleet, filter_services
+from libs.helper import load_json
+from libs.parser import NewConfigParser, SchemesTemplate, parse_deployment_schemes
+
+
+SCALES = {
+    'small': {'services': 10, 'envs': 1},
+    'medium': {'services': 1000, 'envs': 50},
+    'large': {'services': 10000, 'envs': 500},
+}
+# services per env in fleet case, keeps 500 envs case within minutes
+FLEET_SERVICES = 100
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SCHEMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'conf', 'deployment_schemes.json')
+
+
+@contextmanager
+def fake_upstreams(world: FakeWorld):
+    """Replace SCT and ADS clients used by SCTManager with fakes"""
+    with mock.patch('libs.core.ENV', world.env), mock.patch('libs.core.ADS', world.ads), \
+            mock.patch('libs.core.SCT', world.sct):
+        yield
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """Run func(*setup()) repeat times, setup is not measured"""
+    durations = list()
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = perf_counter()
+        func(*args)
+        durations.append(perf_counter() - start)
+    return {'median': statistics.median(durations), 'min': min(durations), 'repeat': repeat}
+
+
+def bench_filter_services(catalog: dict, envs: list, world: FakeWorld, repeat: int) -> tuple:
+    services = list(catalog)
+    env_services = {service: [] for service in services[::2]}
+    only = ','.join(services[::10])
+    exclude = ','.join(services[1::10])
+
+    def _run():
+        filter_services(env_services, only, '', '', force=True, all_services=catalog)
+        filter_services(env_services, '', services[0], '', force=False, all_services=catalog)
+        filter_services(env_services, '', '', exclude, force=True, all_services=catalog)
+    return measure(_run, repeat * 10), len(services)
+
+
+def bench_parser(catalog: dict, envs: list, world: FakeWorld, repeat: int) -> tuple:
+    session = RolloutSession(cache=MemoryCache(), services_config=catalog)
+    required_variables = session.required_variables
+    env_info = world.dataset.env_info(envs[0])
+    hosts_info = {
+        service: {host: world.dataset.host_variables(host, required_variables)
+                  for host in world.dataset.service_hosts(envs[0], service)}
+        for service in catalog
+    }
+
+    def _run():
+        for service, config_data in catalog.items():
+            try:
+                NewConfigParser(service=service, host_info=hosts_info[service],
+                                required_variables=required_variables, config_data=config_data,
+                                envname=env_info['name'], envname_shared=env_info['shared_env'],
+                                env_location=env_info['location']).get_config()
+            except ValueError:
+                pass
+    return measure(_run, repeat), len(catalog)
+
+
+def get_topology(env_info: dict) -> tuple:
+    """unique_pops, unique_server_locs and unique_pop_locs the way SCTManager.get_unique_pops_locations gets them"""
+    unique_pops = {pop: value['server_location'] for pop, value in env_info['pops'].items()}
+    return unique_pops, set(unique_pops.values()), {value['location'] for value in env_info['pops'].values()}
+
+
+def bench_schemes(catalog: dict, envs: list, world: FakeWorld, repeat: int) -> tuple:
+    """Parse of precompiled template without memoization"""
+    schemes_template = SchemesTemplate(load_json(SCHEMES_FILE))
+    count = 1000
+    topology = get_topology(world.dataset.env_info(envs[0]))
+
+    def _run():
+        for _ in range(count):
+            parse_deployment_schemes(*topology, schemes_template)
+    return measure(_run, repeat), count
+
+
+def bench_schemes_fleet(catalog: dict, envs: list, world: FakeWorld, repeat: int) -> tuple:
+    """Schemes of every env, memoized by topology, envs with the same POPs and locations share schemes"""
+    template = load_json(SCHEMES_FILE)
+    topologies = [get_topology(world.dataset.env_info(env_name)) for env_name in envs]
+
+    def _run(schemes_template):
+        for topology in topologies:
+            parse_deployment_schemes(*topology, schemes_template)
+    return measure(_run, repeat, setup=lambda: (SchemesTemplate(template, cache=MemoryCache(name='schemes')),)), \
+        len(envs)
+
+
+def bench_update_env(catalog: dict, envs: list, world: FakeWorld, repeat: int) -> tuple:
+    """Update of empty env, services are added"""
+    def _setup():
+        world.services.clear()
+        return RolloutSession(cache=MemoryCache(), services_config=catalog),
+
+    def _run(session):
+        sct_manager = SCTManager(envs[0], session=session)
+        services = filter_services(sct_manager.env_services, '', '', '', force=False, all_services=catalog)
+        sct_manager.update_services(services)
+
+    with fake_upstreams(world):
+        return measure(_run, repeat, setup=_setup), len(catalog)
+
+
+def bench_diff_env(catalog: dict, envs: list, world: FakeWorld, repeat: int) -> tuple:
+    """Diff of up to date env"""
+    with fake_upstreams(world):
+        world.services.clear()
+        session = RolloutSession(cache=MemoryCache(), services_config=catalog)
+        sct_manager = SCTManager(envs[0], session=session)
+        sct_manager.update_services(list(catalog))
+        world.calls.clear()
+
+        def _run(session):
+            sct_manager = SCTManager(envs[0], session=session)
+            sct_manager.diff_services(filter_services(sct_manager.env_services, '', '', '', force=True,
+                                                      all_services=catalog))
+        return measure(_run, repeat,
+                       setup=lambda: (RolloutSession(cache=MemoryCache(), services_config=catalog),)), len(catalog)
+
+
+def bench_diff_fleet(catalog: dict, envs: list, world: FakeWorld, repeat: int) -> tuple:
+    """Fleet diff of empty envs, FLEET_SERVICES services per env"""
+    fleet_catalog = dict(list(catalog.items())[:FLEET_SERVICES])
+    world.services.clear()
+    with fake_upstreams(world):
+        return measure(lambda session: diff_fleet(envs, session=session), repeat,
+                       setup=lambda: (RolloutSession(cache=MemoryCache(), services_config=fleet_catalog),)
+                       ), len(envs) * len(fleet_catalog)
+
+
+CASES = {
+    'filter_services': bench_filter_services,
+    'parser': bench_parser,
+    'schemes': bench_schemes,
+    'schemes_fleet': bench_schemes_fleet,
+    'update_env': bench_update_env,
+    'diff_env': bench_diff_env,
+    'diff_fleet': bench_diff_fleet,
+}
+
+
+def run_benchmarks(scale: str = 'small', cases: str = '', repeat: int = 3, latency: float = 0,
+                   catalog: str = '', dataset: str = '') -> dict:
+    """
+    Run cases at scale, return report with median and min seconds per case.
+    Generated catalog and dataset files replace scale's services and envs.
+    """
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale {scale}, use one of: {', '.join(SCALES)}")
+    selected = [case for case in CASES if not cases or case in cases.split(',')]
+    services_config = load_json(catalog) if catalog else make_catalog(SCALES[scale]['services'])
+    if dataset:
+        env_dataset = StaticEnvDataset.from_file(dataset)
+        envs = [env for env in env_dataset.data['envs'] if env != SHARED_ENV.lower()][:SCALES[scale]['envs']]
+    else:
+        env_dataset, envs = EnvDataset(), env_names(SCALES[scale]['envs'])
+    world = FakeWorld(env_dataset, latency=latency)
+
+    results = dict()
+    for case in selected:
+        world.calls.clear()
+        result, items = CASES[case](services_config, envs, world, repeat)
+        result.update(items=items, per_item=result['median'] / items, upstream_calls_total=dict(world.calls))
+        results[case] = result
+        print(f"{case}: median {result['median']:.4f}s, min {result['min']:.4f}s, "
+              f"{result['per_item'] * 1e6:.1f}us per item, {items} items", file=sys.stderr)
+    meta = get_meta(scale, repeat, latency)
+    meta.update(services=len(services_config), envs=len(envs), catalog=catalog, dataset=dataset)
+    return {'meta': meta, 'results': results}
+
+
+def get_meta(scale: str, repeat: int, latency: float) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'scale': scale,
+        **SCALES[scale],
+        'repeat': repeat,
+        'latency': latency,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float = 0.2, metric: str = 'median') -> list:
+    """Cases where metric is worse than baseline by more than threshold share"""
+    regressions = list()
+    for case, result in report['results'].items():
+        base = baseline['results'].get(case)
+        if not base or not base.get(metric):
+            continue
+        ratio = result[metric] / base[metric]
+        if ratio > 1 + threshold:
+            regressions.append({'case': case, 'baseline': base[metric], 'current': result[metric],
+                                'ratio': round(ratio, 3)})
+    return regressions
+
+
+def save_report(report: dict, file: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+    with open(file, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def benchmark(scale: str = 'small', cases: str = '', repeat: int = 3, latency: float = 0, output: str = '',
+              baseline: str = '', threshold: float = 0.2, save_baseline: bool = False, catalog: str = '',
+              dataset: str = '') -> None:
+    """
+    Run benchmarks, store report and fail if any case is slower than baseline.
+
+    :param scale: small (10 services, 1 env), medium (1k, 50) or large (10k, 500).
+    :param cases: Comma separated cases, all if not set.
+    :param latency: Seconds every fake SCT and ADS call sleeps.
+    :param output: Report file, benchmarks/results/<scale>-<time>.json if not set.
+    :param baseline: Report to compare with.
+    :param threshold: Allowed slowdown share of median time, 0.2 - 20%.
+    :param save_baseline: Store report as benchmarks/results/baseline-<scale>.json.
+    :param catalog: services.json written by benchmarks.generator, instead of scale's catalog.
+    :param dataset: Envs dataset written by benchmarks.generator, scale limits the number of envs.
+    """
+    report = run_benchmarks(scale, cases, repeat, latency, catalog, dataset)
+    output = output or os.path.join(RESULTS_DIR, f"{scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    save_report(report, output)
+    print(f"Report: {output}", file=sys.stderr)
+    if save_baseline:
+        save_report(report, os.path.join(RESULTS_DIR, f'baseline-{scale}.json'))
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(report, json.load(f), threshold)
+        for item in regressions:
+            print(f"Regression: {item['case']} {item['baseline']:.4f}s -> {item['current']:.4f}s "
+                  f"(x{item['ratio']})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+def main() -> None:
+    fire.Fire(benchmark)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,114 @@
 """CLI"""
 
 import concurrent.futures
+from contextlib import nullcontext
 import fire
 import json
 import sys
 
-from rich import print as rprint
-from rich.progress import track
-from rich.table import Table
-
-from libs.core import SCTManager, filter_services
-import api_libs.gitup as gitup
-from libs.helper import get_ff
+from libs.accounting import accounting
+from libs.core import RolloutSession, SCTManager, diff_fleet, filter_services, get_environments_list
+from libs.helper import arg_to_list, get_ff, read_stamp, write_stamp
+from libs.output import get_writer, stdout_reserved, NDJSONWriter
+from libs.timing import Timings
+from libs.tracing import in_current_context, span
 from api_libs.logger import Logger, log
 
 
 logger = Logger()
 
 
+def can_print() -> bool:
+    return get_ff('FRIENDLY_PRINT') and get_ff('LOG_LEVEL') in ['ERROR', 'CRITICAL'] and not stdout_reserved()
+
+
 def pp(s='') -> None:
-    """Use rich pretty print"""
-    if get_ff('FRIENDLY_PRINT') and get_ff('LOG_LEVEL') in ['ERROR', 'CRITICAL']:
+    """Use rich pretty print, rich is imported only when something is printed"""
+    if can_print():
+        from rich import print as rprint
         rprint(s)
 
 
+def pp_table(title: str, columns: list, rows: list) -> None:
+    """Print rich table, columns are (name, column options) pairs"""
+    if not can_print():
+        return
+    from rich.table import Table
+    table = Table(title=title)
+    for name, options in columns:
+        table.add_column(name, **options)
+    for row in rows:
+        table.add_row(*row)
+    pp(table)
+
+
+def track(sequence, disable: bool = False):
+    """rich progress bar, imported only if enabled"""
+    if disable:
+        return sequence
+    from rich.progress import track as rich_track
+    return rich_track(sequence)
+
+
+def check_git_update() -> None:
+    """Check script latest version in Git at most once per GIT_UPDATE_TTL seconds"""
+    ttl = get_ff('GIT_UPDATE_TTL', 3600)
+    if ttl and read_stamp('git-update-checked', max_age=ttl) is not None:
+        return
+    import api_libs.gitup as gitup
+    gitup.check()
+    write_stamp('git-update-checked')
+
+
 def check_args(env_name) -> None:
     if not (isinstance(env_name, str)):
         raise ValueError("Incorrect arguments")
 
 
 def print_diff_table(add: list, recreate: list, skip: list, fail: list) -> None:
-    table = Table(title="Changes summary")
-    table.add_column("Change", style="cyan", no_wrap=True)
-    table.add_column("Service")
-    if add:
-        table.add_row("Add", ", ".join(add))
-        logger.log.info(f"Add: {add}")
-    if recreate:
-        table.add_row("Recreate", ", ".join(recreate))
-        logger.log.info(f"Recreate: {recreate}")
-    if fail:
-        table.add_row("Fail", ", ".join(fail))
-        logger.log.info(f"Fail: {fail}")
-    if skip:
-        table.add_row("Skip", ", ".join(skip))
-        logger.log.info(f"Skip: {skip}")
-    pp(table)
+    rows = list()
+    for change, services in (("Add", add), ("Recreate", recreate), ("Fail", fail), ("Skip", skip)):
+        if services:
+            rows.append((change, ", ".join(services)))
+            logger.log.info(f"{change}: {services}")
+    pp_table("Changes summary", [("Change", {'style': "cyan", 'no_wrap': True}), ("Service", {})], rows)
+
+
+def print_fleet_table(result: dict) -> None:
+    rows = [(env_name, ", ".join(changes['add']), ", ".join(changes['recreate']), ", ".join(changes['fail']))
+            for env_name, changes in sorted(result['envs'].items())
+            if changes['add'] or changes['recreate'] or changes['fail']]
+    rows.extend((env_name, "", "", f"[red3]{error}") for env_name, error in sorted(result['failed_envs'].items()))
+    logger.log.info(f"Fleet changes: {result['services']}, failed envs: {list(result['failed_envs'])}")
+    pp_table("Fleet changes summary",
+             [("Env", {'style': "cyan", 'no_wrap': True}), ("Add", {}), ("Recreate", {}), ("Fail", {})], rows)
+
+
+def print_timings_table(timings: dict) -> None:
+    logger.log.info(f"Timings: {timings}")
+    pp_table("Timings, seconds", [("Stage", {'style': "cyan", 'no_wrap': True}), ("Duration", {'justify': "right"})],
+             [(stage, f"{seconds:.3f}") for stage, seconds in timings.items()])
+
+
+def print_calls_table(report: dict) -> None:
+    rows = [(endpoint, str(item['calls']), str(item['unique']), str(item['duplicates']))
+            for endpoint, item in report['endpoints'].items()]
+    rows.extend((f"[gold1]{item['endpoint']}({item['args']})", str(item['count']), "", "")
+                for item in report['top_duplicates'])
+    logger.log.info(f"Upstream calls: {report}")
+    pp_table(f"Upstream calls: {report['total']}, duplicates: {report['duplicates']}",
+             [("Endpoint", {'style': "cyan", 'no_wrap': True}), ("Calls", {'justify': "right"}),
+              ("Unique", {'justify': "right"}), ("Duplicates", {'justify': "right"})], rows)
+
+
+def print_batch_table(result: dict) -> None:
+    rows = [(str(record['index']), record['command'], record['env'],
+             "[green4]ok" if record['status'] else f"[red3]{record['error'] or 'failed'}", f"{record['duration']:.1f}")
+            for record in result['operations']]
+    logger.log.info(f"Batch completed, operations: {result['total']}, failed: {result['failed']}")
+    pp_table(f"Batch operations: {result['total']}, failed: {len(result['failed'])}",
+             [("#", {'justify': "right"}), ("Command", {'style': "cyan"}), ("Env", {'no_wrap': True}),
+              ("Status", {}), ("Seconds", {'justify': "right"})], rows)
 
 
 class CLI(object):
@@ -54,8 +117,13 @@ class CLI(object):
 
     Run 'happysct.py COMMAND --help' for more information on a command.
     """
+    def __init__(self, writer: NDJSONWriter | None = None, session: RolloutSession | None = None) -> None:
+        self._writer = writer
+        self._session = session
+
     @log(logger)
-    def update(self, env_name: str, only='', group='', exclude='', force=False, schemes=False) -> None:
+    def update(self, env_name: str, only='', group='', exclude='', force=False, schemes=False,
+               output='', output_file='', timings=False, calls=False) -> None:
         """
         Add or recreate services and deployment schemes configuration in environment.
 
@@ -66,40 +134,75 @@ class CLI(object):
             exclude: Specify services to exclude from the update.
             force: If True, adds new services and recreates existing ones.
             schemes: If True, also updates deployment schemes.
+            output: Results output format, 'ndjson' streams one json object per service and env.
+            output_file: Write ndjson output to this file instead of stdout.
+            timings: If True, shows stages durations: env init, host lookup, ADS variables, parsing, diff, SCT writes.
+            calls: If True, shows SCT and ADS calls by endpoint and repeated calls with the same arguments.
         """
         check_args(env_name)
-        sct_manager = SCTManager(env_name)
+        writer = self._writer or get_writer(output, output_file)
+        try:
+            with accounting(calls) as calls_accounting:
+                try:
+                    self._update(env_name, only, group, exclude, force, schemes, writer, timings)
+                finally:
+                    if calls_accounting:
+                        report = calls_accounting.report()
+                        print_calls_table(report)
+                        if writer:
+                            writer.write({'type': 'calls', 'env': env_name, **report})
+        finally:
+            if writer and writer is not self._writer:
+                writer.close()
+
+    def _update(self, env_name: str, only, group, exclude, force, schemes, writer: NDJSONWriter | None,
+                timings=False) -> None:
+        sct_manager = SCTManager(env_name, session=self._session)
+        env_timings = Timings()
         if schemes:
             pp("\nProcessing schemes...")
             result = sct_manager.update_deployment_schemes()
+            if writer:
+                writer.write({'type': 'schemes', 'env': env_name, **result})
             if not result.get("status", False):
                 raise RuntimeError("Unable to update deployment schemes")
             pp(f"\nSchemes updated: {result.get('message', [])}")
 
-        if services_to_process := filter_services(sct_manager.env_services, only, group, exclude, force):
+        failed, skipped, added, recreated = list(), list(), list(), list()
+        if services_to_process := filter_services(sct_manager.env_services, only, group, exclude, force,
+                                                  all_services=sct_manager.session.services_config):
             pp(f"\nServices to process: {services_to_process}\n")
-            failed, skipped, added, recreated = list(), list(), list(), list()
 
-            for service in track(services_to_process, disable=not (get_ff("PROGRESS_BAR"))):
-                update_result = sct_manager.update(service=service, force=force)
+            for service in track(services_to_process, disable=not (get_ff("PROGRESS_BAR")) or stdout_reserved()):
+                update_result = sct_manager.update(service=service, force=force, timings=timings)
+                env_timings.merge(update_result.get('timings', {}))
+                state = None
                 if not update_result.get("status", False) and 'not present' in update_result.get('message', ''):
                     skipped.append(service)
+                    state = "skipped"
                     pp(f"[bright_blue]{service}[/] - "
                        f"{update_result.get('message', None)}, [gold1]skipped")
                 elif not update_result.get("status", False):
                     failed.append(service)
+                    state = "failed"
                     pp(f"[bright_blue]{service}[/] - "
                        f"{update_result.get('message', None)}, [red3]failed")
                 elif update_result.get("status", True) and not update_result.get("updated", False):
                     skipped.append(service)
+                    state = "skipped"
                     pp(f"[bright_blue]{service}[/] - "
                        f"{update_result.get('message', None)}, [green4]skipped")
                 elif update_result.get("old_deleted", False):
                     recreated.append(service)
+                    state = "recreated"
                     pp(f"[bright_blue]{service}[/] - [green4]recreated")
                 elif update_result.get("updated", True):
                     added.append(service)
+                    state = "added"
                     pp(f"[bright_blue]{service}[/] - [green4]added")
+                if writer:
+                    writer.write({'type': 'service', 'env': env_name, 'service': service,
+                                  'state': state, **update_result})
 
             failed.sort(), skipped.sort(), added.sort(), recreated.sort()
 
@@ -107,24 +210,54 @@ class CLI(object):
                             f"added: {added}, recreated: {recreated}")
             pp(f"\nCompleted. Services failed: {failed}, skipped: {skipped}, "
                f"added: {added}, recreated: {recreated}")
-            if failed:
-                raise RuntimeError("Some services failed")
         else:
             pp("\nNo services to process.\n")
 
+        env_record = {'type': 'env', 'env': env_name, 'status': not failed, 'failed': failed,
+                      'skipped': skipped, 'added': added, 'recreated': recreated}
+        if timings:
+            env_record['timings'] = {**sct_manager.take_init_timings(), **env_timings.to_dict()}
+            print_timings_table(env_record['timings'])
+        if writer:
+            writer.write(env_record)
+        if failed:
+            raise RuntimeError("Some services failed")
+
+    def _get_session(self, snapshot: str = '') -> RolloutSession | None:
+        if snapshot:
+            from libs.snapshot import SnapshotSession
+            return SnapshotSession.from_file(snapshot)
+        return self._session
+
     @log(logger)
-    def diff(self, env_name: str, only='', group='', exclude='') -> None:
+    def diff(self, env_name: str, only='', group='', exclude='', timings=False, calls=False, snapshot='') -> None:
         """
         Show service difference between current config on env and new generated one.
+
+        Args:
+            timings: If True, shows stages durations: env init, host lookup, ADS variables, parsing, diff.
+            calls: If True, shows SCT and ADS calls by endpoint and repeated calls with the same arguments.
+            snapshot: Diff offline against env snapshot file made by export, instead of live SCT and ADS.
         """
         check_args(env_name)
-        sct_manager = SCTManager(env_name)
-        services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=True)
+        with accounting(calls) as calls_accounting:
+            try:
+                self._diff(env_name, only, group, exclude, timings, session=self._get_session(snapshot))
+            finally:
+                if calls_accounting:
+                    print_calls_table(calls_accounting.report())
+
+    def _diff(self, env_name: str, only, group, exclude, timings=False, session: RolloutSession | None = None) -> None:
+        sct_manager = SCTManager(env_name, session=session or self._session)
+        env_timings = Timings()
+        services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=True,
+                                              all_services=sct_manager.session.services_config)
         fail, skip, add, recreate = list(), list(), list(), list()
         pp("Changes - current / new\n")
 
         def _process_service(service):
-            diff_result = sct_manager.get_diff(service=service)
+            diff_result = sct_manager.get_diff(service=service, timings=timings)
+            env_timings.merge(diff_result.get('timings', {}))
             if not diff_result.get("status", False) and 'not present' in diff_result.get('message', ''):
                 skip.append(service)
                 pp(f"[bright_blue]{service}[/] - {diff_result.get('message', None)}, skipped")
@@ -147,9 +280,10 @@ class CLI(object):
                    f"\n{json.dumps(diff_result.get('config_diff', {}), indent=4)}")
                 recreate.append(service)
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            for service in services_to_process:
-                executor.submit(_process_service, service)
+        with env_timings.stage('services_wall'):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+                for service in services_to_process:
+                    executor.submit(in_current_context(_process_service), service)
 
         add.sort(), recreate.sort(), skip.sort(), fail.sort()
         pp()
@@ -158,26 +292,204 @@ class CLI(object):
         else:
             pp("No changes.")
             logger.log.info(f"No changes. Skip: {skip}")
+        if timings:
+            print_timings_table({**sct_manager.take_init_timings(), **env_timings.to_dict()})
 
     @log(logger)
-    def show(self, env_name: str, only='', group='', exclude='') -> None:
+    def diff_fleet(self, envs='', envs_file='', only='', group='', exclude='', workers=4,
+                   output='', output_file='', calls=False) -> None:
+        """
+        Show services difference for many envs at once, as changes matrix by env and service.
+
+        Args:
+            envs: Envs to diff, all Lab envs from ENVS_URL if neither envs nor envs_file is set.
+            envs_file: File with envs to diff, one env per line.
+            only: Specify services to include.
+            group: Specify group of services to include by source service.
+            exclude: Specify services to exclude.
+            workers: Number of envs processed at the same time.
+            output: Results output format, 'ndjson' streams one json object per env.
+            output_file: Write ndjson output to this file instead of stdout.
+            calls: If True, shows SCT and ADS calls by endpoint and repeated calls with the same arguments.
+        """
+        env_list = arg_to_list(envs) if envs else get_environments_list(file=envs_file or None)
+        writer = self._writer or get_writer(output, output_file)
+        pp(f"Envs to process: {len(env_list)}\n")
+
+        def _on_env(env_name, env_changes):
+            if writer:
+                writer.write({'type': 'env', 'env': env_name, **env_changes})
+
+        try:
+            with accounting(calls) as calls_accounting:
+                result = diff_fleet(env_list, only, group, exclude, max_workers=workers,
+                                    session=self._session, on_env=_on_env)
+            if calls_accounting:
+                report = calls_accounting.report()
+                print_calls_table(report)
+                if writer:
+                    writer.write({'type': 'calls', **report})
+        finally:
+            if writer and writer is not self._writer:
+                writer.close()
+
+        if any(changes['add'] or changes['recreate'] or changes['fail'] for changes in result['envs'].values()) \
+                or result['failed_envs']:
+            print_fleet_table(result)
+        else:
+            pp("No changes.")
+            logger.log.info(f"No changes in {len(env_list)} envs.")
+
+    @log(logger)
+    def show(self, env_name: str, only='', group='', exclude='', snapshot='') -> None:
         """
         Show service current config on env.
+
+        Args:
+            snapshot: Show offline from env snapshot file made by export, instead of live SCT.
         """
         check_args(env_name)
-        sct_manager = SCTManager(env_name)
-        services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=None)
+        sct_manager = SCTManager(env_name, session=self._get_session(snapshot))
+        services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=None,
+                                              all_services=sct_manager.session.services_config)
         for service in services_to_process:
             pp(f"[bright_blue]{service}[/]")
             pp(sct_manager.get_current(service))
 
+    @log(logger)
+    def export(self, env_name: str, file='', variables='') -> None:
+        """
+        Save env snapshot for offline diff and show: current services, env metadata, pod hosts and host variables.
+
+        Args:
+            env_name: Name of the environment.
+            file: Snapshot file, <env-name>.snapshot.json.gz by default.
+            variables: ADS variables to save on top of the ones services catalog requires,
+                e.g. new variables of catalog change. Variables missing in snapshot resolve to empty string.
+        """
+        from libs.snapshot import export_env, get_snapshot_file, save_snapshot
+        check_args(env_name)
+        snapshot = export_env(env_name, session=self._session, variables=arg_to_list(variables) if variables else [])
+        file = file or get_snapshot_file(env_name)
+        save_snapshot(snapshot, file)
+        hosts = sum(len(by_pod) for by_pod in snapshot['hosts'].values())
+        logger.log.info(f"Snapshot saved to {file}")
+        pp(f"Snapshot saved to {file}: services: {len(snapshot['services'])}, pods with hosts: {hosts}, "
+           f"hosts: {len(snapshot['variables'])}")
+
+    @log(logger)
+    def batch(self, file: str, workers=4, output='', output_file='', calls=False) -> None:
+        """
+        Run many update, diff and show operations from YAML or JSON file in one process.
+        Catalog, SCT session, ADS client and caches are shared by all operations.
+
+        Args:
+            file: Operations file, list of {command, env, only, group, exclude, force, schemes, timings}
+                or dict with 'operations' list and 'defaults' for all of them, env can be a list of envs.
+            workers: Number of envs processed at the same time, operations of one env run in file order.
+            output: Results output format, 'ndjson' streams one json object per operation and batch summary.
+            output_file: Write ndjson output to this file instead of stdout.
+            calls: If True, shows SCT and ADS calls by endpoint and repeated calls with the same arguments.
+        """
+        from libs.batch import load_operations, run_batch
+        operations = load_operations(file)
+        writer = self._writer or get_writer(output, output_file)
+        pp(f"Operations to run: {len(operations)}\n")
+
+        def _on_operation(record):
+            if writer:
+                writer.write({'type': 'operation', **record})
+
+        try:
+            with accounting(calls) as calls_accounting:
+                result = run_batch(operations, max_workers=workers, session=self._session or RolloutSession(),
+                                   on_operation=_on_operation)
+            if writer:
+                writer.write({'type': 'batch', 'status': result['status'], 'total': result['total'],
+                              'failed': result['failed']})
+            if calls_accounting:
+                report = calls_accounting.report()
+                print_calls_table(report)
+                if writer:
+                    writer.write({'type': 'calls', **report})
+        finally:
+            if writer and writer is not self._writer:
+                writer.close()
+
+        print_batch_table(result)
+        if result['failed']:
+            raise RuntimeError("Some operations failed")
+
+    @log(logger)
+    def reconcile(self, envs='', envs_file='', only='', group='', exclude='', add_only=False, interval=None,
+                  workers=None, once=False, output='', output_file='') -> None:
+        """
+        Keep envs in sync with services catalog: diff every env once per interval and update only drifted services.
+        Envs are spread over the interval with jitter, failed envs are retried with exponential backoff.
+        Runs until interrupted.
+
+        Args:
+            envs: Envs to reconcile, all Lab envs from ENVS_URL if neither envs nor envs_file is set.
+            envs_file: File with envs to reconcile, one env per line, re-read every interval.
+            only: Specify services to include.
+            group: Specify group of services to include by source service.
+            exclude: Specify services to exclude.
+            add_only: If True, only missing services are added, changed services are reported but not recreated.
+            interval: Seconds between reconciles of the same env, RECONCILE_INTERVAL by default.
+            workers: Number of envs reconciled at the same time, RECONCILE_WORKERS by default.
+            once: If True, reconciles all envs once right away and exits, non-zero if any env failed.
+            output: Results output format, 'ndjson' streams one json object per reconciled env.
+            output_file: Write ndjson output to this file instead of stdout.
+        """
+        from libs.reconcile import Reconciler, reconcile_env
+        session = self._session or RolloutSession()
+        writer = self._writer or get_writer(output, output_file)
+
+        def _envs():
+            return arg_to_list(envs) if envs else get_environments_list(file=envs_file or None)
+
+        def _reconcile(env_name):
+            return reconcile_env(SCTManager(env_name, session=session), only, group, exclude, add_only)
+
+        def _on_env(env_name, result, error):
+            if error:
+                pp(f"[bright_blue]{env_name}[/] - [red3]{error}")
+            elif result['applied']:
+                pp(f"[bright_blue]{env_name}[/] - [green4]applied: {', '.join(result['applied'])}")
+            if writer:
+                writer.write({'type': 'reconcile', 'env': env_name, 'status': not error, 'error': error,
+                              **(result or {})})
+
+        reconciler = Reconciler(_reconcile, _envs, interval=interval or get_ff('RECONCILE_INTERVAL', 600),
+                                jitter=get_ff('RECONCILE_JITTER', 0.1),
+                                max_backoff=get_ff('RECONCILE_MAX_BACKOFF', 21600),
+                                max_workers=workers or get_ff('RECONCILE_WORKERS', 4), on_env=_on_env)
+        try:
+            if once:
+                stats = reconciler.run_once()
+                if stats['failures']:
+                    raise RuntimeError(f"Some envs failed: {sorted(stats['backing_off'])}")
+            else:
+                pp(f"Reconciling every {reconciler.interval}s, Ctrl+C to stop\n")
+                reconciler.run_forever()
+        finally:
+            if writer and writer is not self._writer:
+                writer.close()
+
 
 def main() -> None:
     try:
-        if get_ff('GIT_UPDATE'):
-            gitup.check()
-        cli = CLI()
-        fire.Fire(cli)
+        # --profile works with any command, see libs/profiler.py, cProfile is imported only if it's requested
+        args, profiling = sys.argv[1:], nullcontext()
+        if any(arg.startswith('--profile') for arg in args):
+            from libs.profiler import pop_profile_args, profiled
+            args, profile_options = pop_profile_args(args)
+            profiling = profiled(profile_options)
+        with profiling, span(f"happysct {args[0] if args else ''}".strip()):
+            if get_ff('GIT_UPDATE'):
+                check_git_update()
+            cli = CLI()
+            fire.Fire(cli, command=args)
     except Exception as error:
         logger.log.exception(f'Exception: {error}')
         sys.exit(1)
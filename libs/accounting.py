@@ -0,0 +1,89 @@
+"""Per-run accounting of SCT and ADS calls by endpoint and arguments, to find redundant requests"""
+
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+import functools
+import hashlib
+import json
+import threading
+
+
+class CallAccounting(object):
+    """
+    Upstream calls of one run: CLI command, rollout or API request.
+    Calls with the same endpoint and arguments after the first one are duplicates.
+    """
+    def __init__(self) -> None:
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, *args) -> None:
+        key = (endpoint, ', '.join(format_arg(arg) for arg in args))
+        with self._lock:
+            self.calls[key] += 1
+
+    def report(self, top: int = 20) -> dict:
+        """Totals, counts by endpoint and top repeated calls"""
+        with self._lock:
+            calls = Counter(self.calls)
+        endpoints = dict()
+        for (endpoint, _), count in sorted(calls.items()):
+            item = endpoints.setdefault(endpoint, {'calls': 0, 'unique': 0, 'duplicates': 0})
+            item['calls'] += count
+            item['unique'] += 1
+            item['duplicates'] += count - 1
+        total = sum(calls.values())
+        return {
+            'total': total,
+            'unique': len(calls),
+            'duplicates': total - len(calls),
+            'endpoints': endpoints,
+            'top_duplicates': [{'endpoint': endpoint, 'args': args, 'count': count}
+                               for (endpoint, args), count in calls.most_common(top) if count > 1],
+        }
+
+
+def format_arg(arg) -> str:
+    """Short stable form of call argument, lists and dicts like variables or configs are hashed"""
+    if isinstance(arg, (list, tuple, dict, set)):
+        data = json.dumps(sorted(arg) if isinstance(arg, set) else arg, sort_keys=True, default=str)
+        return f'{type(arg).__name__}[{len(arg)}]#{hashlib.sha1(data.encode()).hexdigest()[:8]}'
+    return str(arg)
+
+
+current_accounting = contextvars.ContextVar('current_accounting', default=None)
+
+
+@contextmanager
+def accounting(enabled: bool = True):
+    """Account upstream calls made in the block, worker threads included if bound with in_current_context"""
+    if not enabled:
+        yield None
+        return
+    item = CallAccounting()
+    token = current_accounting.set(item)
+    try:
+        yield item
+    finally:
+        current_accounting.reset(token)
+
+
+def account(endpoint: str, *args) -> None:
+    """Record upstream call in current run, no-op outside of accounting block"""
+    item = current_accounting.get()
+    if item is not None:
+        item.record(endpoint, *args)
+
+
+def accounted(endpoint: str):
+    """Decorator, record method calls with their arguments, self is skipped"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            item = current_accounting.get()
+            if item is not None:
+                item.record(endpoint, *args, *(f'{key}={format_arg(value)}' for key, value in kwargs.items()))
+            return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
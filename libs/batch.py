@@ -0,0 +1,172 @@
+"""Batch of update, diff and show operations on many envs, run in one process on shared session"""
+
+import concurrent.futures
+import json
+import os
+import threading
+from time import monotonic
+
+from api_libs.logger import Logger
+from libs.core import RolloutSession, SCTManager, filter_services, run_concurrently
+from libs.timing import Timings
+
+
+logger = Logger()
+
+# command: allowed options
+BATCH_COMMANDS = {
+    'update': ('only', 'group', 'exclude', 'force', 'schemes', 'timings'),
+    'diff': ('only', 'group', 'exclude', 'timings'),
+    'show': ('only', 'group', 'exclude'),
+}
+# flags must be real booleans, 'false' string would be truthy
+BATCH_FLAGS = ('force', 'schemes', 'timings')
+# services filters are comma separated names, lists are joined
+BATCH_FILTERS = ('only', 'group', 'exclude')
+
+
+def load_operations(file: str) -> list:
+    """
+    Read operations file, YAML or JSON. Either a list of operations or
+    a dict with 'operations' list and 'defaults' applied to every operation, e.g.
+
+        defaults: {only: ace}
+        operations:
+          - {command: update, env: lab-env1, force: true}
+          - {command: diff, env: [lab-env2, lab-env3]}
+    """
+    with open(file) as f:
+        if os.path.splitext(file)[1].lower() == '.json':
+            data = json.load(f)
+        else:
+            import yaml
+            data = yaml.safe_load(f)
+    return parse_operations(data)
+
+
+def parse_operations(data) -> list:
+    """Validate operations, apply defaults and expand operations with list of envs, one operation per env"""
+    defaults = dict()
+    if isinstance(data, dict):
+        defaults = data.get('defaults') or dict()
+        data = data.get('operations')
+    if not isinstance(data, list) or not isinstance(defaults, dict):
+        raise ValueError("Batch must be a list of operations or a dict with 'operations' list")
+    # defaults may carry options of any command, each operation takes only its own ones
+    unknown = set(defaults) - {'command', 'env'} - {option for options in BATCH_COMMANDS.values() for option in options}
+    if unknown:
+        raise ValueError(f"Defaults: unknown options {sorted(unknown)}")
+
+    operations = list()
+    for index, item in enumerate(data):
+        if not isinstance(item, dict):
+            raise ValueError(f"Operation {index}: must be a dict, got {item!r}")
+        command = item.get('command', defaults.get('command'))
+        if command not in BATCH_COMMANDS:
+            raise ValueError(f"Operation {index}: unknown command {command!r}, use one of {list(BATCH_COMMANDS)}")
+        unknown = set(item) - {'command', 'env'} - set(BATCH_COMMANDS[command])
+        if unknown:
+            raise ValueError(f"Operation {index}: unknown options {sorted(unknown)} for {command}")
+        item = {**defaults, **item}
+        envs = item.get('env')
+        envs = [envs] if isinstance(envs, str) else envs
+        if not envs or not isinstance(envs, list) or not all(isinstance(env, str) and env for env in envs):
+            raise ValueError(f"Operation {index}: 'env' must be env name or list of env names")
+        options = {option: item[option] for option in BATCH_COMMANDS[command] if option in item}
+        not_bool = sorted(flag for flag in BATCH_FLAGS if flag in options and not isinstance(options[flag], bool))
+        if not_bool:
+            raise ValueError(f"Operation {index}: {not_bool} must be true or false")
+        for option in BATCH_FILTERS:
+            value = options.get(option, '')
+            if isinstance(value, list) and all(isinstance(name, str) for name in value):
+                options[option] = ','.join(value)
+            elif not isinstance(value, str):
+                raise ValueError(f"Operation {index}: '{option}' must be service names, string or list")
+        operations.extend({'command': command, 'env': env, **options} for env in envs)
+    return operations
+
+
+def run_operation(sct_manager: SCTManager, operation: dict,
+                  executor: concurrent.futures.Executor | None = None) -> tuple:
+    """Run one operation on env manager, returns status and compact result, per-service details are dropped"""
+    command = operation['command']
+    # diff looks at every service like forced update, show only at current ones
+    force = {'update': bool(operation.get('force', False)), 'diff': True, 'show': None}[command]
+    services = filter_services(sct_manager.env_services, operation.get('only', ''), operation.get('group', ''),
+                               operation.get('exclude', ''), force,
+                               all_services=sct_manager.session.services_config)
+    timings = bool(operation.get('timings', False))
+
+    if command == 'show':
+        return True, {service: sct_manager.get_current(service) for service in services}
+
+    if command == 'diff':
+        diff_result = sct_manager.diff_services(services, executor=executor, timings=timings)
+        result = {state: sorted(diff_result[state]) for state in ('add', 'recreate', 'fail')}
+        result['skip'] = len(diff_result['skip'])
+        if timings:
+            result['timings'] = diff_result['timings']
+        return not result['fail'], result
+
+    result = dict()
+    if operation.get('schemes'):
+        result['schemes'] = sct_manager.update_deployment_schemes()
+        if not result['schemes'].get('status', False):
+            return False, result
+    refresh_timings = Timings()
+    try:
+        update_result = sct_manager.update_services(services, force=force, executor=executor, timings=timings)
+    finally:
+        # next operations on the env see services written by this one
+        if services:
+            sct_manager.refresh(timings=refresh_timings)
+    if timings:
+        update_result['timings'].update(refresh_timings.to_dict())
+    update_result.pop('by_service')
+    result.update(update_result)
+    return not update_result['failed'], result
+
+
+def run_batch(operations: list, max_workers: int = 4, session: RolloutSession | None = None,
+              manager_factory=None, executor: concurrent.futures.Executor | None = None,
+              on_operation=None) -> dict:
+    """
+    Run operations on shared session: catalog is read and validated, SCT logged in and ADS client built once.
+    Envs are processed concurrently by max_workers, operations of the same env run one by one in file order
+    on the same env manager, so diff after update sees its writes. Failed operation doesn't stop the rest.
+
+    :param manager_factory: Callable(env_name) returning SCTManager, new manager on shared session if not set.
+    :param executor: Executor for per-service work of every env.
+    :param on_operation: Callback(record), called as soon as operation is done.
+    """
+    session = session or RolloutSession()
+    manager_factory = manager_factory or (lambda env_name: SCTManager(env_name, session=session))
+    by_env = dict()
+    for index, operation in enumerate(operations):
+        by_env.setdefault(operation['env'], []).append((index, operation))
+    records = [None] * len(operations)
+    lock = threading.Lock()
+
+    def _run_env(env_name):
+        sct_manager = None
+        for index, operation in by_env[env_name]:
+            started = monotonic()
+            try:
+                if sct_manager is None:
+                    sct_manager = manager_factory(env_name)
+                status, result = run_operation(sct_manager, operation, executor=executor)
+                error = None
+            except Exception as exception:
+                logger.log.error(f"{env_name} - {operation['command']} exception: {exception}")
+                status, result, error = False, None, str(exception)
+            record = {'index': index, **operation, 'status': status, 'error': error,
+                      'duration': round(monotonic() - started, 3), 'result': result}
+            with lock:
+                records[index] = record
+            if on_operation:
+                on_operation(record)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as env_executor:
+        run_concurrently(_run_env, list(by_env), env_executor)
+    failed = [record['index'] for record in records if not record['status']]
+    return {'status': not failed, 'total': len(records), 'failed': failed, 'operations': records}
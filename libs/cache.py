@@ -0,0 +1,200 @@
+"""Key-value cache with TTL and size limit, in process memory or in SQLite file shared by workers"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from api_libs.logger import Logger
+from libs.helper import get_ff
+from libs.metrics import cache_lookup
+
+
+logger = Logger()
+
+CACHE_BACKENDS = ['memory', 'sqlite']
+
+
+class Cache(ABC):
+    """Cache interface: TTL, size limit and counters shared by the backends"""
+    def __init__(self, name: str = 'cache', ttl: int = 300, max_size: int = 4096) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def get(self, key: str):
+        """Cached value or None if missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: int | None = None) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def get_or_set(self, key: str, func, ttl: int | None = None):
+        """Cached value, or func() result cached if it's not None"""
+        value = self.get(key)
+        if value is None:
+            value = func()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / requests, 3) if requests else 0,
+            }
+
+
+class MemoryCache(Cache):
+    """
+    Thread-safe LRU cache of one process.
+    Values are returned as stored, callers must not change them.
+    """
+    def __init__(self, name: str = 'cache', ttl: int = 300, max_size: int = 4096) -> None:
+        super().__init__(name=name, ttl=ttl, max_size=max_size)
+        self._items = OrderedDict()
+
+    def get(self, key: str):
+        """Cached value or None if missing or expired"""
+        with self._lock:
+            item = self._items.get(key)
+            if item and item[0] > time.time():
+                self._items.move_to_end(key)
+                self.hits += 1
+                cache_lookup(self.name, hit=True)
+                return item[1]
+            if item:
+                del self._items[key]
+            self.misses += 1
+            cache_lookup(self.name, hit=False)
+            return None
+
+    def set(self, key: str, value, ttl: int | None = None) -> None:
+        with self._lock:
+            self._items[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._items)
+        return {'backend': 'memory', 'size': size, **super().stats()}
+
+
+class SQLiteCache(Cache):
+    """
+    Cache in SQLite file, shared by all worker processes on the node.
+    Put the file on tmpfs (e.g. /dev/shm) to keep it in shared memory.
+    Values must be JSON serializable. Hits and misses are counted per process.
+    """
+    def __init__(self, path: str, name: str = 'cache', ttl: int = 300, max_size: int = 4096) -> None:
+        super().__init__(name=name, ttl=ttl, max_size=max_size)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row and row[1] > now:
+                connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+            elif row:
+                connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        hit = bool(row) and row[1] > now
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        cache_lookup(self.name, hit=hit)
+        return json.loads(row[0]) if hit else None
+
+    def set(self, key: str, value, ttl: int | None = None) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                               (key, json.dumps(value), now + (self.ttl if ttl is None else ttl), now))
+            connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+            # least recently used items above max_size
+            evicted = connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.max_size,)
+            ).rowcount
+        if evicted > 0:
+            with self._lock:
+                self.evictions += evicted
+
+    def delete(self, key: str) -> None:
+        with self._connect() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self) -> None:
+        with self._connect() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def stats(self) -> dict:
+        with self._connect() as connection:
+            size = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        return {'backend': 'sqlite', 'size': size, **super().stats(), 'path': self.path}
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection of current thread, sqlite3 connections can't be shared by threads"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self._local.connection = connection
+        return connection
+
+
+def get_cache(name: str = 'cache', backend: str | None = None) -> Cache:
+    """Cache configured by CACHE_BACKEND, CACHE_PATH, CACHE_TTL and CACHE_MAX_SIZE settings"""
+    backend = backend or get_ff('CACHE_BACKEND', 'memory')
+    ttl = get_ff('CACHE_TTL', 300)
+    max_size = get_ff('CACHE_MAX_SIZE', 4096)
+    if backend not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown cache backend {backend}, use one of: {', '.join(CACHE_BACKENDS)}")
+    if backend == 'sqlite':
+        path = get_ff('CACHE_PATH', os.path.join('/dev/shm', 'happysct-cache.sqlite'))
+        try:
+            return SQLiteCache(path, name=name, ttl=ttl, max_size=max_size)
+        except sqlite3.Error as error:
+            logger.log.warning(f"Cache - can't use {path}, falling back to memory: {error}")
+    return MemoryCache(name=name, ttl=ttl, max_size=max_size)
@@ -1,20 +1,28 @@
 """Core module to glue everything together"""
 
+import concurrent.futures
+import hashlib
 import json
 import os
 import re
 import sys
+import threading
 
-from jsondiff import diff
-from jsonschema import validate, ValidationError
 import requests
 from retrying import retry
 
+from libs.accounting import account
 from libs.ads_wrapper import ENV, ADS
-from libs.helper import get_ff, load_json, retry_on_exceptions, arg_to_list
+from libs.cache import Cache, get_cache
+from libs.helper import (get_ff, load_json, retry_on_exceptions, arg_to_list, get_files_checksum, read_stamp,
+                         write_stamp)
+from libs.metrics import observe_operation, timed, UPSTREAM_LATENCY, UPSTREAM_ERRORS
 from api_libs.logger import Logger, log
-from libs.parser import NewConfigParser, adjust_current_config, parse_deployment_schemes
+from libs.parser import NewConfigParser, adjust_current_config, load_schemes_template, parse_deployment_schemes
+from libs.records import from_sct_services, same_config
 from libs.sct import SCT
+from libs.timing import Timings
+from libs.tracing import in_current_context, set_span_attributes, span, spanned
 
 
 logger = Logger()
@@ -28,21 +36,62 @@ def read_services_config(file_name: str = "services.json") -> dict:
                                     "..", "conf", "services_schema.json")
     try:
         services_config = load_json(services_file_path)
+        # services.json rarely changes, CLI runs validate it once per change
+        checksum = get_files_checksum(services_file_path, schema_file_path)
+        if read_stamp('services-validated') == checksum:
+            return services_config
         services_schema = load_json(schema_file_path)
-        validate(instance=services_config, schema=services_schema)
-        return services_config
     except json.JSONDecodeError as error:
         logger.log.exception(f'Invalid json exception: {error}')
         sys.exit(1)
+    from jsonschema import ValidationError
+    try:
+        validate(instance=services_config, schema=services_schema)
     except ValidationError as error:
         logger.log.exception(f'Validation services json by schema exception: {error}')
         sys.exit(1)
+    write_stamp('services-validated', checksum)
+    return services_config
+
+
+def validate(instance, schema) -> None:
+    """jsonschema.validate, jsonschema is imported on first use, its import is slower than most commands"""
+    from jsonschema import validate as validate_schema
+    validate_schema(instance=instance, schema=schema)
+
+
+def get_config_diff(current_config: list, new_config: list) -> dict:
+    """Symmetric jsondiff of configs, jsondiff is imported on first use"""
+    from jsondiff import diff
+    return diff(current_config, new_config, syntax='symmetric', marshal=True)
+
+
+def get_environments_list(file: str = None) -> list:
+    """Get Lab envs from file, one env per line, or from ENVS_URL without blacklisted ones"""
+    if file:
+        with open(file, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
 
+    r = requests.get(get_ff("ENVS_URL"))
+    r.raise_for_status()
+    lab_envs = r.json()
 
-def get_required_variables() -> list:
+    blacklist_envs_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            "..", "conf", "blacklist_envs.json")
+    blacklist_envs = load_json(blacklist_envs_file_path)
+
+    for group in blacklist_envs.get("GROUPS", []):
+        lab_envs.pop(group, None)
+
+    environments_list = [env for env_group in lab_envs for env in lab_envs[env_group] if
+                         env not in blacklist_envs.get("ENVS", [])]
+    return environments_list
+
+
+def get_required_variables(services_config: dict | None = None) -> list:
     """Get variables by parsing services json config"""
     variables = {"ENV.CLEANNAME"}
-    for serv in read_services_config().values():
+    for serv in (services_config or read_services_config()).values():
         for d in serv:
             variables.update({re.search(r'{([^}]*)}', value).group(1) for value in [
                 d["address"]["default"], d["port"], d["location"], d["physicalEnv"], d["group"]
@@ -51,9 +100,10 @@ def get_required_variables() -> list:
 
 
 @log(logger)
-def filter_services(env_services: dict, only, group, exclude, force: bool | None) -> list:
+def filter_services(env_services: dict, only, group, exclude, force: bool | None,
+                    all_services: dict | None = None) -> list:
     """Filter services to process"""
-    all_services = read_services_config()
+    all_services = all_services or read_services_config()
     logger.log.info(f"Force mode set to {force}")
     # show case
     if force is None:
@@ -86,34 +136,187 @@ def filter_services(env_services: dict, only, group, exclude, force: bool | None
     return filtered_services
 
 
+def get_update_state(update_result: dict) -> str:
+    """Get change kind of service update result: failed, skipped, recreated or added"""
+    if not update_result.get("status", False) and 'not present' in (update_result.get('message') or ''):
+        return 'skipped'
+    elif not update_result.get("status", False):
+        return 'failed'
+    elif not update_result.get("updated", False):
+        return 'skipped'
+    elif update_result.get("old_deleted", False):
+        return 'recreated'
+    return 'added'
+
+
+def get_diff_state(diff_result: dict, exists: bool) -> str:
+    """Get change kind of service diff result: fail, skip, add or recreate"""
+    if not diff_result.get("status", False) and 'not present' in (diff_result.get('message') or ''):
+        return 'skip'
+    elif not diff_result.get("status", False):
+        return 'fail'
+    elif not diff_result.get('config_diff', {}):
+        return 'skip'
+    elif not exists:
+        return 'add'
+    return 'recreate'
+
+
+def run_concurrently(func, items: list, executor: concurrent.futures.Executor | None = None) -> None:
+    """Run func for every item on executor or on own pool of 10 workers, wait for all of them"""
+    if executor is None:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as own_executor:
+            futures = [own_executor.submit(in_current_context(func), item) for item in items]
+    else:
+        futures = [executor.submit(in_current_context(func), item) for item in items]
+    for future in concurrent.futures.as_completed(futures):
+        future.result()
+
+
+class RolloutSession(object):
+    """
+    Long-lived pieces shared by SCTManager instances across envs:
+    services catalog, authenticated SCT session, ADS client, shared envs
+    and cache of env metadata and host variables.
+    Everything is created lazily on first use.
+    """
+    def __init__(self, cache: Cache | None = None, services_config: dict | None = None) -> None:
+        self._lock = threading.RLock()
+        self._cache = cache
+        self._services_config = services_config
+        self._required_variables = None
+        self._sct = None
+        self._ads = None
+        self._shared_envs = dict()
+
+    @property
+    def services_config(self) -> dict:
+        with self._lock:
+            if self._services_config is None:
+                self._services_config = read_services_config()
+            return self._services_config
+
+    @property
+    def required_variables(self) -> list:
+        with self._lock:
+            if self._required_variables is None:
+                self._required_variables = get_required_variables(self.services_config)
+            return self._required_variables
+
+    @property
+    def sct(self) -> SCT:
+        with self._lock:
+            if self._sct is None:
+                self._sct = SCT()
+            return self._sct
+
+    @property
+    def ads(self) -> ADS:
+        with self._lock:
+            if self._ads is None:
+                self._ads = ADS(user=get_ff("USER_NAME"), pwd=get_ff("USER_PASSWORD"), caching=False)
+            return self._ads
+
+    @property
+    def cache(self) -> Cache:
+        with self._lock:
+            if self._cache is None:
+                self._cache = get_cache('ads')
+            return self._cache
+
+    def get_env(self, name: str) -> ENV:
+        """Get local env from ADS, every SCTManager has its own"""
+        return ENV(name=name, user=get_ff("USER_NAME"), pwd=get_ff("USER_PASSWORD"), caching=False)
+
+    def get_shared_env(self, name: str) -> ENV:
+        """Get shared env, the same shared env serves many local envs"""
+        with self._lock:
+            if name not in self._shared_envs:
+                account('ads_env_lookup', name)
+                self._shared_envs[name] = ENV(name=name, user=get_ff("USER_NAME"),
+                                              pwd=get_ff("USER_PASSWORD"), caching=False)
+            return self._shared_envs[name]
+
+
 class SCTManager(object):
+    @spanned('SCTManager.__init__')
+    @observe_operation('env_init')
     @retry(stop_max_attempt_number=get_ff("RETRY_COUNT"), stop_max_delay=10000, wait_fixed=1000,
            retry_on_exception=retry_on_exceptions)
     @log(logger)
-    def __init__(self, env_name: str) -> None:
-        self.env_local = ENV(name=env_name, user=get_ff("USER_NAME"), pwd=get_ff("USER_PASSWORD"), caching=False)
-        self.env_id = str(self.env_local.id)
-        self.env_local_name = self.env_local.name.upper()
-        self.env_location = self.env_local.getlocation().lower()
-        self.shared_env_name = self.env_local.get_shared_env() or "AMS02-Shared-Resources"
-        self.env_shared = ENV(name=self.shared_env_name, user=get_ff("USER_NAME"),
-                              pwd=get_ff("USER_PASSWORD"), caching=False)
-        self.ads = ADS(user=get_ff("USER_NAME"), pwd=get_ff("USER_PASSWORD"), caching=False)
+    def __init__(self, env_name: str, session: RolloutSession | None = None) -> None:
+        set_span_attributes(env=env_name)
+        self.session = session or RolloutSession()
+        self.init_timings = Timings()
+        self._init_timings_taken = False
+        self.env_name = env_name
+        self._env_local = None
+        self._env_local_lock = threading.Lock()
+        with self.init_timings.stage('env_init'):
+            metadata = self.session.cache.get_or_set(f'env_metadata:{env_name}', self._get_env_metadata)
+            self.env_id = metadata['id']
+            self.env_local_name = metadata['name']
+            self.env_location = metadata['location']
+            self.shared_env_name = metadata['shared_env_name']
+            self.env_shared = self.session.get_shared_env(self.shared_env_name)
+        self.ads = self.session.ads
         logger.log.info((f"{self.env_local_name} - id: {self.env_id}, "
                          f"location: {self.env_location}, shared: {self.shared_env_name}"))
-        self.sct = SCT()
-        self.env_services = self.sct.get_services(envid=self.env_id)
+        with self.init_timings.stage('sct_login'):
+            self.sct = self.session.sct
+        with self.init_timings.stage('sct_get_services'):
+            self.env_services = from_sct_services(self.sct.get_services(envid=self.env_id))
+
+    @property
+    def env_local(self) -> ENV:
+        """ADS env, created on first use as env metadata may come from cache"""
+        with self._env_local_lock:
+            if self._env_local is None:
+                account('ads_env_lookup', self.env_name)
+                with timed(UPSTREAM_LATENCY, 'ads_env_lookup', UPSTREAM_ERRORS), span('ads_env_lookup'):
+                    self._env_local = self.session.get_env(self.env_name)
+            return self._env_local
+
+    def _get_env_metadata(self) -> dict:
+        return {
+            'id': str(self.env_local.id),
+            'name': self.env_local.name.upper(),
+            'location': self.env_local.getlocation().lower(),
+            'shared_env_name': self.env_local.get_shared_env() or "AMS02-Shared-Resources",
+        }
+
+    def take_init_timings(self) -> dict:
+        """
+        Init stages, returned to the first caller only: the operation which built the manager paid for them,
+        operations on manager reused from pool didn't
+        """
+        with self._env_local_lock:
+            taken, self._init_timings_taken = self._init_timings_taken, True
+        return dict() if taken else self.init_timings.to_dict()
+
+    @retry(stop_max_attempt_number=get_ff("RETRY_COUNT"), stop_max_delay=10000, wait_fixed=1000,
+           retry_on_exception=retry_on_exceptions)
+    @log(logger)
+    def refresh(self, timings: Timings | None = None) -> None:
+        """Reload current services config on env from SCT, timings - add 'sct_refresh' stage to them"""
+        with (timings or Timings()).stage('sct_refresh'):
+            self.env_services = from_sct_services(self.sct.get_services(envid=self.env_id))
 
+    @spanned('SCTManager.update')
+    @observe_operation('update')
     @retry(stop_max_attempt_number=get_ff("RETRY_COUNT"), stop_max_delay=10000, wait_fixed=2000,
            retry_on_exception=retry_on_exceptions)
     @log(logger)
-    def update(self, service: str, force: bool = False) -> dict:
+    def update(self, service: str, force: bool = False, timings: bool = False) -> dict:
         """
         Add or recreate service config on env.
 
         :param force: If true - add new services and recreate existing.
+        :param timings: If true - add stages durations to result.
         """
-        _, new_config, config_diff, message = self.get_service_configs(service)
+        set_span_attributes(env=self.env_local_name, service=service, force=force)
+        service_timings = Timings()
+        _, new_config, config_diff, message = self.get_service_configs(service, timings=service_timings)
         old_deleted, updated, status = False, False, True
         # no need to add or update service if no diff with its current config
         if config_diff and new_config:
@@ -121,15 +324,18 @@ class SCTManager(object):
                 # no need to delete service before adding if it doesn't exist on env
                 if force and service in self.env_services:
                     logger.log.debug((f"{service} - deleting old service from sct..."))
-                    old_deleted = self.sct.delete_service(service=service, envid=self.env_id)
+                    with service_timings.stage('sct_delete'):
+                        old_deleted = self.sct.delete_service(service=service, envid=self.env_id)
                     logger.log.debug((f"{service} - adding service to sct..."))
-                    updated = self.sct.update_service(service=service, envid=self.env_id,
-                                                      input_data=new_config)
+                    with service_timings.stage('sct_register'):
+                        updated = self.sct.update_service(service=service, envid=self.env_id,
+                                                          input_data=new_config)
                     message = "recreated" if old_deleted and updated else None
                 else:
                     logger.log.debug((f"{service} - adding service to sct..."))
-                    updated = self.sct.update_service(service=service, envid=self.env_id,
-                                                      input_data=new_config)
+                    with service_timings.stage('sct_register'):
+                        updated = self.sct.update_service(service=service, envid=self.env_id,
+                                                          input_data=new_config)
                     message = "added" if updated else None
             except requests.HTTPError as e:
                 logger.log.error((f"{service} - HTTP error: {e}"))
@@ -141,22 +347,117 @@ class SCTManager(object):
             status = False
         result = {'status': status, 'message': message, 'updated': updated,
                   'old_deleted': old_deleted, 'config_diff': config_diff}
+        if timings:
+            result['timings'] = service_timings.to_dict()
         logger.log.info(f"{service} - {result}")
         return result
 
+    @spanned('SCTManager.get_diff')
+    @observe_operation('diff')
     @retry(stop_max_attempt_number=get_ff("RETRY_COUNT"), stop_max_delay=10000, wait_fixed=2000,
            retry_on_exception=retry_on_exceptions)
     @log(logger)
-    def get_diff(self, service: str) -> dict:
+    def get_diff(self, service: str, timings: bool = False) -> dict:
         """
         Show service difference between current config on env and new generated one.
+
+        :param timings: If true - add stages durations to result.
         """
-        current_config, new_config, config_diff, message = self.get_service_configs(service)
+        set_span_attributes(env=self.env_local_name, service=service)
+        service_timings = Timings()
+        current_config, new_config, config_diff, message = self.get_service_configs(service, timings=service_timings)
         result = {'status': bool(new_config), 'message': message, 'current_config': current_config,
                   'new_config': new_config, 'config_diff': config_diff}
+        if timings:
+            result['timings'] = service_timings.to_dict()
         logger.log.info((f"{service} - {result}"))
         return result
 
+    @spanned('SCTManager.update_services')
+    @log(logger)
+    def update_services(self, services: list, force: bool = False,
+                        executor: concurrent.futures.Executor | None = None, on_result=None,
+                        timings: bool = False) -> dict:
+        """
+        Update services concurrently, group them by change.
+
+        :param executor: Executor to run on, own pool is used if not set.
+        :param on_result: Callback(service, update_result, state), called as soon as service is done.
+        :param timings: If true - add stages durations to result, per service and summed up for env.
+        """
+        set_span_attributes(env=self.env_local_name, services=len(services), force=force)
+        env_timings = Timings()
+        result = {
+            'force_mode': force,
+            'services_to_process': services,
+            'failed': [],
+            'added': [],
+            'recreated': [],
+            'skipped': [],
+            'by_service': {}
+        }
+
+        def _process_service(service):
+            try:
+                update_result = self.update(service=service, force=force, timings=timings)
+            except Exception as error:
+                logger.log.error(f"{service} - update exception: {error}")
+                update_result = {'status': False, 'message': str(error), 'updated': False,
+                                 'old_deleted': False, 'config_diff': None}
+            state = get_update_state(update_result)
+            result[state].append(service)
+            result['by_service'][service] = update_result
+            env_timings.merge(update_result.get('timings', {}))
+            if on_result:
+                on_result(service, update_result, state)
+
+        with env_timings.stage('services_wall'):
+            run_concurrently(_process_service, services, executor)
+        if timings:
+            result['timings'] = {**self.take_init_timings(), **env_timings.to_dict()}
+        return result
+
+    @spanned('SCTManager.diff_services')
+    @log(logger)
+    def diff_services(self, services: list, executor: concurrent.futures.Executor | None = None,
+                      on_result=None, timings: bool = False) -> dict:
+        """
+        Get services diff concurrently, group them by change.
+
+        :param executor: Executor to run on, own pool is used if not set.
+        :param on_result: Callback(service, diff_result, state), called as soon as service is done.
+        :param timings: If true - add stages durations to result, per service and summed up for env.
+        """
+        set_span_attributes(env=self.env_local_name, services=len(services))
+        env_timings = Timings()
+        result = {
+            'fail': [],
+            'add': [],
+            'recreate': [],
+            'skip': [],
+            'by_service': {}
+        }
+
+        def _process_service(service):
+            try:
+                diff_result = self.get_diff(service, timings=timings)
+            except Exception as error:
+                logger.log.error(f"{service} - diff exception: {error}")
+                diff_result = {'status': False, 'message': str(error), 'current_config': None,
+                               'new_config': None, 'config_diff': None}
+            state = get_diff_state(diff_result, exists=service in self.env_services)
+            result[state].append(service)
+            result['by_service'][service] = diff_result
+            env_timings.merge(diff_result.get('timings', {}))
+            if on_result:
+                on_result(service, diff_result, state)
+
+        with env_timings.stage('services_wall'):
+            run_concurrently(_process_service, services, executor)
+        if timings:
+            result['timings'] = {**self.take_init_timings(), **env_timings.to_dict()}
+        return result
+
     @log(logger)
     def get_current(self, service: str) -> list:
         """Get service current config."""
@@ -164,6 +465,7 @@ class SCTManager(object):
         logger.log.info((f"{service} - {result}"))
         return result
 
+    @observe_operation('update_schemes')
     @log(logger)
     def update_deployment_schemes(self) -> dict:
         """Update deployment schemes on env."""
@@ -171,7 +473,7 @@ class SCTManager(object):
         logger.log.info(f"POPs: {unique_pops}, locations: {unique_server_locs}")
         schemes_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                          "..", "conf", "deployment_schemes.json")
-        schemes_template = load_json(schemes_file_path)
+        schemes_template = load_schemes_template(schemes_file_path)
 
         logger.log.info(("Parsing deployment schemes template..."))
         parsed_schemes = parse_deployment_schemes(
@@ -186,63 +488,90 @@ class SCTManager(object):
         logger.log.info(f"Schemes update - {result}")
         return result
 
+    @spanned('SCTManager.get_service_host_info')
     @log(logger)
     def get_service_host_info(self, service: str, source_service: str | None,
-                              required_variables: list) -> dict:
+                              required_variables: list, timings: Timings | None = None) -> dict:
         """
         Get host info by looking servers with role source_service or service.
         Searches on local env first, if not - on shared env
         """
+        set_span_attributes(service=service)
+        timings = timings or Timings()
         logger.log.debug((f"{service} - getting service host info..."))
-        if source_service:
-            local_hosts_fqdn = (self.env_local.get_service_host_by_pod(source_service) or
-                                self.env_local.get_service_host_by_pod(service))
-            if local_hosts_fqdn:
-                hosts_fqdn = local_hosts_fqdn
+        with timings.stage('host_lookup'), timed(UPSTREAM_LATENCY, 'ads_host_lookup', UPSTREAM_ERRORS), \
+                span('ads_host_lookup'):
+            if source_service:
+                local_hosts_fqdn = (self._get_service_hosts(self.env_local, source_service) or
+                                    self._get_service_hosts(self.env_local, service))
+                if local_hosts_fqdn:
+                    hosts_fqdn = local_hosts_fqdn
+                else:
+                    hosts_fqdn = (self._get_service_hosts(self.env_shared, source_service) or
+                                  self._get_service_hosts(self.env_shared, service))
             else:
-                hosts_fqdn = (self.env_shared.get_service_host_by_pod(source_service) or
-                              self.env_shared.get_service_host_by_pod(service))
-        else:
-            hosts_fqdn = (self.env_local.get_service_host_by_pod(service) or
-                          self.env_shared.get_service_host_by_pod(service))
+                hosts_fqdn = (self._get_service_hosts(self.env_local, service) or
+                              self._get_service_hosts(self.env_shared, service))
         logger.log.debug((f"{service} - service hosts: {hosts_fqdn}"))
+        variables_key = hashlib.sha1(','.join(required_variables).encode()).hexdigest()
         hosts_info = {}
         for host in hosts_fqdn:
-            host_info = self.ads.calculate_server_variables(
-                host=host, variables=required_variables
-            )
-            hosts_info[host] = host_info
+            with timings.stage('ads_variables'):
+                hosts_info[host] = self.session.cache.get_or_set(
+                    f'host_variables:{host}:{variables_key}',
+                    lambda: self._calculate_server_variables(host, required_variables)
+                )
         logger.log.debug((f"{service} - hosts variables: {hosts_info}"))
         return hosts_info
 
+    @staticmethod
+    def _get_service_hosts(env: ENV, pod: str) -> list:
+        account('ads_host_lookup', env.name, pod)
+        return env.get_service_host_by_pod(pod)
+
+    def _calculate_server_variables(self, host: str, required_variables: list) -> dict:
+        account('ads_variables', host, required_variables)
+        with timed(UPSTREAM_LATENCY, 'ads_variables', UPSTREAM_ERRORS), span('ads_variables', host=host):
+            return self.ads.calculate_server_variables(host=host, variables=required_variables)
+
     @log(logger)
-    def get_service_configs(self, service: str) -> tuple:
+    def get_service_configs(self, service: str, timings: Timings | None = None) -> tuple:
         """Get service current, new and diff configs"""
-        assert service in read_services_config(), f"{service} does not exist in services.json"
-        config_data = read_services_config()[service]
-        required_variables = get_required_variables()
+        timings = timings or Timings()
+        services_config = self.session.services_config
+        assert service in services_config, f"{service} does not exist in services.json"
+        config_data = services_config[service]
+        required_variables = self.session.required_variables
         service_host_info = self.get_service_host_info(
-            service, config_data[0]["address"]["source_service"], required_variables
+            service, config_data[0]["address"]["source_service"], required_variables, timings=timings
         )
-        current_config = adjust_current_config(self.env_services.get(service, []))
-        try:
-            new_config = NewConfigParser(
-                service=service, host_info=service_host_info, required_variables=required_variables,
-                config_data=config_data, envname=self.env_local_name,
-                envname_shared=self.shared_env_name, env_location=self.env_location
-            ).get_config()
-            logger.log.debug((f"{service} - service new config: {new_config}"))
-            message = "ok"
-        except ValueError as error:
-            new_config = []
-            message = str(error)
-        config_diff = diff(current_config, new_config, syntax='symmetric', marshal=True)
+        with timings.stage('parse'):
+            current_config = adjust_current_config(self.env_services.get(service, []))
+            try:
+                new_config = NewConfigParser(
+                    service=service, host_info=service_host_info, required_variables=required_variables,
+                    config_data=config_data, envname=self.env_local_name,
+                    envname_shared=self.shared_env_name, env_location=self.env_location
+                ).get_config()
+                logger.log.debug((f"{service} - service new config: {new_config}"))
+                message = "ok"
+            except ValueError as error:
+                new_config = []
+                message = str(error)
+        with timings.stage('diff'), span('diff', service=service):
+            # equal records need no diff, jsondiff only describes changes
+            current_records = self.env_services.get(service, ())
+            if current_records and same_config(current_records, new_config):
+                config_diff = {}
+            else:
+                config_diff = get_config_diff(current_config, new_config)
         logger.log.debug((f"{service} - service configs diff: {config_diff}"))
         return current_config, new_config, config_diff, message
 
     @log(logger)
     def get_unique_pops_locations(self) -> tuple:
         """Get pops and server locations for env"""
+        account('ads_pops', self.env_local_name)
         pops_locations = self.env_local.get_pop_server_location()
         unique_pops = dict()
         unique_server_locs = set()
@@ -255,3 +584,47 @@ class SCTManager(object):
         for pop in pops_locations.values():
             unique_pop_locs.add(pop['location'])
         return unique_pops, unique_server_locs, unique_pop_locs
+
+
+@log(logger)
+def diff_fleet(envs: list, only='', group='', exclude='', max_workers: int = 4,
+               session: RolloutSession | None = None, manager_factory=None,
+               executor: concurrent.futures.Executor | None = None, on_env=None) -> dict:
+    """
+    Diff many envs, envs are processed concurrently by max_workers.
+    Result is a compact changes matrix, by env and by service, skipped services are only counted.
+
+    :param manager_factory: Callable(env_name) returning SCTManager, new manager on shared session if not set.
+    :param executor: Executor for per-service work of every env.
+    :param on_env: Callback(env_name, env_changes), called as soon as env is done.
+    """
+    session = session or RolloutSession()
+    manager_factory = manager_factory or (lambda env_name: SCTManager(env_name, session=session))
+    result = {'envs': {}, 'services': {}, 'failed_envs': {}}
+    lock = threading.Lock()
+
+    def _diff_env(env_name):
+        try:
+            sct_manager = manager_factory(env_name)
+            services_to_process = filter_services(sct_manager.env_services, only, group, exclude, force=True,
+                                                  all_services=session.services_config)
+            diff_result = sct_manager.diff_services(services_to_process, executor=executor)
+        except Exception as error:
+            logger.log.error(f"{env_name} - diff exception: {error}")
+            with lock:
+                result['failed_envs'][env_name] = str(error)
+            env_changes = {'error': str(error)}
+        else:
+            env_changes = {state: sorted(diff_result[state]) for state in ('add', 'recreate', 'fail')}
+            env_changes['skip'] = len(diff_result['skip'])
+            with lock:
+                result['envs'][env_name] = env_changes
+                for state in ('add', 'recreate', 'fail'):
+                    for service in env_changes[state]:
+                        result['services'].setdefault(service, {})[env_name] = state
+        if on_env:
+            on_env(env_name, env_changes)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as env_executor:
+        run_concurrently(_diff_env, envs, env_executor)
+    return result
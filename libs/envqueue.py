@@ -0,0 +1,86 @@
+"""Per-env queue of write requests"""
+
+from collections import deque
+import threading
+
+
+class _Request(object):
+    def __init__(self, key) -> None:
+        self.key = key
+        self.turn = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EnvWriteQueue(object):
+    """
+    Writes to the same env run one by one in arrival order, writes to different envs run in parallel.
+    Request with merge key joins queued or running request with the same key instead of
+    queueing again: it waits for that request and gets the same result or exception.
+    Requests without key (e.g. with their own progress callbacks) are never merged.
+    """
+    def __init__(self, merge: bool = True) -> None:
+        self.merge = merge
+        self.executed = 0
+        self.merged = 0
+        self._queues = dict()
+        self._lock = threading.Lock()
+
+    def run(self, env_name: str, func, key=None):
+        with self._lock:
+            queue = self._queues.setdefault(env_name, deque())
+            request = self._find(queue, key)
+            owner = request is None
+            if owner:
+                request = _Request(key)
+                queue.append(request)
+                if len(queue) == 1:
+                    request.turn.set()
+            else:
+                self.merged += 1
+
+        if not owner:
+            request.done.wait()
+            if request.error:
+                raise request.error
+            return request.result
+
+        request.turn.wait()
+        try:
+            request.result = func()
+        except Exception as error:
+            request.error = error
+            raise
+        finally:
+            with self._lock:
+                queue.popleft()
+                self.executed += 1
+                if queue:
+                    queue[0].turn.set()
+                else:
+                    del self._queues[env_name]
+            request.done.set()
+        return request.result
+
+    def pending(self, env_name: str) -> int:
+        """Running and queued requests of env"""
+        with self._lock:
+            return len(self._queues.get(env_name, ()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'running': len(self._queues),
+                'queued': sum(len(queue) - 1 for queue in self._queues.values()),
+                'executed': self.executed,
+                'merged': self.merged,
+            }
+
+    def _find(self, queue: deque, key):
+        if not self.merge or key is None:
+            return None
+        for request in queue:
+            if request.key == key:
+                return request
+        return None
@@ -0,0 +1,80 @@
+"""Shared worker pool with admission control"""
+
+import concurrent.futures
+import threading
+
+from libs.metrics import EXECUTOR_REJECTED
+
+
+class ExecutorOverloaded(Exception):
+    """Queue of pending tasks is full, caller should retry later"""
+    def __init__(self, message: str, retry_after: int = 30) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BoundedExecutor(concurrent.futures.Executor):
+    """
+    Process-wide thread pool with bounded queue.
+    Admission is checked once per request by admit(), so work of admitted
+    request is never rejected halfway, new requests are rejected instead.
+    Queue stays bounded anyway: submit waits for a free queue slot when admitted
+    request fans out more tasks than max_queue. Tasks must not submit to the same
+    executor, they could wait for themselves.
+    """
+    def __init__(self, max_workers: int = 10, max_queue: int = 100, retry_after: int = 30) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix='worker')
+
+    @property
+    def queued(self) -> int:
+        """Tasks waiting for free worker"""
+        return max(0, self._pending - self.max_workers)
+
+    def admit(self) -> None:
+        """Raise ExecutorOverloaded if the queue is full"""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                EXECUTOR_REJECTED.inc()
+                raise ExecutorOverloaded(f"Server is busy, {self.queued} tasks in queue",
+                                         retry_after=self.retry_after)
+
+    def submit(self, fn, /, *args, **kwargs) -> concurrent.futures.Future:
+        """Submit task, wait while the queue is full"""
+        with self._not_full:
+            while self.queued >= self.max_queue:
+                self._not_full.wait()
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._task_done()
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'pending': self._pending,
+                'queued': self.queued,
+                'rejected': self.rejected,
+            }
+
+    def _task_done(self, *args) -> None:
+        with self._not_full:
+            self._pending -= 1
+            self._not_full.notify()
@@ -1,12 +1,16 @@
 """Common methods"""
 
+import getpass
+import hashlib
 import json
+import os
+import tempfile
 from time import time
 
-import psutil
 from requests.exceptions import ConnectionError, HTTPError
 
 import libs.memory as mem
+import libs.metrics as metrics
 import conf.settings as settings
 
 
@@ -14,9 +18,10 @@ def get_feature_flag(name='', module=None):
     return module.__dict__.get(name, None)
 
 
-def get_ff(name=''):
+def get_ff(name='', default=None):
     assert name
-    return get_feature_flag(name=name, module=settings)
+    value = get_feature_flag(name=name, module=settings)
+    return default if value is None else value
 
 
 def arg_to_list(arg: tuple | str) -> list:
@@ -25,11 +30,14 @@ def arg_to_list(arg: tuple | str) -> list:
 
 def retry_on_exceptions(exception: Exception) -> bool:
     retry_status_codes = [408, 429, 500, 502, 503, 504]
-    return (
+    retried = (
         isinstance(exception, ConnectionError)
         or isinstance(exception, HTTPError)
         and exception.response.status_code in retry_status_codes
     )
+    if retried:
+        metrics.RETRIES.labels(type(exception).__name__).inc()
+    return retried
 
 
 def load_json(file_path) -> dict:
@@ -37,7 +45,46 @@ def load_json(file_path) -> dict:
         return json.load(f)
 
 
+def get_stamp_path(name: str) -> str:
+    """Stamp file in STAMPS_DIR, per user temp dir by default"""
+    stamps_dir = get_ff('STAMPS_DIR', '') or os.path.join(tempfile.gettempdir(), f'happysct-{getpass.getuser()}')
+    return os.path.join(stamps_dir, name)
+
+
+def read_stamp(name: str, max_age: float | None = None) -> str | None:
+    """Stamp value, None if there is no stamp or it's older than max_age seconds"""
+    path = get_stamp_path(name)
+    try:
+        if max_age is not None and time() - os.path.getmtime(path) > max_age:
+            return None
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_stamp(name: str, value: str = '') -> None:
+    """Store stamp, results of slow checks shared by CLI runs; it's only an optimization, so errors are ignored"""
+    path = get_stamp_path(name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(value)
+    except OSError:
+        pass
+
+
+def get_files_checksum(*file_paths) -> str:
+    checksum = hashlib.sha1()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            checksum.update(f.read())
+    return checksum.hexdigest()
+
+
 def get_health():
+    # psutil is needed by API only, CLI starts faster without it
+    import psutil
 
     def pretty(value, divider=1024 * 1024, digits=0):
         return round(value / divider, digits)
@@ -59,12 +106,14 @@ def get_health():
         if parent_uptime - worker_uptime > 0.5:
             uptime_diff = parent_uptime - worker_uptime
 
-    memory_max_usage = pretty(mem.get_max_memory_usage())
-    memory_usage = pretty(mem.get_memory_usage())
-    memory_limit = pretty(mem.get_memory_limit())
+    memory_info = mem.get_memory_info(max_age=get_ff('MEMORY_REFRESH_INTERVAL', 1))
+    memory_max_usage = pretty(memory_info['max_usage'])
+    memory_usage = pretty(memory_info['usage'])
+    memory_limit = pretty(memory_info['limit'])
+    memory_working_set = pretty(memory_info['working_set'])
 
     message = ['I am fine']
-    if memory_limit > 0 and (memory_usage / memory_limit) > 0.8:
+    if memory_limit > 0 and (memory_working_set / memory_limit) > 0.8:
         message.append('Memory usage looks high')
     if uptime_diff > 0:
         message.append('Workers are lagging, compare uptimes')
@@ -74,6 +123,7 @@ def get_health():
         "info": "data sizes are in megabytes, timings are in seconds",
         'memory_max_usage': memory_max_usage,
         'memory_usage': memory_usage,
+        'memory_working_set': memory_working_set,
         'memory_limit': memory_limit,
         'workers_count': workers_count,
         'workers_data': workers_data,
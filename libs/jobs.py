@@ -0,0 +1,132 @@
+"""Background jobs for long-running operations"""
+
+import concurrent.futures
+from collections import OrderedDict
+import threading
+from time import time
+import uuid
+
+from api_libs.logger import Logger
+
+
+logger = Logger()
+
+
+class JobLimitError(Exception):
+    """All job slots are taken by queued or running jobs"""
+
+
+class Job(object):
+    def __init__(self, kind: str, params: dict) -> None:
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.created = time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.progress = {'total': None, 'done': 0, 'by_service': {}}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def set_total(self, total: int) -> None:
+        with self._lock:
+            self.progress['total'] = total
+
+    def add_progress(self, service: str, service_result: dict, state: str) -> None:
+        """Record finished service, signature matches update_services/diff_services on_result"""
+        with self._lock:
+            self.progress['done'] += 1
+            self.progress['by_service'][service] = state
+
+    def to_dict(self, with_result: bool = False) -> dict:
+        with self._lock:
+            data = {
+                'job_id': self.id,
+                'kind': self.kind,
+                'params': self.params,
+                'status': self.status,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'error': self.error,
+                'progress': {**self.progress, 'by_service': dict(self.progress['by_service'])},
+            }
+        if with_result:
+            data['result'] = self.result
+        return data
+
+
+class JobManager(object):
+    """
+    Run jobs on bounded worker pool and keep them in memory.
+    Finished jobs are evicted after ttl seconds or when max_jobs is reached, oldest first.
+    """
+    def __init__(self, max_workers: int = 2, max_jobs: int = 100, ttl: int = 3600) -> None:
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix='job')
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: dict, func) -> Job:
+        """
+        Submit func(job) to run in background. Returns already active job of
+        the same kind and params instead, so retrying callers don't start the work again.
+        """
+        with self._lock:
+            for job in self.jobs.values():
+                if job.active and job.kind == kind and job.params == params:
+                    logger.log.info(f"Job {job.id} - {kind} {params} is already {job.status}")
+                    return job
+            self._evict(make_room=True)
+            if len(self.jobs) >= self.max_jobs:
+                raise JobLimitError(f"Too many active jobs: {len(self.jobs)}")
+            job = Job(kind, params)
+            self.jobs[job.id] = job
+        logger.log.info(f"Job {job.id} - {kind} {params} queued")
+        self.executor.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            self._evict()
+            return self.jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            self._evict()
+            return list(self.jobs.values())
+
+    def _run(self, job: Job, func) -> None:
+        job.status, job.started = 'running', time()
+        try:
+            job.result = func(job)
+            status = 'done'
+        except Exception as error:
+            logger.log.exception(f"Job {job.id} - exception: {error}")
+            job.error = str(error)
+            status = 'failed'
+        # finished time goes first, eviction relies on it for inactive jobs
+        job.finished = time()
+        job.status = status
+        logger.log.info(f"Job {job.id} - {job.status}")
+
+    def _evict(self, make_room: bool = False) -> None:
+        now = time()
+        finished = [job for job in self.jobs.values() if not job.active]
+        for job in finished:
+            if now - job.finished > self.ttl:
+                del self.jobs[job.id]
+        if not make_room:
+            return
+        for job in finished:
+            if len(self.jobs) < self.max_jobs:
+                break
+            self.jobs.pop(job.id, None)
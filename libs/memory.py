@@ -1,4 +1,12 @@
 import os
+import threading
+from time import monotonic
+
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+_cache = {'time': None, 'info': None}
+_cache_lock = threading.Lock()
 
 
 def get_sysfs_stat(path=''):
@@ -11,31 +19,71 @@ def get_sysfs_stat(path=''):
     return lines
 
 
-def get_max_memory_usage():
-    tmp = get_sysfs_stat('/sys/fs/cgroup/memory/memory.max_usage_in_bytes')
-    if tmp:
-        memory_max_usage = int(tmp[0].strip())
+def get_sysfs_value(path='') -> int:
+    """Read single number file, 0 if missing or unlimited ('max' in cgroup v2)"""
+    tmp = get_sysfs_stat(path)
+    value = tmp[0].strip() if tmp else ''
+    return int(value) if value.isdecimal() else 0
+
+
+def get_sysfs_keys(path='') -> dict:
+    """Read 'key value' lines file, like memory.stat"""
+    tmp = get_sysfs_stat(path) or []
+    return {key: int(value) for key, value in (item.split() for item in tmp if len(item.split()) == 2)
+            if value.isdecimal()}
+
+
+def is_cgroup_v2(root: str = CGROUP_ROOT) -> bool:
+    return os.path.exists(os.path.join(root, 'cgroup.controllers'))
+
+
+def read_memory_info(root: str = CGROUP_ROOT) -> dict:
+    """
+    Read memory usage, max usage, limit and working set in bytes for cgroup v1 or v2.
+    Working set is usage without inactive page cache, the same value OOM killer and kubelet look at.
+    """
+    if is_cgroup_v2(root):
+        stat = get_sysfs_keys(os.path.join(root, 'memory.stat'))
+        usage = get_sysfs_value(os.path.join(root, 'memory.current'))
+        max_usage = get_sysfs_value(os.path.join(root, 'memory.peak'))
+        limit = get_sysfs_value(os.path.join(root, 'memory.max'))
+        inactive_file = stat.get('inactive_file', 0)
     else:
-        memory_max_usage = 0
-    return memory_max_usage
+        stat = get_sysfs_keys(os.path.join(root, 'memory', 'memory.stat'))
+        usage = get_sysfs_value(os.path.join(root, 'memory', 'memory.usage_in_bytes'))
+        max_usage = get_sysfs_value(os.path.join(root, 'memory', 'memory.max_usage_in_bytes'))
+        limit = stat.get('hierarchical_memory_limit', 0)
+        inactive_file = stat.get('total_inactive_file', 0)
+    return {
+        'usage': usage,
+        'max_usage': max_usage,
+        'limit': limit,
+        'working_set': max(0, usage - inactive_file),
+    }
+
+
+def get_memory_info(max_age: float = 1.0) -> dict:
+    """Memory info cached for max_age seconds, cheap enough to call on every request"""
+    with _cache_lock:
+        if _cache['time'] is None or monotonic() - _cache['time'] > max_age:
+            _cache['info'] = read_memory_info()
+            _cache['time'] = monotonic()
+        return _cache['info']
+
+
+def get_memory_pressure(max_age: float = 1.0) -> float:
+    """Working set share of memory limit, 0 if there is no limit"""
+    info = get_memory_info(max_age)
+    return info['working_set'] / info['limit'] if info['limit'] else 0
+
+
+def get_max_memory_usage():
+    return get_memory_info()['max_usage']
 
 
 def get_memory_usage():
-    tmp = get_sysfs_stat('/sys/fs/cgroup/memory/memory.usage_in_bytes')
-    if tmp:
-        memory_usage = int(tmp[0].strip())
-    else:
-        memory_usage = 0
-    return memory_usage
+    return get_memory_info()['usage']
 
 
 def get_memory_limit():
-    tmp = get_sysfs_stat('/sys/fs/cgroup/memory/memory.stat')
-    if not tmp:
-        memory_limit = 0
-    else:
-        for item in tmp:
-            if 'hierarchical_memory_limit' in item:
-                memory_limit = int(item.split(' ')[1].strip())
-                break
-    return memory_limit
+    return get_memory_info()['limit']
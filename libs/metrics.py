@@ -0,0 +1,74 @@
+"""Prometheus metrics"""
+
+from contextlib import contextmanager
+import functools
+from time import perf_counter
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram('happysct_request_duration_seconds', 'API request latency',
+                            ['route', 'method', 'status'], buckets=LATENCY_BUCKETS)
+UPSTREAM_LATENCY = Histogram('happysct_upstream_duration_seconds', 'SCT and ADS call latency',
+                             ['call'], buckets=LATENCY_BUCKETS)
+UPSTREAM_ERRORS = Counter('happysct_upstream_errors_total', 'SCT and ADS calls failed with exception',
+                          ['call'])
+OPERATION_LATENCY = Histogram('happysct_operation_duration_seconds', 'SCTManager operation latency',
+                              ['operation'], buckets=LATENCY_BUCKETS)
+RETRIES = Counter('happysct_retries_total', 'Exceptions retried by retry policy', ['exception'])
+CACHE_REQUESTS = Counter('happysct_cache_requests_total', 'Cache lookups', ['cache', 'result'])
+EXECUTOR_PENDING = Gauge('happysct_executor_pending_tasks', 'Tasks running or waiting in shared executor')
+EXECUTOR_QUEUED = Gauge('happysct_executor_queued_tasks', 'Tasks waiting for free worker in shared executor')
+EXECUTOR_REJECTED = Counter('happysct_executor_rejected_total', 'Requests rejected by admission control')
+MEMORY_REJECTED = Counter('happysct_memory_rejected_total', 'Requests rejected because of memory usage')
+ENV_WRITES_QUEUED = Gauge('happysct_env_writes_queued', 'Env writes waiting for previous writes to the same env')
+JOBS_ACTIVE = Gauge('happysct_jobs_active', 'Background jobs queued or running')
+RECONCILE_RUNS = Counter('happysct_reconcile_runs_total', 'Env reconcile runs', ['status'])
+RECONCILE_APPLIED = Counter('happysct_reconcile_applied_total', 'Drifted services added or recreated by reconcile')
+
+
+@contextmanager
+def timed(histogram: Histogram, label: str, errors: Counter | None = None):
+    """Observe block duration in histogram with label, count exceptions in errors"""
+    start = perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.labels(label).inc()
+        raise
+    finally:
+        histogram.labels(label).observe(perf_counter() - start)
+
+
+def observe_upstream(call: str):
+    """Decorator, observe SCT or ADS call latency and errors"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(UPSTREAM_LATENCY, call, UPSTREAM_ERRORS):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_operation(operation: str):
+    """Decorator, observe SCTManager operation latency"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(OPERATION_LATENCY, operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def export() -> tuple:
+    """Metrics in Prometheus text format and its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
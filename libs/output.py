@@ -0,0 +1,67 @@
+"""Streaming results output"""
+
+import json
+import sys
+import threading
+
+
+OUTPUT_FORMATS = ['', 'ndjson']
+
+_stdout_writers = 0
+
+
+def to_ndjson(record: dict) -> str:
+    """Serialize record as a single NDJSON line"""
+    return json.dumps(record, default=str) + "\n"
+
+
+def stdout_reserved() -> bool:
+    """True while some writer streams NDJSON to stdout, friendly print must keep quiet"""
+    return _stdout_writers > 0
+
+
+class NDJSONWriter(object):
+    """Write one json object per line and flush it right away. Thread-safe."""
+    def __init__(self, file: str = '') -> None:
+        global _stdout_writers
+        self.file = file
+        self.closed = False
+        self._lock = threading.Lock()
+        if file:
+            self._stream = open(file, "a")
+        else:
+            self._stream = sys.stdout
+            _stdout_writers += 1
+
+    def write(self, record: dict) -> None:
+        line = to_ndjson(record)
+        with self._lock:
+            self._stream.write(line)
+            self._stream.flush()
+
+    def close(self) -> None:
+        """Close file or release stdout, once"""
+        global _stdout_writers
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.file:
+                self._stream.close()
+            else:
+                _stdout_writers -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def get_writer(output: str = '', output_file: str = '') -> NDJSONWriter | None:
+    """Get writer for requested output format, None means default friendly print"""
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output}, use one of {OUTPUT_FORMATS}")
+    if output_file and output != 'ndjson':
+        raise ValueError(f"Output file {output_file} needs --output ndjson")
+    return NDJSONWriter(file=output_file) if output == 'ndjson' else None
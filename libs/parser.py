@@ -1,36 +1,113 @@
 """Schemes and service configs parser"""
 
+import os
 import re
+import threading
 
 from api_libs.logger import Logger, log
+from libs.cache import Cache, MemoryCache
+from libs.helper import get_ff, load_json
+from libs.records import ServiceRecord, get_address
+from libs.tracing import Tracer, spanned, traced
 
 
 logger = Logger()
+# parser methods run for every host and template item, @log is too heavy there
+tracer = Tracer('parser')
+
+VARIABLE_PATTERN = re.compile(r'{([^}]*)}')
+
+
+class SchemesTemplate(object):
+    """
+    Precompiled deployment schemes template, it is never changed: parse builds new schemes every time.
+    With cache, schemes are memoized by env topology, envs with the same POPs and locations share them.
+    """
+    def __init__(self, template: dict, cache: Cache | None = None) -> None:
+        self.cache = cache
+        self.all_dc_record = tuple(template["all_dc_record"].items())
+        self.schemes = {
+            env_type: tuple(self._compile_scheme(scheme) for scheme in schemes.values())
+            for env_type, schemes in template.items() if env_type != "all_dc_record"
+        }
+
+    @staticmethod
+    def _compile_scheme(scheme: dict) -> tuple:
+        """Scheme fields, dcPriorities records as (entryDc, activeDc, priorities) tuples"""
+        return tuple(
+            (key, tuple((record["entryDc"], record["activeDc"], tuple(record["priorities"])) for record in value)
+             if key == "dcPriorities" else value)
+            for key, value in scheme.items()
+        )
+
+    @staticmethod
+    def get_signature(unique_pops: dict, unique_server_locs: set, unique_pop_locs: set) -> str:
+        """Topology parsed schemes depend on: target POPs, all locations and POP locations"""
+        target_pops = sorted((pop, value) for pop, value in unique_pops.items() if pop <= 2 and value)
+        return f"{target_pops}:{sorted(unique_server_locs | unique_pop_locs)}:{sorted(unique_pop_locs)}"
+
+    def parse(self, unique_pops: dict, unique_server_locs: set, unique_pop_locs: set) -> list:
+        """Schemes for env topology, memoized ones are shared, callers must not change them"""
+        if self.cache is None:
+            return self._parse(unique_pops, unique_server_locs, unique_pop_locs)
+        return self.cache.get_or_set(
+            self.get_signature(unique_pops, unique_server_locs, unique_pop_locs),
+            lambda: self._parse(unique_pops, unique_server_locs, unique_pop_locs)
+        )
+
+    def _parse(self, unique_pops: dict, unique_server_locs: set, unique_pop_locs: set) -> list:
+        target_pops = {pop: value for pop, value in unique_pops.items() if pop <= 2 and value}
+        env_type = "monopop" if len(target_pops) == 1 else "multipop"
+        all_priorities = sorted(unique_server_locs | unique_pop_locs)
+        pop_locs = sorted(unique_pop_locs)
+
+        def _dc(value):
+            return target_pops[value] if isinstance(value, int) else value
+
+        schemes = list()
+        for fields in self.schemes[env_type]:
+            scheme = dict()
+            for key, value in fields:
+                if key != "dcPriorities":
+                    scheme[key] = value
+                    continue
+                scheme[key] = list()
+                for entry_dc, active_dc, priorities in value:
+                    priorities = [target_pops[dc] for dc in priorities]
+                    priorities.extend(loc for loc in pop_locs if loc not in priorities)
+                    scheme[key].append({"entryDc": _dc(entry_dc), "activeDc": _dc(active_dc),
+                                        "priorities": priorities})
+                scheme[key].append({**dict(self.all_dc_record), "priorities": list(all_priorities)})
+            schemes.append(scheme)
+        return schemes
+
+
+_schemes_templates = dict()
+_schemes_templates_lock = threading.Lock()
+
+
+def load_schemes_template(file_path: str) -> SchemesTemplate:
+    """Schemes template of file, compiled once and again only if the file is changed"""
+    mtime = os.path.getmtime(file_path)
+    with _schemes_templates_lock:
+        loaded = _schemes_templates.get(file_path)
+        if loaded and loaded[0] == mtime:
+            return loaded[1]
+        template = SchemesTemplate(load_json(file_path), cache=MemoryCache(
+            name='schemes', ttl=get_ff('SCHEMES_CACHE_TTL', 3600), max_size=256))
+        _schemes_templates[file_path] = mtime, template
+        return template
 
 
 @log(logger)
 def parse_deployment_schemes(
-        unique_pops: dict, unique_server_locs: set, unique_pop_locs: set, schemes_template: dict
+        unique_pops: dict, unique_server_locs: set, unique_pop_locs: set,
+        schemes_template: 'dict | SchemesTemplate'
 ) -> list:
-    target_pops = {pop: value for pop, value in unique_pops.items() if pop <= 2 and value}
-    env_type = "monopop" if len(target_pops) == 1 else "multipop"
-    schemes_template["all_dc_record"]["priorities"] = sorted(
-        list(unique_server_locs | unique_pop_locs)
-    )
-
-    for scheme in schemes_template[env_type]:
-        for record in schemes_template[env_type][scheme]["dcPriorities"]:
-            if isinstance(record["entryDc"], int):
-                record["entryDc"] = target_pops[record["entryDc"]]
-            if isinstance(record["activeDc"], int):
-                record["activeDc"] = target_pops[record["activeDc"]]
-            record["priorities"] = [target_pops[dc] for dc in record["priorities"]]
-            record["priorities"].extend(
-                loc for loc in unique_pop_locs if loc not in record["priorities"]
-            )
-        schemes_template[env_type][scheme]["dcPriorities"].append(schemes_template["all_dc_record"])
-
-    return list(schemes_template[env_type].values())
+    """Schemes for env topology, template is not changed"""
+    if not isinstance(schemes_template, SchemesTemplate):
+        schemes_template = SchemesTemplate(schemes_template)
+    return schemes_template.parse(unique_pops, unique_server_locs, unique_pop_locs)
 
 
 class NewConfigParser(object):
@@ -47,6 +124,7 @@ class NewConfigParser(object):
         self.env_shared_name = envname_shared
         self.env_location = env_location.lower()
 
+    @spanned('NewConfigParser.get_config')
     def get_config(self) -> list:
         new_config = []
         hosts = self.host_info.values() if self.host_info else [None]
@@ -70,7 +148,7 @@ class NewConfigParser(object):
                 raise ValueError(f'invalid new port, got {port}')
         return True
 
-    @log(logger)
+    @traced(tracer)
     def fill_data(self, data: dict, host) -> dict:
         """Fill service data by using service config and calculating fields"""
         filled_data = data.copy()
@@ -82,14 +160,14 @@ class NewConfigParser(object):
         filled_data["group"] = self.get_group(data.get("group")) if data.get("group") else None
         return filled_data
 
-    @log(logger)
+    @traced(tracer)
     def expand_variable(self, input_str: str):
-        var_match = re.search(r'{([^}]*)}', input_str)
+        var_match = VARIABLE_PATTERN.search(input_str)
         var_name = var_match.group(1) if var_match else None
         var_value = self.host.get(var_name, "")
-        return re.sub(r'({[^}]*})', var_value, input_str)
+        return VARIABLE_PATTERN.sub(lambda match: var_value, input_str)
 
-    @log(logger)
+    @traced(tracer)
     def get_location(self, location: str) -> str:
         """Get location by host or env location"""
         return (
@@ -97,7 +175,7 @@ class NewConfigParser(object):
             if self.host else self.env_location
         )
 
-    @log(logger)
+    @traced(tracer)
     def get_physical_env(self, physical_env: str) -> str:
         """Get physical_env by host POD, default: p01"""
         return (
@@ -105,7 +183,7 @@ class NewConfigParser(object):
             if self.host else "p01"
         )
 
-    @log(logger)
+    @traced(tracer)
     def get_address(self, data: dict) -> str:
         """Get local or shared service address, conditions order matters"""
         address = data["default"].strip("{}")
@@ -126,7 +204,7 @@ class NewConfigParser(object):
         address = address.split("//")[-1].split(":")[0]
         return address
 
-    @log(logger)
+    @traced(tracer)
     def get_port(self, port: int | str) -> int:
         """Get port by port variable"""
         if isinstance(port, str) and "{" in port:
@@ -134,28 +212,14 @@ class NewConfigParser(object):
             port = int(port) if port.isdecimal() else 80
         return port
 
-    @log(logger)
+    @traced(tracer)
     def get_group(self, group: str) -> str:
         """Get group by group variable"""
         return self.expand_variable(input_str=group)
 
 
 @log(logger)
-def adjust_current_config(current_conf: list) -> list:
-    for item in current_conf:
-        item.update(
-            serviceName=item.pop("name", None),
-            serviceVersion=item.pop("version", None),
-            serviceInterface=item.pop("serviceInterface", None),
-            deploymentScheme=item.pop("deploymentScheme", None),
-            location=item.pop("location", None),
-            physicalEnv=item.pop("selectedPod", None),
-            ssl=item.pop("ssl", None),
-            group=item.pop("group", None),
-            address=item.pop("address", None),
-            port=item.pop("port", None),
-        )
-        item.pop("pods", None)
-        item.pop("newModel", None)
-        item.pop("order", None)
-    return sorted(current_conf, key=lambda x: x['address'])
+def adjust_current_config(current_conf) -> list:
+    """Convert current config from SCT format or records to services.json format, input stays untouched"""
+    records = [item if isinstance(item, ServiceRecord) else ServiceRecord.from_sct(item) for item in current_conf]
+    return [record.to_dict() for record in sorted(records, key=get_address)]
@@ -0,0 +1,110 @@
+"""Env managers pool"""
+
+from collections import OrderedDict
+import threading
+from time import monotonic
+
+from api_libs.logger import Logger
+from libs.metrics import cache_lookup
+
+
+logger = Logger()
+
+
+class ManagerPool(object):
+    """
+    Thread-safe LRU cache of env managers with TTL and size limit.
+    Manager for the same env is built only once even if requested concurrently.
+    """
+    def __init__(self, factory, ttl: int = 300, max_size: int = 32) -> None:
+        self.factory = factory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = dict()
+
+    def get(self, key: str, fresh: bool = False, timings=None):
+        """
+        Get cached manager or build new one.
+
+        :param fresh: Reload current services of cached manager, used before writes.
+        :param timings: Timings to add reload stage to.
+        """
+        manager = self._get_cached(key)
+        if manager is None:
+            # build lock and number of threads using it, dropped by the last one
+            with self._lock:
+                build = self._build_locks.setdefault(key, [threading.Lock(), 0])
+                build[1] += 1
+            try:
+                with build[0]:
+                    # other thread could build it while we were waiting
+                    manager = self._get_cached(key, count=False)
+                    if manager is None:
+                        manager = self.factory(key)
+                        self._put(key, manager)
+                        return manager
+            finally:
+                with self._lock:
+                    build[1] -= 1
+                    if not build[1]:
+                        del self._build_locks[key]
+        if fresh:
+            self.refresh(key, timings=timings)
+        return manager
+
+    def refresh(self, key: str, timings=None) -> None:
+        """Reload current services of cached manager, e.g. after writes to its env"""
+        with self._lock:
+            item = self._items.get(key)
+        if item:
+            item[1].refresh(timings=timings)
+            with self._lock:
+                if key in self._items:
+                    self._items[key] = (monotonic(), item[1])
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / requests, 3) if requests else 0,
+            }
+
+    def _get_cached(self, key: str, count: bool = True):
+        with self._lock:
+            item = self._items.get(key)
+            if item and monotonic() - item[0] < self.ttl:
+                self._items.move_to_end(key)
+                if count:
+                    self.hits += 1
+                    cache_lookup('manager_pool', hit=True)
+                return item[1]
+            if item:
+                del self._items[key]
+            if count:
+                self.misses += 1
+                cache_lookup('manager_pool', hit=False)
+            return None
+
+    def _put(self, key: str, manager) -> None:
+        with self._lock:
+            self._items[key] = (monotonic(), manager)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                evicted, _ = self._items.popitem(last=False)
+                self.evictions += 1
+                logger.log.debug(f"Manager pool - evicted {evicted}")
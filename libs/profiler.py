@@ -0,0 +1,208 @@
+"""CLI profiling: cProfile of all threads, collapsed stacks and optional wall-clock sampling"""
+
+from collections import Counter
+from contextlib import contextmanager
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+PROFILE_ARGS = ('--profile', '--profile-top', '--profile-wall')
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def pop_profile_args(argv: list) -> tuple:
+    """
+    Remove profile options from command line args, so fire doesn't see them.
+    Returns args left and options dict or None if profiling is not requested:
+    --profile[=prefix], --profile-top[=]N, --profile-wall[[=]interval seconds]
+    Prefix is taken only after '=', argument after --profile is the command's one.
+    """
+    args, options = list(), dict()
+    argv = list(argv)
+    while argv:
+        arg = argv.pop(0)
+        name, equals, value = arg.partition('=')
+        if name not in PROFILE_ARGS:
+            args.append(arg)
+        elif name == '--profile':
+            options['prefix'] = value
+        elif name == '--profile-top':
+            if not equals and argv:
+                value = argv.pop(0)
+            try:
+                options['top'] = int(value)
+            except ValueError:
+                raise ValueError(f"--profile-top needs number, e.g. --profile-top=30, got {value!r}") from None
+        elif name == '--profile-wall':
+            if not equals and argv and _is_number(argv[0]):
+                value = argv.pop(0)
+            try:
+                options['wall_interval'] = float(value or 0.005)
+            except ValueError:
+                raise ValueError(f"--profile-wall needs seconds, e.g. --profile-wall=0.01, got {value!r}") from None
+    if not options:
+        return args, None
+    options.setdefault('prefix', '')
+    return args, options
+
+
+def get_collapsed_stacks(stats: pstats.Stats, min_time: float = 1e-5, max_depth: int = 100) -> Counter:
+    """
+    Collapsed stacks ("root;caller;function microseconds" lines for flamegraph tools) built from
+    cProfile call graph. cProfile keeps caller-callee edges only, so time of function called from
+    many places is split between its callers by their share of its cumulative time.
+    Paths taking less than min_time seconds are dropped.
+    """
+    callees = dict()
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, dict())[func] = edge
+    stacks = Counter()
+
+    def _walk(func, path: tuple, self_time: float, weight: float, visited: frozenset) -> None:
+        path = path + (f'{func[2]} ({os.path.basename(func[0])}:{func[1]})',)
+        stacks[';'.join(path)] += int(self_time * 1e6)
+        if len(path) >= max_depth:
+            return
+        for callee, (_, _, edge_tottime, edge_cumtime) in callees.get(func, {}).items():
+            callee_cumtime = stats.stats[callee][3]
+            if callee in visited or not callee_cumtime or edge_cumtime * weight < min_time:
+                continue
+            _walk(callee, path, edge_tottime * weight, weight * edge_cumtime / callee_cumtime,
+                  visited | {callee})
+
+    for func, (_, _, tottime, _, callers) in stats.stats.items():
+        if not callers:
+            _walk(func, (), tottime, 1.0, frozenset([func]))
+    return Counter({stack: value for stack, value in stacks.items() if value > 0})
+
+
+def write_collapsed(stacks: Counter, file: str) -> None:
+    with open(file, 'w') as f:
+        for stack, value in sorted(stacks.items()):
+            f.write(f'{stack} {value}\n')
+
+
+class WallSampler(object):
+    """Sample stacks of all threads every interval seconds, blocked on I/O too"""
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='wall-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = dict()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                path = list()
+                while frame is not None:
+                    code = frame.f_code
+                    path.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                path.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(path))] += 1
+
+
+class Profiler(object):
+    """
+    cProfile of main and all threads started while profiling, e.g. per-service workers.
+    Before Python 3.12 every new thread gets its own profile, merged on stop. Since 3.12 cProfile
+    runs on sys.monitoring, which is process-wide: the main profile sees all threads and only one can be active.
+    Writes <prefix>.pstats, <prefix>.collapsed and, with wall sampling, <prefix>.wall.collapsed
+    """
+    def __init__(self, prefix: str = '', top: int = 20, wall_interval: float | None = None) -> None:
+        self.prefix = prefix or f"profile-{time.strftime('%Y%m%d-%H%M%S')}"
+        self.top = top
+        self.sampler = WallSampler(wall_interval) if wall_interval else None
+        self._profiles = [cProfile.Profile()]
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        # sampler thread starts before the hook, so it is not profiled
+        if self.sampler:
+            self.sampler.start()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread_profile)
+        self._profiles[0].enable()
+
+    def stop(self) -> pstats.Stats:
+        self._profiles[0].disable()
+        threading.setprofile(None)
+        if self.sampler:
+            self.sampler.stop()
+        stats = pstats.Stats(self._profiles[0])
+        with self._lock:
+            for profile in self._profiles[1:]:
+                # worker threads are idle or finished by now, take what they have collected
+                profile.snapshot_stats()
+                stats.add(profile)
+        return stats
+
+    def report(self, stats: pstats.Stats, stream=None) -> list:
+        """Write profile files, print top functions by self and cumulative time, return written files"""
+        stream = stream or sys.stderr
+        files = [f'{self.prefix}.pstats', f'{self.prefix}.collapsed']
+        stats.dump_stats(files[0])
+        write_collapsed(get_collapsed_stacks(stats), files[1])
+        if self.sampler:
+            files.append(f'{self.prefix}.wall.collapsed')
+            write_collapsed(self.sampler.stacks, files[2])
+        stats.stream = stream
+        for sort_key in ('tottime', 'cumulative'):
+            print(f'\nProfile - top {self.top} by {sort_key}:', file=stream)
+            stats.sort_stats(sort_key).print_stats(self.top)
+        print(f"Profile files: {', '.join(files)}", file=stream)
+        return files
+
+    def _start_thread_profile(self, frame, event, arg) -> None:
+        """Called once in each new thread, replaces itself with thread's own cProfile"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is already active, the thread runs unprofiled, the hook is not called again
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+
+@contextmanager
+def profiled(options: dict | None):
+    """Profile the block if options are set, report even if the block exits with error"""
+    if not options:
+        yield None
+        return
+    profiler = Profiler(prefix=options.get('prefix', ''), top=options.get('top', 20),
+                        wall_interval=options.get('wall_interval'))
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.report(profiler.stop())
@@ -0,0 +1,230 @@
+"""Long-running reconcile of envs: periodic diff on jittered schedule, drifted services only are applied"""
+
+import concurrent.futures
+import random
+import threading
+from time import monotonic, time
+
+from api_libs.logger import Logger
+from libs.core import SCTManager, filter_services
+from libs.executor import ExecutorOverloaded
+from libs.metrics import RECONCILE_APPLIED, RECONCILE_RUNS
+from libs.tracing import in_current_context
+
+
+logger = Logger()
+
+
+def reconcile_env(sct_manager: SCTManager, only='', group='', exclude='', add_only: bool = False,
+                  executor: concurrent.futures.Executor | None = None) -> dict:
+    """
+    Diff env and update only services which config differs from the catalog one:
+    missing services are added, changed ones are recreated.
+
+    :param add_only: Only add missing services, changed ones are reported in 'recreate' but left as they are.
+    """
+    services = filter_services(sct_manager.env_services, only, group, exclude, force=True,
+                               all_services=sct_manager.session.services_config)
+    diff_result = sct_manager.diff_services(services, executor=executor)
+    force = not add_only
+    drifted = sorted(diff_result['add'] + (diff_result['recreate'] if force else []))
+    result = {'add': sorted(diff_result['add']), 'recreate': sorted(diff_result['recreate']),
+              'fail': sorted(diff_result['fail']), 'applied': [], 'failed': []}
+    if drifted:
+        try:
+            update_result = sct_manager.update_services(drifted, force=force, executor=executor)
+        finally:
+            sct_manager.refresh()
+        result['applied'] = sorted(update_result['added'] + update_result['recreated'])
+        result['failed'] = sorted(update_result['failed'])
+    return result
+
+
+class EnvSchedule(object):
+    """Reconcile state of one env: when it runs next, consecutive failures and last result"""
+    def __init__(self, env_name: str, next_run: float) -> None:
+        self.env_name = env_name
+        self.next_run = next_run
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_run = None
+        self.last_error = None
+        self.last_result = None
+
+    def to_dict(self) -> dict:
+        return {'env': self.env_name, 'running': self.running, 'runs': self.runs, 'failures': self.failures,
+                'last_run': self.last_run, 'last_error': self.last_error, 'last_result': self.last_result}
+
+
+class Reconciler(object):
+    """
+    Reconcile envs forever in background thread, each env once per interval.
+    First runs are spread uniformly over the interval and every next run is jittered,
+    so upstream load stays flat instead of spiking like periodic rollout does.
+    Env that fails is retried after exponentially growing delay, up to max_backoff.
+    Env deferred because the server is busy (ExecutorOverloaded) is retried after its retry_after,
+    it is not a failure and doesn't back off.
+
+    :param reconcile: Callable(env_name) returning reconcile_env result, raises if env failed.
+    :param envs: Callable returning env names, called again every interval to pick up new and removed envs.
+    :param on_env: Callback(env_name, result, error), called as soon as env is reconciled.
+    """
+    def __init__(self, reconcile, envs, interval: float = 600, jitter: float = 0.1, max_backoff: float = 21600,
+                 max_workers: int = 4, on_env=None, clock=monotonic, seed=None) -> None:
+        self.reconcile = reconcile
+        self.envs = envs
+        self.on_env = on_env
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.schedule = dict()
+        self.runs = 0
+        self.failures = 0
+        self.applied = 0
+        self.deferred = 0
+        self.envs_refreshed = None
+        self._random = random.Random(seed)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix='reconcile')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=in_current_context(self.run_forever), name='reconciler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop scheduling new runs, envs being reconciled are finished in background"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_forever(self) -> None:
+        logger.log.info(f"Reconcile started, interval: {self.interval}s")
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                if self.envs_refreshed is None or self.clock() - self.envs_refreshed >= self.interval:
+                    self.refresh_envs()
+                self.run_pending()
+            except Exception as error:
+                logger.log.exception(f"Reconcile loop exception: {error}")
+            self._wakeup.wait(self.seconds_to_next())
+        logger.log.info("Reconcile stopped")
+
+    def run_once(self) -> dict:
+        """Reconcile all envs right away, one pass, e.g. from cron. Returns stats."""
+        self.refresh_envs()
+        now = self.clock()
+        with self._lock:
+            for item in self.schedule.values():
+                item.next_run = now
+        self.run_pending(wait=True)
+        return self.stats()
+
+    def refresh_envs(self) -> None:
+        """New envs get first run at random point of the interval, removed envs are dropped"""
+        env_names = set(self.envs())
+        now = self.clock()
+        with self._lock:
+            for env_name in set(self.schedule) - env_names:
+                if not self.schedule[env_name].running:
+                    del self.schedule[env_name]
+            for env_name in env_names - set(self.schedule):
+                self.schedule[env_name] = EnvSchedule(env_name, now + self._random.uniform(0, self.interval))
+            self.envs_refreshed = now
+
+    def run_pending(self, wait: bool = False) -> list:
+        """Submit envs due to run, returns their names. wait - block until they are reconciled."""
+        now = self.clock()
+        with self._lock:
+            due = sorted((item for item in self.schedule.values() if not item.running and item.next_run <= now),
+                         key=lambda item: item.next_run)
+            for item in due:
+                item.running = True
+        futures = [self._executor.submit(in_current_context(self._run_env), item) for item in due]
+        if wait:
+            concurrent.futures.wait(futures)
+        return [item.env_name for item in due]
+
+    def seconds_to_next(self) -> float:
+        """Time to sleep until the next env is due, envs list refresh included, 1 second at least"""
+        now = self.clock()
+        with self._lock:
+            next_runs = [item.next_run for item in self.schedule.values() if not item.running]
+        next_runs.append((self.envs_refreshed or now) + self.interval)
+        return max(1.0, min(next_runs) - now)
+
+    def next_delay(self, failures: int) -> float:
+        """Interval after success, doubled for every consecutive failure up to max_backoff, jittered"""
+        delay = min(self.interval * 2 ** failures, self.max_backoff) if failures else self.interval
+        return delay * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def _run_env(self, item: EnvSchedule) -> None:
+        error, result = None, None
+        try:
+            result = self.reconcile(item.env_name)
+            if result.get('failed'):
+                error = f"Services failed: {result['failed']}"
+        except ExecutorOverloaded as busy:
+            logger.log.info(f"{item.env_name} - reconcile deferred for {busy.retry_after}s: {busy}")
+            with self._lock:
+                item.running = False
+                item.next_run = self.clock() + busy.retry_after
+                self.deferred += 1
+            RECONCILE_RUNS.labels('deferred').inc()
+            self._wakeup.set()
+            return
+        except Exception as exception:
+            logger.log.error(f"{item.env_name} - reconcile exception: {exception}")
+            error = str(exception)
+        with self._lock:
+            item.running = False
+            item.runs += 1
+            item.last_run = time()
+            item.last_error = error
+            item.last_result = result
+            item.failures = item.failures + 1 if error else 0
+            item.next_run = self.clock() + self.next_delay(item.failures)
+            self.runs += 1
+            self.failures += bool(error)
+            self.applied += len(result['applied']) if result else 0
+        RECONCILE_RUNS.labels('failed' if error else 'ok').inc()
+        if result:
+            RECONCILE_APPLIED.inc(len(result['applied']))
+        if result and (result['applied'] or result['failed']):
+            logger.log.info(f"{item.env_name} - reconciled, applied: {result['applied']}, failed: {result['failed']}")
+        if self.on_env:
+            self.on_env(item.env_name, result, error)
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'running': self.running,
+                'interval': self.interval,
+                'envs': len(self.schedule),
+                'in_progress': sum(item.running for item in self.schedule.values()),
+                'runs': self.runs,
+                'failures': self.failures,
+                'applied': self.applied,
+                'deferred': self.deferred,
+                'backing_off': {item.env_name: item.failures for item in self.schedule.values() if item.failures},
+            }
+
+    def env_status(self, env_name: str) -> dict | None:
+        with self._lock:
+            item = self.schedule.get(env_name)
+            return item.to_dict() if item else None
@@ -0,0 +1,111 @@
+"""Immutable service config records, converted from and to SCT and services.json formats at the edges"""
+
+import functools
+
+
+# services.json field, SCT field, record attribute
+FIELDS = (
+    ('serviceName', 'name', 'service_name'),
+    ('serviceVersion', 'version', 'service_version'),
+    ('serviceInterface', 'serviceInterface', 'service_interface'),
+    ('deploymentScheme', 'deploymentScheme', 'deployment_scheme'),
+    ('location', 'location', 'location'),
+    ('physicalEnv', 'selectedPod', 'physical_env'),
+    ('ssl', 'ssl', 'ssl'),
+    ('group', 'group', 'group'),
+    ('address', 'address', 'address'),
+    ('port', 'port', 'port'),
+)
+ATTRIBUTES = tuple(attribute for _, _, attribute in FIELDS)
+
+
+@functools.total_ordering
+class ServiceRecord(object):
+    """
+    One item of service config. Records are immutable and hashable, so current services of env
+    can be shared by concurrent requests, and compared as tuples instead of diffing dicts.
+    Ordered by address, then by the rest of fields.
+    """
+    __slots__ = ATTRIBUTES + ('_hash',)
+
+    def __init__(self, service_name=None, service_version=None, service_interface=None, deployment_scheme=None,
+                 location=None, physical_env=None, ssl=None, group=None, address=None, port=None) -> None:
+        for attribute, value in zip(ATTRIBUTES, (service_name, service_version, service_interface,
+                                                 deployment_scheme, location, physical_env, ssl, group,
+                                                 address, port)):
+            object.__setattr__(self, attribute, value)
+        object.__setattr__(self, '_hash', None)
+
+    @classmethod
+    def from_dict(cls, item: dict) -> 'ServiceRecord':
+        """Record of services.json format item, e.g. parsed new config"""
+        return cls(*(item.get(field) for field, _, _ in FIELDS))
+
+    @classmethod
+    def from_sct(cls, item: dict) -> 'ServiceRecord':
+        """Record of item returned by SCT, SCT-only fields like order and pods are dropped"""
+        return cls(*(item.get(sct_field) for _, sct_field, _ in FIELDS))
+
+    def to_dict(self) -> dict:
+        """Item in services.json format, the one SCT takes and API returns"""
+        return {field: getattr(self, attribute) for field, _, attribute in FIELDS}
+
+    def to_sct(self) -> dict:
+        """Item in format SCT returns, without SCT-only fields, from_sct of it is the same record"""
+        return {sct_field: getattr(self, attribute) for _, sct_field, attribute in FIELDS}
+
+    def astuple(self) -> tuple:
+        return tuple(getattr(self, attribute) for attribute in ATTRIBUTES)
+
+    def sort_key(self) -> tuple:
+        return tuple('' if value is None else str(value) for value in (self.address,) + self.astuple())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ServiceRecord):
+            return NotImplemented
+        return self is other or self.astuple() == other.astuple()
+
+    def __lt__(self, other) -> bool:
+        if not isinstance(other, ServiceRecord):
+            return NotImplemented
+        return self.sort_key() < other.sort_key()
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(self.astuple()))
+        return self._hash
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable, can't set {name}")
+
+    def __delattr__(self, name) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable, can't delete {name}")
+
+    def __reduce__(self) -> tuple:
+        return type(self), self.astuple()
+
+    def __repr__(self) -> str:
+        return f"ServiceRecord({', '.join(f'{attribute}={getattr(self, attribute)!r}' for attribute in ATTRIBUTES)})"
+
+
+def from_sct_services(services: dict) -> dict:
+    """Records by service of SCT get_services result, in adjust_current_config order: by address"""
+    return {service: tuple(sorted((ServiceRecord.from_sct(item) for item in items), key=get_address))
+            for service, items in services.items()}
+
+
+def to_sct_services(services: dict) -> dict:
+    """SCT get_services result of records by service, e.g. to save current services of env"""
+    return {service: [record.to_sct() for record in records] for service, records in services.items()}
+
+
+def get_address(record: ServiceRecord):
+    return record.address
+
+
+def same_config(records, config: list) -> bool:
+    """Records are the same as config items in services.json format, in the same order"""
+    return isinstance(config, list) and len(records) == len(config) and all(
+        isinstance(record, ServiceRecord) and record == ServiceRecord.from_dict(item)
+        for record, item in zip(records, config)
+    )
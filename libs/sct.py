@@ -1,8 +1,14 @@
 """SCT API wrapper"""
 
+import threading
+from time import monotonic
+
 import requests
 
+from libs.accounting import accounted
 from libs.helper import get_ff
+from libs.metrics import observe_upstream
+from libs.tracing import spanned
 from api_libs.logger import Logger, log
 
 
@@ -13,11 +19,35 @@ COMMENT = f"happysct - {get_ff('USER_NAME')}"
 
 
 class SCT:
+    """
+    SCT client, shared by threads and kept by long-lived sessions.
+    Login expires, so it's renewed after SCT_SESSION_TTL seconds and when SCT reports invalid auth.
+    """
     def __init__(self) -> None:
         self.sct_url = get_ff('SCT_URL')
         self.sct_auth = {'username': get_ff('SCT_USER'), 'password': get_ff('SCT_PASS')}
         self.sct_request_headers = {'Content-Type': 'application/json'}
+        self.session_ttl = get_ff('SCT_SESSION_TTL', 1800)
+        self._session_lock = threading.Lock()
         self.session = self._create_authenticated_session()
+        self.logged_in = monotonic()
+
+    def _get_session(self, expired: requests.Session | None = None) -> requests.Session:
+        """Current session, logged in again if it's older than session_ttl or it is the expired one"""
+        with self._session_lock:
+            if self.session is expired or monotonic() - self.logged_in >= self.session_ttl:
+                logger.log.info("SCT - session expired, logging in again")
+                self.session = self._create_authenticated_session()
+                self.logged_in = monotonic()
+            return self.session
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send request, once again with new login if SCT rejects the current one"""
+        session = self._get_session()
+        response = session.request(method, url, **kwargs)
+        if self.is_auth_failed(response):
+            response = self._get_session(expired=session).request(method, url, **kwargs)
+        return response
 
     @log(logger)
     def _create_authenticated_session(self) -> requests.Session:
@@ -29,16 +59,23 @@ class SCT:
         return session
 
     @log(logger)
+    @observe_upstream('sct_login')
+    @spanned('sct_login')
+    @accounted('sct_login')
     def _login_to_sct(self, session) -> None:
         # get jwtSCTToken
         request_login = session.post(f'{self.sct_url}/login', data=self.sct_auth, timeout=5)
         request_login.raise_for_status()
 
+    def is_auth_failed(self, response: requests.models.Response) -> bool:
+        # PLA-66067 - SCT API returns 200-300 on invalid auth
+        return response.status_code == 401 or (
+            response.status_code != 204 and
+            response.headers.get('Content-Type') != self.sct_request_headers['Content-Type'])
+
     def check_response_valid(self, response: requests.models.Response) -> None:
         response.raise_for_status()
-        # PLA-66067 - SCT API returns 200-300 on invalid auth
-        if (response.status_code != 204 and
-                response.headers['Content-Type'] != self.sct_request_headers['Content-Type']):
+        if self.is_auth_failed(response):
             raise requests.HTTPError("Check your SCT credentials")
 
     def check_args(self, env_id: str, service: str = "") -> None:
@@ -46,29 +83,38 @@ class SCT:
             raise ValueError("Check your arguments")
 
     @log(logger)
+    @observe_upstream('sct_get_services')
+    @spanned('sct_get_services')
+    @accounted('sct_get_services')
     def get_services(self, envid: str = "") -> dict:
         self.check_args(envid)
-        response = self.session.get(
-            f'{self.sct_url}/service-discovery/v1/env/{envid}/sdi/services/current'
+        response = self._request(
+            'GET', f'{self.sct_url}/service-discovery/v1/env/{envid}/sdi/services/current'
         )
         self.check_response_valid(response)
         return response.json()
 
     @log(logger)
+    @observe_upstream('sct_register')
+    @spanned('sct_register')
+    @accounted('sct_register')
     def update_service(self, service: str, envid: str = "", input_data: list = []) -> bool:
         self.check_args(envid, service=service)
         service_data = {
             "comment": COMMENT,
             "services": input_data
         }
-        response = self.session.post(
-            f'{self.sct_url}/service-discovery/v1/env/{envid}/services/registration',
+        response = self._request(
+            'POST', f'{self.sct_url}/service-discovery/v1/env/{envid}/services/registration',
             json=service_data
         )
         self.check_response_valid(response)
         return response.ok
 
     @log(logger)
+    @observe_upstream('sct_delete')
+    @spanned('sct_delete')
+    @accounted('sct_delete')
     def delete_service(self, service: str, envid: str = "") -> bool:
         self.check_args(envid, service=service)
 
@@ -80,8 +126,8 @@ class SCT:
             item["physicalEnv"] = item.get("selectedPod", None)
             item["comment"] = COMMENT
 
-            response = self.session.post(
-                f'{self.sct_url}/service-discovery/v1/env/{envid}/services/{service}/delete',
+            response = self._request(
+                'POST', f'{self.sct_url}/service-discovery/v1/env/{envid}/services/{service}/delete',
                 json=item
             )
             self.check_response_valid(response)
@@ -89,23 +135,29 @@ class SCT:
         return response.ok if response else False
 
     @log(logger)
+    @observe_upstream('sct_get_schemes')
+    @spanned('sct_get_schemes')
+    @accounted('sct_get_schemes')
     def get_deployment_schemes(self, envid: str = "") -> dict:
         self.check_args(envid)
-        response = self.session.get(
-            f'{self.sct_url}/service-discovery/v1/env/{envid}/sdi/deployment-schemes'
+        response = self._request(
+            'GET', f'{self.sct_url}/service-discovery/v1/env/{envid}/sdi/deployment-schemes'
         )
         self.check_response_valid(response)
         return response.json()
 
     @log(logger)
+    @observe_upstream('sct_register_schemes')
+    @spanned('sct_register_schemes')
+    @accounted('sct_register_schemes')
     def update_deployment_schemes(self, envid: str = "", input_data: list = []) -> bool:
         self.check_args(envid)
         deployment_schemes_data = {
             "comment": COMMENT,
             "deploymentSchemes": input_data
         }
-        response = self.session.post(
-            f'{self.sct_url}/service-discovery/v1/env/{envid}/deployment-schemes/registration',
+        response = self._request(
+            'POST', f'{self.sct_url}/service-discovery/v1/env/{envid}/deployment-schemes/registration',
             json=deployment_schemes_data
         )
         self.check_response_valid(response)
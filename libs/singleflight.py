@@ -0,0 +1,54 @@
+"""Coalescing of concurrent identical calls"""
+
+import threading
+
+
+class _Call(object):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Concurrent calls with the same key share one in-flight computation:
+    the first caller runs it, others wait and get the same result or exception.
+    Nothing is cached after the call is finished.
+    """
+    def __init__(self) -> None:
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = dict()
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._in_flight)}
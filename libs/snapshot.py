@@ -0,0 +1,173 @@
+"""
+Env snapshots: current services, env metadata, pod hosts and host variables saved to gzipped json,
+so diff and show run offline against local services catalog.
+"""
+
+import copy
+import gzip
+import json
+import threading
+from time import time
+
+from api_libs.logger import Logger
+from libs.cache import MemoryCache
+from libs.core import RolloutSession, SCTManager, run_concurrently
+from libs.records import to_sct_services
+
+
+logger = Logger()
+
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotError(Exception):
+    """Snapshot can't serve the request: other env, write call or unsupported version"""
+
+
+def get_snapshot_file(env_name: str) -> str:
+    return f"{env_name.lower()}.snapshot.json.gz"
+
+
+def get_pods(services_config: dict) -> list:
+    """Pods hosts are looked up by: every service and source service of catalog"""
+    pods = set(services_config)
+    pods.update(config_data[0]['address']['source_service'] for config_data in services_config.values()
+                if config_data[0]['address']['source_service'])
+    return sorted(pods)
+
+
+def export_env(env_name: str, session: RolloutSession | None = None, variables: list | None = None) -> dict:
+    """
+    Read everything diff and show need from SCT and ADS. Hosts are looked up for every pod of the catalog,
+    on shared env only if local env has none, the same way SCTManager does.
+
+    :param variables: ADS variables to calculate on top of the ones catalog requires, for catalog changes
+        adding new variables. Variables missing in snapshot resolve to empty string offline.
+    """
+    session = session or RolloutSession()
+    sct_manager = SCTManager(env_name, session=session)
+    hosts = {'local': dict(), 'shared': dict()}
+    lock = threading.Lock()
+
+    def _lookup_hosts(pod):
+        # empty lookups are not stored, offline lookup of missing pod returns no hosts
+        if local_hosts := sct_manager._get_service_hosts(sct_manager.env_local, pod):
+            with lock:
+                hosts['local'][pod] = local_hosts
+        elif shared_hosts := sct_manager._get_service_hosts(sct_manager.env_shared, pod):
+            with lock:
+                hosts['shared'][pod] = shared_hosts
+
+    run_concurrently(_lookup_hosts, get_pods(session.services_config))
+
+    required_variables = sorted(set(session.required_variables) | set(variables or []))
+    host_variables = dict()
+
+    def _calculate_variables(host):
+        values = sct_manager._calculate_server_variables(host, required_variables)
+        with lock:
+            host_variables[host] = values
+
+    run_concurrently(_calculate_variables, sorted({host for by_pod in hosts.values()
+                                                   for pod_hosts in by_pod.values() for host in pod_hosts}))
+    return {
+        'version': SNAPSHOT_VERSION,
+        'created': time(),
+        'env_name': env_name,
+        'env': {'id': sct_manager.env_id, 'name': sct_manager.env_local_name, 'location': sct_manager.env_location,
+                'shared_env_name': sct_manager.shared_env_name},
+        # services read by manager init, second SCT call would cost time and could disagree with the first
+        'services': to_sct_services(sct_manager.env_services),
+        'hosts': hosts,
+        'variables': host_variables,
+    }
+
+
+def save_snapshot(snapshot: dict, file: str) -> None:
+    with gzip.open(file, 'wt') as f:
+        json.dump(snapshot, f, default=str)
+
+
+def load_snapshot(file: str) -> dict:
+    with gzip.open(file, 'rt') as f:
+        snapshot = json.load(f)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {snapshot.get('version')} of {file}, "
+                            f"export it again")
+    return snapshot
+
+
+class SnapshotENV(object):
+    """ADS env served from snapshot, the same interface as libs.ads_wrapper.ENV"""
+    def __init__(self, name: str, hosts: dict, info: dict | None = None) -> None:
+        self.name = name
+        self.hosts = hosts
+        self.info = info or dict()
+        self.id = self.info.get('id')
+
+    def getlocation(self) -> str:
+        return self.info['location']
+
+    def get_shared_env(self) -> str:
+        return self.info['shared_env_name']
+
+    def get_service_host_by_pod(self, pod: str) -> list:
+        return list(self.hosts.get(pod, []))
+
+    def get_pop_server_location(self) -> dict:
+        raise SnapshotError("Snapshot has no POPs, deployment schemes need live env")
+
+
+class SnapshotADS(object):
+    """ADS served from snapshot, only variables calculated at export are known"""
+    def __init__(self, variables: dict) -> None:
+        self.variables = variables
+
+    def calculate_server_variables(self, host: str, variables: list) -> dict:
+        values = self.variables.get(host, {})
+        return {variable: values[variable] for variable in variables if variable in values}
+
+
+class SnapshotSCT(object):
+    """Read-only SCT served from snapshot"""
+    def __init__(self, env_id: str, services: dict) -> None:
+        self.env_id = env_id
+        self.services = services
+
+    def get_services(self, envid: str = "") -> dict:
+        return copy.deepcopy(self.services) if envid == self.env_id else dict()
+
+    def update_service(self, service: str, envid: str = "", input_data: list = []) -> bool:
+        raise SnapshotError("Snapshot is read-only")
+
+    def delete_service(self, service: str, envid: str = "") -> bool:
+        raise SnapshotError("Snapshot is read-only")
+
+    def update_deployment_schemes(self, envid: str = "", input_data: list = []) -> bool:
+        raise SnapshotError("Snapshot is read-only")
+
+
+class SnapshotSession(RolloutSession):
+    """
+    RolloutSession served from env snapshot, no SCT and ADS calls.
+    Services catalog is the local one, so its changes can be diffed against snapshot offline.
+    """
+    def __init__(self, snapshot: dict, services_config: dict | None = None) -> None:
+        super().__init__(cache=MemoryCache('snapshot'), services_config=services_config)
+        self.snapshot = snapshot
+        env = snapshot['env']
+        self._sct = SnapshotSCT(env['id'], snapshot['services'])
+        self._ads = SnapshotADS(snapshot['variables'])
+
+    @classmethod
+    def from_file(cls, file: str, services_config: dict | None = None) -> 'SnapshotSession':
+        return cls(load_snapshot(file), services_config=services_config)
+
+    def get_env(self, name: str) -> SnapshotENV:
+        env = self.snapshot['env']
+        if name.upper() not in (env['name'].upper(), self.snapshot['env_name'].upper()):
+            raise SnapshotError(f"Snapshot is of env {self.snapshot['env_name']}, not {name}")
+        return SnapshotENV(env['name'], self.snapshot['hosts']['local'], info=env)
+
+    def get_shared_env(self, name: str) -> SnapshotENV:
+        return SnapshotENV(name, self.snapshot['hosts']['shared'])
@@ -0,0 +1,33 @@
+"""Per-stage timings"""
+
+from contextlib import contextmanager
+import threading
+from time import perf_counter
+
+
+class Timings(object):
+    """Monotonic-clock durations of named stages in seconds, repeated stage accumulates"""
+    def __init__(self) -> None:
+        self.stages = dict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0) + seconds
+
+    def merge(self, other: dict) -> None:
+        """Add stages of other timings dict, e.g. to sum services up to env"""
+        for name, seconds in other.items():
+            self.add(name, seconds)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {name: round(seconds, 4) for name, seconds in self.stages.items()}
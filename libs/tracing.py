@@ -0,0 +1,291 @@
+"""Low-overhead tracing of hot-path calls and spans of operations exported as OpenTelemetry JSON"""
+
+import atexit
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from time import monotonic, perf_counter, sleep, time_ns
+
+import requests
+
+from api_libs.logger import Logger
+from libs.helper import get_ff
+
+
+logger = Logger()
+
+
+class Tracer(object):
+    """
+    Sampled spans of hot-path calls, an alternative to @log for inner loops.
+    Enabled only when log level is DEBUG and TRACE_SAMPLE_RATE > 0, otherwise
+    traced call costs one attribute check. Enabled tracer records sample_rate share
+    of calls: duration, truncated arguments and return, and logs them at DEBUG.
+    """
+    def __init__(self, name: str, sample_rate: float | None = None, max_spans: int = 1000) -> None:
+        self.name = name
+        self.spans = deque(maxlen=max_spans)
+        self.enabled = False
+        self.sample_rate = 0
+        self.configure(sample_rate)
+
+    def configure(self, sample_rate: float | None = None, enabled: bool | None = None) -> None:
+        """Apply settings, e.g. after log level is changed"""
+        self.sample_rate = get_ff('TRACE_SAMPLE_RATE', 0.01) if sample_rate is None else sample_rate
+        if enabled is None:
+            enabled = logger.log.isEnabledFor(logging.DEBUG)
+        self.enabled = enabled and self.sample_rate > 0
+
+    def record(self, name: str, duration: float, args: tuple = (), kwargs: dict | None = None,
+               result=None, error: Exception | None = None) -> None:
+        max_length = get_ff('RETURN_LOG_MAX_LENGTH', 200) or None
+        span = {
+            'name': name,
+            'duration': duration,
+            'args': repr(args)[:max_length],
+            'kwargs': repr(kwargs or {})[:max_length],
+            'result': repr(result)[:max_length],
+            'error': repr(error) if error else None,
+        }
+        self.spans.append(span)
+        logger.log.debug(f"{self.name} span {name} - {duration * 1000:.3f} ms, args: {span['args']}, "
+                         f"kwargs: {span['kwargs']}, return: {span['result']}, error: {span['error']}")
+
+    def stats(self) -> dict:
+        """Recorded spans count, total and max duration by name"""
+        data = dict()
+        for span in list(self.spans):
+            item = data.setdefault(span['name'], {'count': 0, 'total': 0, 'max': 0})
+            item['count'] += 1
+            item['total'] = round(item['total'] + span['duration'], 6)
+            item['max'] = max(item['max'], round(span['duration'], 6))
+        return data
+
+
+def traced(tracer: Tracer, name: str | None = None):
+    """Decorator, record sampled spans of function calls in tracer"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+        # self is not worth logging
+        skip = 1 if func.__code__.co_varnames[:1] == ('self',) else 0
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled or random.random() >= tracer.sample_rate:
+                return func(*args, **kwargs)
+            result, error = None, None
+            start = perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except Exception as exc:
+                error = exc
+                raise
+            finally:
+                tracer.record(span_name, perf_counter() - start, args[skip:], kwargs, result, error)
+        return wrapper
+    return decorator
+
+
+class Span(object):
+    """Timed operation, child of the span that was current when it started"""
+    def __init__(self, name: str, parent: 'Span | None' = None, attributes: dict | None = None) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start = time_ns()
+        self.end = None
+        self.error = None
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [to_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def to_otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class SpanExporter(object):
+    """
+    Collect finished spans by trace and export the trace when its root span ends:
+    as OTLP JSON line to file, or POST to OpenTelemetry collector if target is http(s) URL.
+    Traces are exported by background thread, so request handlers never wait for the collector;
+    traces above max_queue waiting for export are dropped. Queued traces are flushed at exit.
+    Disabled exporter (empty target) makes spans no-op.
+    """
+    def __init__(self, target: str = '', service_name: str = 'happysct', max_spans: int = 100000,
+                 max_queue: int = 1000) -> None:
+        self.target = target
+        self.service_name = service_name
+        self.max_spans = max_spans
+        self.exported = 0
+        self.dropped = 0
+        self._traces = dict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.target)
+
+    def start(self, span: Span) -> None:
+        if span.parent_id is None:
+            with self._lock:
+                self._traces[span.trace_id] = list()
+
+    def finish(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if span.parent_id is None:
+                self._traces.pop(span.trace_id, None)
+            elif spans is not None and len(spans) >= self.max_spans:
+                self.dropped += 1
+                return
+            elif spans is not None:
+                spans.append(span)
+                return
+        # root span, or child finished after its root, e.g. in background thread
+        self.submit((spans or []) + [span])
+
+    def submit(self, spans: list) -> None:
+        """Queue trace for export by background thread, drop it if the queue is full"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(spans)
+            logger.log.warning(f"Tracing - export queue is full, {len(spans)} spans dropped")
+
+    def flush(self, timeout: float = 5) -> bool:
+        """Wait until queued traces are exported, False if timeout expired first"""
+        deadline = monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if monotonic() > deadline:
+                return False
+            sleep(0.01)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            try:
+                self.export(spans)
+            finally:
+                self._queue.task_done()
+
+    def to_otlp(self, spans: list) -> dict:
+        return {'resourceSpans': [{
+            'resource': {'attributes': [to_otlp_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{'scope': {'name': 'happysct'}, 'spans': [span.to_otlp() for span in spans]}],
+        }]}
+
+    def export(self, spans: list) -> None:
+        data = self.to_otlp(spans)
+        try:
+            if self.target.startswith(('http://', 'https://')):
+                requests.post(self.target, json=data, timeout=5).raise_for_status()
+            else:
+                with self._lock, open(self.target, 'a') as f:
+                    f.write(json.dumps(data) + '\n')
+        except Exception as error:
+            logger.log.warning(f"Tracing - can't export {len(spans)} spans to {self.target}: {error}")
+            return
+        with self._lock:
+            self.exported += len(spans)
+
+
+current_span = contextvars.ContextVar('current_span', default=None)
+exporter = SpanExporter(get_ff('TRACE_EXPORT', ''))
+
+
+def configure_export(target: str, service_name: str = 'happysct') -> SpanExporter:
+    """Replace span exporter, e.g. for CLI option or tests"""
+    global exporter
+    exporter = SpanExporter(target, service_name=service_name)
+    return exporter
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Start span as child of current span, yields None if export is disabled"""
+    if not exporter.enabled:
+        yield None
+        return
+    item = Span(name, parent=current_span.get(), attributes=attributes)
+    span_exporter = exporter
+    span_exporter.start(item)
+    token = current_span.set(item)
+    try:
+        yield item
+    except Exception as error:
+        item.error = f'{type(error).__name__}: {error}'
+        raise
+    finally:
+        current_span.reset(token)
+        item.end = time_ns()
+        span_exporter.finish(item)
+
+
+def spanned(name: str | None = None):
+    """Decorator, run function in span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not exporter.enabled:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_span_attributes(**attributes) -> None:
+    item = current_span.get()
+    if item is not None:
+        item.set_attributes(**attributes)
+
+
+def in_current_context(func):
+    """
+    Bind func to a copy of current context, so spans it starts in worker thread are children
+    of the caller's span. Bind once per submit, one context can't run in two threads at once.
+    """
+    return functools.partial(contextvars.copy_context().run, func)
@@ -1,66 +1,74 @@
 """Run services update to Lab envs"""
 
-import os
 import sys
 
 import fire
-import requests
 
-from happysct import CLI, pp
-from libs.helper import get_ff, load_json
+from happysct import CLI, pp, print_calls_table
+from libs.accounting import accounting
+from libs.core import RolloutSession, get_environments_list
+from libs.output import get_writer
+from libs.profiler import pop_profile_args, profiled
+from libs.tracing import span
 from api_libs.logger import Logger
 
 
 logger = Logger()
 
 
-def get_environments_list(file: str = None) -> list:
-    if file:
-        with open(file, 'r') as f:
-            return [line.strip() for line in f if line.strip()]
-
-    r = requests.get(get_ff("ENVS_URL"))
-    r.raise_for_status()
-    lab_envs = r.json()
-
-    blacklist_envs_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                            "conf", "blacklist_envs.json")
-    blacklist_envs = load_json(blacklist_envs_file_path)
-
-    for group in blacklist_envs.get("GROUPS", []):
-        lab_envs.pop(group, None)
-
-    environments_list = [env for env_group in lab_envs for env in lab_envs[env_group] if
-                         env not in blacklist_envs.get("ENVS", [])]
-    return environments_list
-
-
-def rollout(only='', force=False, custom_env_list_file: str = None) -> None:
-    cli = CLI()
+def rollout(only='', force=False, custom_env_list_file: str = None, output='', output_file='',
+            calls=False) -> None:
+    """
+    Args:
+        calls: If True, shows SCT and ADS calls of the whole rollout by endpoint and repeated calls
+            with the same arguments, e.g. shared env lookups repeated for every env.
+    """
+    writer = get_writer(output, output_file)
+    # catalog, SCT login, ADS client and shared envs are reused across all envs
+    cli = CLI(writer=writer, session=RolloutSession())
     environments_list = get_environments_list(file=custom_env_list_file)
 
     completed_environments = list()
     failed_environments = list()
 
-    for env in environments_list:
-        pp(f"\n{env}")
-        logger.log.info(env)
-        try:
-            cli.update(env_name=env, only=only, force=force)
-            completed_environments.append(env)
-        except Exception as error:
-            logger.log.error(f'Exception: {error}')
-            failed_environments.append(env)
-
-    logger.log.info(f"Failed envs - {len(failed_environments)}: {failed_environments}")
-    logger.log.info(f"Completed envs - {len(completed_environments)}: {completed_environments}")
+    try:
+        with accounting(calls) as calls_accounting:
+            for env in environments_list:
+                pp(f"\n{env}")
+                logger.log.info(env)
+                try:
+                    cli.update(env_name=env, only=only, force=force)
+                    completed_environments.append(env)
+                    if writer:
+                        writer.write({'type': 'rollout', 'env': env, 'status': True, 'error': None})
+                except Exception as error:
+                    logger.log.error(f'Exception: {error}')
+                    failed_environments.append(env)
+                    if writer:
+                        writer.write({'type': 'rollout', 'env': env, 'status': False, 'error': str(error)})
+
+        logger.log.info(f"Failed envs - {len(failed_environments)}: {failed_environments}")
+        logger.log.info(f"Completed envs - {len(completed_environments)}: {completed_environments}")
+        if writer:
+            writer.write({'type': 'rollout_summary', 'failed': failed_environments,
+                          'completed': completed_environments})
+        if calls_accounting:
+            report = calls_accounting.report()
+            print_calls_table(report)
+            if writer:
+                writer.write({'type': 'calls', **report})
+    finally:
+        if writer:
+            writer.close()
 
     if failed_environments:
         sys.exit(1)
 
 
 def main() -> None:
-    fire.Fire(rollout)
+    args, profile_options = pop_profile_args(sys.argv[1:])
+    with profiled(profile_options), span('rollout'):
+        fire.Fire(rollout, command=args)
 
 
 if __name__ == "__main__":
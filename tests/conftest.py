@@ -2,9 +2,17 @@ import copy
 
 import pytest
 
+import conf.settings as settings
 from libs.parser import NewConfigParser
 
 
+@pytest.fixture(autouse=True)
+def stamps_dir(monkeypatch, tmp_path):
+    """Stamps of each test in its own dir, not in per user temp dir shared with CLI runs and other tests"""
+    monkeypatch.setattr(settings, 'STAMPS_DIR', str(tmp_path / 'stamps'), raising=False)
+    return tmp_path / 'stamps'
+
+
 @pytest.fixture
 def new_config_parser(test_data):
     test_data = copy.deepcopy(test_data)
@@ -0,0 +1,59 @@
+import concurrent.futures
+
+from libs import accounting
+from libs.tracing import in_current_context
+
+
+def test_report_counts_duplicates():
+    calls = accounting.CallAccounting()
+    calls.record('sct_get_services', '100')
+    calls.record('sct_get_services', '100')
+    calls.record('sct_get_services', '200')
+    calls.record('ads_variables', 'host1', ['var1', 'var2'])
+
+    report = calls.report()
+
+    assert report['total'] == 4
+    assert report['unique'] == 3
+    assert report['duplicates'] == 1
+    assert report['endpoints']['sct_get_services'] == {'calls': 3, 'unique': 2, 'duplicates': 1}
+    assert report['top_duplicates'] == [{'endpoint': 'sct_get_services', 'args': '100', 'count': 2}]
+
+
+def test_format_arg_hashes_collections():
+    assert accounting.format_arg('host1') == 'host1'
+    assert accounting.format_arg(['var1', 'var2']) == accounting.format_arg(['var1', 'var2'])
+    assert accounting.format_arg(['var1', 'var2']).startswith('list[2]#')
+    assert accounting.format_arg(['var1']) != accounting.format_arg(['var2'])
+
+
+def test_account_outside_of_run_is_noop():
+    accounting.account('sct_get_services', '100')
+
+    with accounting.accounting(enabled=False) as calls:
+        accounting.account('sct_get_services', '100')
+
+    assert calls is None
+    assert accounting.current_accounting.get() is None
+
+
+def test_accounting_in_worker_threads():
+    with accounting.accounting() as calls:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            for host in ['host1', 'host2', 'host1']:
+                executor.submit(in_current_context(accounting.account), 'ads_variables', host)
+
+    assert calls.report()['endpoints']['ads_variables'] == {'calls': 3, 'unique': 2, 'duplicates': 1}
+
+
+def test_accounted_skips_self():
+    class Client(object):
+        @accounting.accounted('sct_delete')
+        def delete_service(self, service, envid=''):
+            return True
+
+    with accounting.accounting() as calls:
+        Client().delete_service('service', envid='100')
+        Client().delete_service('service', envid='100')
+
+    assert calls.report()['top_duplicates'] == [{'endpoint': 'sct_delete', 'args': 'service, envid=100', 'count': 2}]
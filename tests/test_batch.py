@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+import happysct
+from libs import batch
+
+
+@pytest.fixture
+def mock_filter_services(mocker):
+    return mocker.patch('libs.batch.filter_services', return_value=['service1', 'service2'])
+
+
+def test_load_operations(tmp_path):
+    yaml_file = tmp_path / 'batch.yaml'
+    yaml_file.write_text("defaults: {only: ace, force: true}\n"
+                         "operations:\n"
+                         "  - {command: update, env: env1}\n"
+                         "  - {command: diff, env: [env2, env3], only: [rmx, ace]}\n")
+    json_file = tmp_path / 'batch.json'
+    json_file.write_text(json.dumps([{'command': 'show', 'env': 'env1', 'exclude': 'ace'}]))
+
+    assert batch.load_operations(str(yaml_file)) == [
+        {'command': 'update', 'env': 'env1', 'only': 'ace', 'force': True},
+        {'command': 'diff', 'env': 'env2', 'only': 'rmx,ace'},
+        {'command': 'diff', 'env': 'env3', 'only': 'rmx,ace'},
+    ]
+    assert batch.load_operations(str(json_file)) == [{'command': 'show', 'env': 'env1', 'exclude': 'ace'}]
+
+
+@pytest.mark.parametrize('data', [
+    {'command': 'update', 'env': 'env1'},
+    [{'command': 'delete', 'env': 'env1'}],
+    [{'command': 'diff'}],
+    [{'command': 'diff', 'env': 'env1', 'force': True}],
+    {'defaults': {'forse': True}, 'operations': [{'command': 'update', 'env': 'env1'}]},
+    [{'command': 'update', 'env': 'env1', 'force': 'false'}],
+    {'defaults': {'timings': 1}, 'operations': [{'command': 'diff', 'env': 'env1'}]},
+    [{'command': 'show', 'env': 'env1', 'only': {'ace': True}}],
+    [{'command': 'show', 'env': 'env1', 'exclude': ['ace', 1]}],
+])
+def test_parse_operations_invalid(data):
+    with pytest.raises(ValueError):
+        batch.parse_operations(data)
+
+
+def test_run_batch(mocker, mock_filter_services):
+    managers = {'env1': mocker.MagicMock(), 'env2': mocker.MagicMock()}
+    managers['env1'].update_services.return_value = {'failed': [], 'added': ['service1'], 'recreated': [],
+                                                     'skipped': ['service2'], 'by_service': {}}
+    managers['env1'].diff_services.return_value = {'add': [], 'recreate': [], 'fail': [],
+                                                   'skip': ['service1', 'service2'], 'by_service': {}}
+    managers['env2'].get_current.return_value = [{'serviceName': 'service'}]
+    built = list()
+
+    def _factory(env_name):
+        built.append(env_name)
+        return managers[env_name]
+    operations = [{'command': 'update', 'env': 'env1', 'force': True}, {'command': 'show', 'env': 'env2'},
+                  {'command': 'diff', 'env': 'env1'}, {'command': 'diff', 'env': 'env3'}]
+    on_operation = mocker.MagicMock()
+
+    result = batch.run_batch(operations, manager_factory=_factory, on_operation=on_operation)
+
+    assert result['status'] is False
+    assert result['failed'] == [3]
+    assert [record['index'] for record in result['operations']] == [0, 1, 2, 3]
+    assert result['operations'][0]['result']['added'] == ['service1']
+    assert 'by_service' not in result['operations'][0]['result']
+    assert result['operations'][1]['result'] == {'service1': [{'serviceName': 'service'}],
+                                                 'service2': [{'serviceName': 'service'}]}
+    assert result['operations'][2]['result'] == {'add': [], 'recreate': [], 'fail': [], 'skip': 2}
+    # one manager per env, refreshed after update so diff sees written services
+    assert sorted(built) == ['env1', 'env2', 'env3']
+    managers['env1'].update_services.assert_called_once_with(['service1', 'service2'], force=True, executor=None,
+                                                             timings=False)
+    managers['env1'].refresh.assert_called_once()
+    assert on_operation.call_count == 4
+
+
+def test_run_operation_diff_fail(mocker, mock_filter_services):
+    manager = mocker.MagicMock()
+    manager.diff_services.return_value = {'add': [], 'recreate': [], 'fail': ['service1'], 'skip': ['service2'],
+                                          'by_service': {}}
+
+    status, result = batch.run_operation(manager, {'command': 'diff', 'env': 'env1'})
+
+    assert status is False
+    assert result['fail'] == ['service1']
+
+
+def test_run_batch_update_failed(mocker, mock_filter_services):
+    manager = mocker.MagicMock()
+    manager.update_deployment_schemes.return_value = {'status': False}
+
+    result = batch.run_batch([{'command': 'update', 'env': 'env1', 'schemes': True}],
+                             manager_factory=lambda env_name: manager)
+
+    assert result['failed'] == [0]
+    assert result['operations'][0]['result'] == {'schemes': {'status': False}}
+    manager.update_services.assert_not_called()
+
+
+def test_cli_batch(mocker, tmp_path):
+    file = tmp_path / 'batch.json'
+    file.write_text(json.dumps([{'command': 'diff', 'env': 'env1'}, {'command': 'diff', 'env': 'env2'}]))
+    output_file = tmp_path / 'result.ndjson'
+
+    def _run_batch(operations, on_operation, **kwargs):
+        records = [{'index': index, **operation, 'status': index == 0, 'error': None, 'duration': 0.1,
+                    'result': None} for index, operation in enumerate(operations)]
+        for record in records:
+            on_operation(record)
+        return {'status': False, 'total': 2, 'failed': [1], 'operations': records}
+    mock_run_batch = mocker.patch('libs.batch.run_batch', side_effect=_run_batch)
+
+    with pytest.raises(RuntimeError):
+        happysct.CLI().batch(str(file), output='ndjson', output_file=str(output_file))
+
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert [record['type'] for record in records] == ['operation', 'operation', 'batch']
+    assert records[-1] == {'type': 'batch', 'status': False, 'total': 2, 'failed': [1]}
+    assert mock_run_batch.call_args.kwargs['max_workers'] == 4
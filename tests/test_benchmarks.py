@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from benchmarks import run
+
+
+def make_report(**medians):
+    return {'meta': {}, 'results': {case: {'median': median} for case, median in medians.items()}}
+
+
+def test_compare():
+    baseline = make_report(parser=1.0, update_env=2.0, schemes=0.5)
+    report = make_report(parser=1.1, update_env=2.6, schemes=0.1, diff_env=1.0)
+
+    regressions = run.compare(report, baseline, threshold=0.2)
+
+    assert regressions == [{'case': 'update_env', 'baseline': 2.0, 'current': 2.6, 'ratio': 1.3}]
+
+
+def test_run_benchmarks():
+    report = run.run_benchmarks(scale='small', cases='filter_services,parser,update_env,diff_env', repeat=1)
+
+    assert set(report['results']) == {'filter_services', 'parser', 'update_env', 'diff_env'}
+    assert report['meta']['services'] == 10
+    update_env = report['results']['update_env']
+    assert update_env['items'] == 10
+    assert update_env['upstream_calls_total']['sct_register'] > 0
+    # services are up to date after update, diff doesn't write
+    assert 'sct_register' not in report['results']['diff_env']['upstream_calls_total']
+
+
+def test_benchmark_regression_fails(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(make_report(filter_services=1e-9)))
+    output = tmp_path / 'report.json'
+
+    with pytest.raises(SystemExit):
+        run.benchmark(scale='small', cases='filter_services', repeat=1, output=str(output),
+                      baseline=str(baseline))
+
+    assert json.loads(output.read_text())['results']['filter_services']['items'] == 10
+
+
+def test_run_benchmarks_unknown_scale():
+    with pytest.raises(ValueError):
+        run.run_benchmarks(scale='huge')
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from libs import cache
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def test_cache(request, tmp_path):
+    if request.param == 'sqlite':
+        return cache.SQLiteCache(str(tmp_path / 'cache.sqlite'), ttl=60, max_size=2)
+    return cache.MemoryCache(ttl=60, max_size=2)
+
+
+def test_cache_get_set(test_cache):
+    assert test_cache.get('env_metadata:lab-lem-ams') is None
+
+    test_cache.set('env_metadata:lab-lem-ams', {'id': '1747', 'location': 'ams02'})
+
+    assert test_cache.get('env_metadata:lab-lem-ams') == {'id': '1747', 'location': 'ams02'}
+    assert test_cache.stats()['hits'] == 1
+    assert test_cache.stats()['misses'] == 1
+
+
+def test_cache_ttl(test_cache):
+    test_cache.set('key', 'value', ttl=0.01)
+    time.sleep(0.02)
+
+    assert test_cache.get('key') is None
+
+
+def test_cache_size_eviction(test_cache):
+    test_cache.set('first', 1)
+    time.sleep(0.01)
+    test_cache.set('second', 2)
+    time.sleep(0.01)
+    assert test_cache.get('first') == 1
+    time.sleep(0.01)
+    test_cache.set('third', 3)
+
+    # least recently used is evicted
+    assert test_cache.get('second') is None
+    assert test_cache.get('first') == 1
+    assert test_cache.get('third') == 3
+    assert test_cache.stats()['size'] == 2
+    assert test_cache.stats()['evictions'] == 1
+
+
+def test_cache_get_or_set(test_cache):
+    calls = []
+
+    def _func():
+        calls.append(1)
+        return {'var1': 'value1'}
+
+    assert test_cache.get_or_set('key', _func) == {'var1': 'value1'}
+    assert test_cache.get_or_set('key', _func) == {'var1': 'value1'}
+    assert len(calls) == 1
+
+
+def test_sqlite_cache_shared(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    first = cache.SQLiteCache(path)
+    second = cache.SQLiteCache(path)
+
+    first.set('key', {'var1': 'value1'})
+
+    assert second.get('key') == {'var1': 'value1'}
+
+
+def test_get_cache(mocker, tmp_path):
+    settings = {'CACHE_PATH': str(tmp_path / 'cache.sqlite')}
+    mocker.patch('libs.cache.get_ff', side_effect=lambda name, default=None: settings.get(name, default))
+
+    assert isinstance(cache.get_cache(), cache.MemoryCache)
+    assert isinstance(cache.get_cache(backend='sqlite'), cache.SQLiteCache)
+    assert not isinstance(cache.get_cache(backend='sqlite'), cache.MemoryCache)
+    assert all(isinstance(cache.get_cache(backend=backend), cache.Cache) for backend in cache.CACHE_BACKENDS)
+    with pytest.raises(ValueError):
+        cache.get_cache(backend='redis')
+
+
+def test_cache_backend_must_implement_interface():
+    class NoClearCache(cache.Cache):
+        def get(self, key):
+            return None
+
+        def set(self, key, value, ttl=None):
+            pass
+
+        def delete(self, key):
+            pass
+
+    with pytest.raises(TypeError):
+        NoClearCache()
@@ -5,6 +5,8 @@ import pytest
 from requests import HTTPError
 
 from libs import core
+from libs.accounting import accounting
+from libs.cache import MemoryCache
 
 
 @pytest.fixture
@@ -14,6 +16,9 @@ def mock_load_json(mocker):
 
 @pytest.fixture
 def mock_validate(mocker):
+    # validation result of the real files must not be reused
+    mocker.patch("libs.core.read_stamp", return_value=None)
+    mocker.patch("libs.core.write_stamp")
     return mocker.patch("libs.core.validate")
 
 
@@ -286,3 +291,196 @@ def test_update_deployment_schemes(mock_load_json, mock_sct_manager,
     assert result
     assert result['status']
     assert 'test-1dc' in result['message']
+
+
+def test_rollout_session_shared_by_managers(mocker, test_data, mock_read_services_config):
+    env_mock = mocker.MagicMock()
+    env_mock.id = test_data['env_id']
+    env_mock.name = test_data['env_name']
+    env_mock.get_shared_env.return_value = test_data['env_name_shared']
+    mock_env = mocker.patch('libs.core.ENV', return_value=env_mock)
+    mock_ads = mocker.patch('libs.core.ADS')
+    mock_sct = mocker.patch('libs.core.SCT')
+
+    session = core.RolloutSession()
+    first = core.SCTManager(env_name='env1', session=session)
+    second = core.SCTManager(env_name='env2', session=session)
+
+    assert first.sct is second.sct
+    assert first.env_shared is second.env_shared
+    assert mock_sct.call_count == 1
+    assert mock_ads.call_count == 1
+    # two local envs and one shared env
+    assert mock_env.call_count == 3
+    assert session.services_config is session.services_config
+    assert mock_read_services_config.call_count == 1
+
+
+def test_sct_manager_uses_session_cache(mocker, test_data):
+    env_mock = mocker.MagicMock()
+    env_mock.id = test_data['env_id']
+    env_mock.name = test_data['env_name']
+    env_mock.getlocation.return_value = test_data['env_location']
+    env_mock.get_shared_env.return_value = test_data['env_name_shared']
+    env_mock.get_service_host_by_pod.return_value = ['host1']
+    mock_env = mocker.patch('libs.core.ENV', return_value=env_mock)
+    mock_ads = mocker.patch('libs.core.ADS')
+    mock_ads.return_value.calculate_server_variables.return_value = {'var1': 'value1'}
+    mocker.patch('libs.core.SCT')
+
+    session = core.RolloutSession(cache=MemoryCache())
+    first = core.SCTManager(env_name='env1', session=session)
+    first.get_service_host_info('service1', None, ['var1'])
+    # the second manager of the same env takes metadata and host variables from cache
+    second = core.SCTManager(env_name='env1', session=session)
+    hosts_info = second.get_service_host_info('service2', None, ['var1'])
+
+    assert second.env_location == test_data['env_location']
+    assert hosts_info == {'host1': {'var1': 'value1'}}
+    assert mock_ads.return_value.calculate_server_variables.call_count == 1
+    # local env for the first manager, shared env, local env for host lookup of the second manager
+    assert mock_env.call_count == 3
+
+
+@pytest.mark.parametrize(("update_result", "state"), [
+    ({'status': False, 'message': 'service not present on env'}, 'skipped'),
+    ({'status': False, 'message': 'HTTPError'}, 'failed'),
+    ({'status': True, 'updated': False}, 'skipped'),
+    ({'status': True, 'updated': True, 'old_deleted': True}, 'recreated'),
+    ({'status': True, 'updated': True, 'old_deleted': False}, 'added'),
+])
+def test_get_update_state(update_result, state):
+    assert core.get_update_state(update_result) == state
+
+
+@pytest.mark.parametrize(("diff_result", "exists", "state"), [
+    ({'status': False, 'message': 'service not present on env'}, True, 'skip'),
+    ({'status': False, 'message': 'invalid new port'}, True, 'fail'),
+    ({'status': True, 'config_diff': {}}, True, 'skip'),
+    ({'status': True, 'config_diff': {'port': [80, 8080]}}, False, 'add'),
+    ({'status': True, 'config_diff': {'port': [80, 8080]}}, True, 'recreate'),
+])
+def test_get_diff_state(diff_result, exists, state):
+    assert core.get_diff_state(diff_result, exists) == state
+
+
+def test_update_services(mock_sct_manager, mock_get_service_configs):
+    mock_get_service_configs.return_value = 'current', 'new', 'diff', 'ok'
+    progress = []
+
+    result = mock_sct_manager.update_services(
+        ['service', 'service1'], force=True, on_result=lambda *args: progress.append(args[0])
+    )
+
+    assert result['recreated'] == ['service']
+    assert result['added'] == ['service1']
+    assert set(result['by_service']) == {'service', 'service1'}
+    assert sorted(progress) == ['service', 'service1']
+
+
+def test_update_services_exception(mock_sct_manager, mock_get_service_configs):
+    mock_get_service_configs.side_effect = AssertionError('service1 does not exist in services.json')
+
+    result = mock_sct_manager.update_services(['service1'])
+
+    assert result['failed'] == ['service1']
+    assert 'does not exist' in result['by_service']['service1']['message']
+
+
+def test_diff_services(mock_sct_manager, mock_get_service_configs):
+    mock_get_service_configs.return_value = 'current', 'new', {'port': [80, 8080]}, 'ok'
+
+    result = mock_sct_manager.diff_services(['service', 'service1'])
+
+    assert result['recreate'] == ['service']
+    assert result['add'] == ['service1']
+
+
+def test_diff_fleet(mocker, mock_read_services_config):
+    managers = {'env1': mocker.MagicMock(), 'env2': mocker.MagicMock()}
+    managers['env1'].diff_services.return_value = {'add': ['service3'], 'recreate': ['service1'], 'fail': [],
+                                                   'skip': ['service2'], 'by_service': {}}
+    managers['env2'].diff_services.return_value = {'add': ['service3'], 'recreate': [], 'fail': [],
+                                                   'skip': [], 'by_service': {}}
+    on_env = mocker.MagicMock()
+
+    result = core.diff_fleet(['env1', 'env2', 'env3'], manager_factory=lambda env_name: managers[env_name],
+                             on_env=on_env)
+
+    assert result['envs']['env1'] == {'add': ['service3'], 'recreate': ['service1'], 'fail': [], 'skip': 1}
+    assert result['services'] == {'service3': {'env1': 'add', 'env2': 'add'}, 'service1': {'env1': 'recreate'}}
+    assert list(result['failed_envs']) == ['env3']
+    assert on_env.call_count == 3
+
+
+def test_update_timings(mock_sct_manager, mock_get_service_configs):
+    mock_get_service_configs.return_value = 'current', 'new', 'diff', 'ok'
+
+    result = mock_sct_manager.update(service='service', force=True, timings=True)
+
+    assert set(result['timings']) == {'sct_delete', 'sct_register'}
+
+
+def test_update_services_timings(mock_sct_manager, mock_get_service_configs):
+    mock_get_service_configs.return_value = 'current', 'new', 'diff', 'ok'
+
+    result = mock_sct_manager.update_services(['service'], timings=True)
+
+    assert {'env_init', 'sct_get_services', 'services_wall', 'sct_register'} <= set(result['timings'])
+    assert 'timings' in result['by_service']['service']
+
+
+def test_init_timings_reported_once(mock_sct_manager, mock_get_service_configs, mocker):
+    mock_get_service_configs.return_value = 'current', 'new', 'diff', 'ok'
+    mocker.patch('libs.core.from_sct_services', return_value={'service': ['current_config']})
+    mock_sct_manager.update_services(['service'], timings=True)
+    timings = core.Timings()
+
+    # manager reused from pool: its init was paid by the operation which built it
+    mock_sct_manager.refresh(timings=timings)
+    result = mock_sct_manager.diff_services(['service'], timings=True)
+
+    assert not {'env_init', 'sct_login', 'sct_get_services'} & set(result['timings'])
+    assert set(timings.to_dict()) == {'sct_refresh'}
+
+
+def test_get_service_configs_timings(
+        mock_sct_manager, test_data, mock_read_services_config, mock_get_required_variables,
+        mock_adjust_current_config, mock_new_config_parser
+):
+    mock_read_services_config.return_value = {test_data['service']: test_data['service_config_template']}
+    timings = core.Timings()
+
+    mock_sct_manager.get_service_configs(test_data['service'], timings=timings)
+
+    assert set(timings.to_dict()) == {'host_lookup', 'parse', 'diff'}
+
+
+def test_get_service_host_info_accounts_calls(mock_sct_manager):
+    mock_sct_manager.env_local.get_service_host_by_pod.return_value = ['host1']
+    mock_sct_manager.ads.calculate_server_variables.return_value = {'var1': 'value1'}
+
+    with accounting() as calls:
+        mock_sct_manager.get_service_host_info('service', None, ['var1'])
+        mock_sct_manager.get_service_host_info('service', None, ['var1'])
+
+    report = calls.report()
+    assert report['endpoints']['ads_host_lookup'] == {'calls': 2, 'unique': 1, 'duplicates': 1}
+    # host variables come from session cache the second time
+    assert report['endpoints']['ads_variables'] == {'calls': 1, 'unique': 1, 'duplicates': 0}
+
+
+def test_read_services_config_validated_once(mocker, mock_load_json):
+    mock_load_json.return_value = {"key": "value"}
+    stamps = dict()
+    mocker.patch('libs.core.read_stamp', side_effect=lambda name: stamps.get(name))
+    mocker.patch('libs.core.write_stamp', side_effect=lambda name, value: stamps.update({name: value}))
+    mock_validate = mocker.patch('libs.core.validate')
+
+    core.read_services_config()
+    core.read_services_config()
+
+    assert mock_validate.call_count == 1
+    mocker.patch('libs.core.get_files_checksum', return_value='changed')
+    core.read_services_config()
+    assert mock_validate.call_count == 2
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from libs import envqueue
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+
+def test_env_write_queue_fifo():
+    writes = envqueue.EnvWriteQueue()
+    order, running = [], []
+
+    def _write(name):
+        running.append(name)
+        assert len(running) == 1
+        time.sleep(0.03)
+        order.append(name)
+        running.remove(name)
+        return name
+
+    run_threads([lambda name=name: writes.run('lab-lem-ams', lambda: _write(name)) for name in 'abcd'])
+
+    assert order == ['a', 'b', 'c', 'd']
+    assert writes.stats() == {'running': 0, 'queued': 0, 'executed': 4, 'merged': 0}
+
+
+def test_env_write_queue_envs_parallel():
+    writes = envqueue.EnvWriteQueue()
+    started = threading.Barrier(2, timeout=1)
+
+    # both writes must be running at the same time to pass the barrier
+    run_threads([lambda env=env: writes.run(env, started.wait) for env in ('lab-lem-ams', 'lab-lem-sjc')])
+
+    assert writes.stats()['executed'] == 2
+
+
+def test_env_write_queue_merge():
+    writes = envqueue.EnvWriteQueue()
+    calls, results = [], []
+
+    def _write(name):
+        calls.append(name)
+        time.sleep(0.05)
+        return name
+
+    run_threads([
+        lambda: results.append(writes.run('lab-lem-ams', lambda: _write('first'), key='other')),
+        lambda: results.append(writes.run('lab-lem-ams', lambda: _write('second'), key='update')),
+        lambda: results.append(writes.run('lab-lem-ams', lambda: _write('third'), key='update')),
+        lambda: results.append(writes.run('lab-lem-ams', lambda: _write('fourth'))),
+    ])
+
+    assert calls == ['first', 'second', 'fourth']
+    assert sorted(results) == ['first', 'fourth', 'second', 'second']
+    assert writes.stats() == {'running': 0, 'queued': 0, 'executed': 3, 'merged': 1}
+
+
+def test_env_write_queue_merge_disabled():
+    writes = envqueue.EnvWriteQueue(merge=False)
+    calls = []
+
+    def _write():
+        calls.append(1)
+        time.sleep(0.03)
+
+    run_threads([lambda: writes.run('lab-lem-ams', _write, key='update') for _ in range(3)])
+
+    assert len(calls) == 3
+
+
+def test_env_write_queue_error():
+    writes = envqueue.EnvWriteQueue()
+    errors = []
+
+    def _write():
+        time.sleep(0.05)
+        raise RuntimeError('Some error')
+
+    def _run():
+        try:
+            writes.run('lab-lem-ams', _write, key='update')
+        except RuntimeError as error:
+            errors.append(str(error))
+
+    run_threads([_run, _run])
+
+    assert errors == ['Some error'] * 2
+    # failed write doesn't block the next one
+    assert writes.run('lab-lem-ams', lambda: 'ok') == 'ok'
+    assert writes.pending('lab-lem-ams') == 0
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from libs import executor
+
+
+def test_bounded_executor_submit():
+    bounded_executor = executor.BoundedExecutor(max_workers=2)
+
+    futures = [bounded_executor.submit(pow, 2, power) for power in range(4)]
+
+    assert [future.result() for future in futures] == [1, 2, 4, 8]
+    bounded_executor.shutdown()
+    assert bounded_executor.stats()['pending'] == 0
+
+
+def test_bounded_executor_overloaded():
+    bounded_executor = executor.BoundedExecutor(max_workers=1, max_queue=1, retry_after=5)
+    release = threading.Event()
+    bounded_executor.submit(release.wait)
+    bounded_executor.admit()
+    bounded_executor.submit(release.wait)
+
+    with pytest.raises(executor.ExecutorOverloaded) as e:
+        bounded_executor.admit()
+
+    assert e.value.retry_after == 5
+    assert bounded_executor.stats()['queued'] == 1
+    assert bounded_executor.stats()['rejected'] == 1
+    release.set()
+    bounded_executor.shutdown()
+    bounded_executor.admit()
+
+
+def test_bounded_executor_submit_waits_for_queue_slot():
+    bounded_executor = executor.BoundedExecutor(max_workers=1, max_queue=2)
+    release = threading.Event()
+    max_queued = list()
+
+    def _task():
+        release.wait(timeout=5)
+        max_queued.append(bounded_executor.stats()['queued'])
+
+    def _fan_out():
+        bounded_executor.admit()
+        futures = [bounded_executor.submit(_task) for _ in range(10)]
+        for future in futures:
+            future.result()
+    thread = threading.Thread(target=_fan_out)
+    thread.start()
+    # one running and two queued tasks, the rest of the fan-out waits in submit
+    thread.join(timeout=0.2)
+    assert thread.is_alive()
+    assert bounded_executor.stats()['pending'] == 3
+
+    release.set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert len(max_queued) == 10
+    assert max(max_queued) <= 2
+    bounded_executor.shutdown()
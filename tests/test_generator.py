@@ -0,0 +1,97 @@
+import json
+
+from benchmarks import generator, run
+from libs.core import get_required_variables
+from libs.parser import NewConfigParser
+
+
+def test_make_catalog_is_schema_valid():
+    catalog = generator.make_catalog(200, placeholder_density=1.0, group_size=4, shared_by_env=0.5,
+                                     shared_by_location=0.5, extra_variables=3)
+
+    generator.validate_catalog(catalog)
+    assert len(catalog) == 200
+    assert {f'GEN.VAR{index}' for index in range(3)} & set(get_required_variables(catalog))
+
+
+def test_make_catalog_groups_and_overrides():
+    catalog = generator.make_catalog(12, group_size=4, shared_by_env=1.0, shared_by_location=1.0)
+
+    sources = [items[0]['address']['source_service'] for items in catalog.values()]
+    assert sources == [None, 'svc00000', 'svc00000', 'svc00000'] + [None] + ['svc00004'] * 3 + \
+        [None] + ['svc00008'] * 3
+    address = catalog['svc00001'][0]['address']
+    assert generator.SHARED_ENV in address['shared_by_env']
+    assert set(address['shared_by_location']) == {'default', 'ams02', 'sjc01'}
+
+
+def test_make_catalog_density_and_seed():
+    assert generator.make_catalog(50, seed=1) == generator.make_catalog(50, seed=1)
+    assert generator.make_catalog(50, seed=1) != generator.make_catalog(50, seed=2)
+
+    plain = generator.make_catalog(50, placeholder_density=0)
+    assert set(get_required_variables(plain)) == {'ENV.CLEANNAME', 'SERVER_FQDN'}
+    assert all(isinstance(items[0]['port'], int) for items in plain.values())
+
+
+def test_dataset_covers_required_variables():
+    catalog = generator.make_catalog(30, placeholder_density=1.0, extra_variables=2)
+    variables = get_required_variables(catalog)
+    data = generator.EnvDataset().to_dict(generator.env_names(2), catalog)
+
+    assert set(data['envs']) == {'lab-bench-000', 'lab-bench-001', generator.SHARED_ENV.lower()}
+    # every service is on the shared env
+    assert len(data['envs'][generator.SHARED_ENV.lower()]['services']) == 30
+    for values in data['hosts'].values():
+        assert set(variables) <= set(values)
+        for variable in variables:
+            if variable.endswith('_PORT'):
+                assert values[variable].isdigit()
+
+
+def test_static_dataset_matches_generated(tmp_path):
+    catalog = generator.make_catalog(20, placeholder_density=0.5)
+    dataset = generator.EnvDataset()
+    file = tmp_path / 'envs.json'
+    file.write_text(json.dumps(dataset.to_dict(['lab-bench-000'], catalog)))
+    static = generator.StaticEnvDataset.from_file(str(file))
+    variables = get_required_variables(catalog)
+
+    assert static.env_info('LAB-BENCH-000') == {**dataset.env_info('lab-bench-000'),
+                                                'services': static.data['envs']['lab-bench-000']['services']}
+    for service in catalog:
+        hosts = dataset.service_hosts('lab-bench-000', service)
+        assert static.service_hosts('lab-bench-000', service) == hosts
+        for host in hosts:
+            assert static.host_variables(host, variables) == dataset.host_variables(host, variables)
+    assert static.service_hosts('lab-bench-999', 'svc00000') == []
+
+
+def test_generated_catalog_parses():
+    catalog = generator.make_catalog(40, placeholder_density=1.0, group_size=3, shared_by_env=0.3,
+                                     shared_by_location=0.3)
+    dataset = generator.EnvDataset(presence=1.0)
+    variables = get_required_variables(catalog)
+    env_info = dataset.env_info('lab-bench-000')
+
+    for service, config_data in catalog.items():
+        source = config_data[0]['address']['source_service'] or service
+        host_info = {host: dataset.host_variables(host, variables)
+                     for host in dataset.service_hosts('lab-bench-000', source)}
+        config = NewConfigParser(service=service, host_info=host_info, required_variables=variables,
+                                 config_data=config_data, envname=env_info['name'],
+                                 envname_shared=env_info['shared_env'],
+                                 env_location=env_info['location']).get_config()
+        assert all(isinstance(item['port'], int) for item in config)
+
+
+def test_generate_files(tmp_path):
+    output, dataset = tmp_path / 'services.json', tmp_path / 'envs.json'
+
+    generator.generate(services=15, output=str(output), group_size=3, envs=2, dataset=str(dataset))
+
+    generator.validate_catalog(json.loads(output.read_text()))
+    report = run.run_benchmarks(scale='small', cases='parser,update_env', repeat=1, catalog=str(output),
+                                dataset=str(dataset))
+    assert report['meta']['services'] == 15
+    assert report['results']['update_env']['upstream_calls_total']['sct_register'] > 0
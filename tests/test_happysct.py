@@ -1,6 +1,9 @@
+import json
+
 import pytest
 
 import happysct
+from libs.accounting import account
 
 
 cli = happysct.CLI()
@@ -68,3 +71,54 @@ def test_cli_show(mock_sct_manager, mock_filter_services, capsys):
     captured = capsys.readouterr()
 
     assert not captured.err
+
+
+def test_cli_update_ndjson(mock_sct_manager, mock_filter_services, tmp_path):
+    mock_sct_manager.return_value.update.return_value = {
+        'status': True, 'message': 'added', 'updated': True, 'old_deleted': False, 'config_diff': {}
+    }
+    file = tmp_path / "result.ndjson"
+    cli.update('env', output='ndjson', output_file=str(file))
+
+    records = [json.loads(line) for line in file.read_text().splitlines()]
+    assert [record['type'] for record in records] == ['service'] * 4 + ['env']
+    assert records[0]['state'] == 'added'
+    assert records[-1]['status']
+    assert records[-1]['added'] == ['service1', 'service2', 'service3', 'service4']
+
+
+def test_cli_diff_fleet(mocker, capsys):
+    mock_diff_fleet = mocker.patch('happysct.diff_fleet', return_value={
+        'envs': {'env1': {'add': [], 'recreate': [], 'fail': [], 'skip': 2}}, 'services': {}, 'failed_envs': {}
+    })
+    cli.diff_fleet(envs='env1')
+
+    captured = capsys.readouterr()
+    assert mock_diff_fleet.call_args.args[0] == ['env1']
+    assert "No changes." in captured.out
+
+
+def test_cli_diff_fleet_calls(mocker, capsys):
+    def _diff_fleet(*args, **kwargs):
+        account('sct_get_services', '100')
+        account('sct_get_services', '100')
+        return {'envs': {}, 'services': {}, 'failed_envs': {}}
+    mocker.patch('happysct.diff_fleet', side_effect=_diff_fleet)
+    mock_print_calls_table = mocker.patch('happysct.print_calls_table')
+
+    cli.diff_fleet(envs='env1', calls=True)
+
+    report = mock_print_calls_table.call_args.args[0]
+    assert report['endpoints']['sct_get_services'] == {'calls': 2, 'unique': 1, 'duplicates': 1}
+
+
+def test_check_git_update_cached(mocker):
+    mock_check = mocker.patch('api_libs.gitup.check')
+    stamps = dict()
+    mocker.patch('happysct.read_stamp', side_effect=lambda name, max_age=None: stamps.get(name))
+    mocker.patch('happysct.write_stamp', side_effect=lambda name, value='': stamps.update({name: value}))
+
+    happysct.check_git_update()
+    happysct.check_git_update()
+
+    assert mock_check.call_count == 1
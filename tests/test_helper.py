@@ -44,3 +44,35 @@ def test_load_json(temp_file):
     temp_file.write_text('{"serviceName": "ace"}')
     data = helper.load_json(temp_file)
     assert isinstance(data, dict)
+
+
+def test_get_ff_default():
+    assert helper.get_ff('NOT_EXISTING_FLAG') is None
+    assert helper.get_ff('NOT_EXISTING_FLAG', default=5) == 5
+
+
+def test_stamps(mocker, tmp_path):
+    mocker.patch('libs.helper.get_stamp_path', side_effect=lambda name: str(tmp_path / 'stamps' / name))
+
+    assert helper.read_stamp('check') is None
+    helper.write_stamp('check', 'value')
+
+    assert helper.read_stamp('check') == 'value'
+    assert helper.read_stamp('check', max_age=60) == 'value'
+    assert helper.read_stamp('check', max_age=-1) is None
+
+
+def test_stamps_dir(stamps_dir):
+    assert helper.get_stamp_path('services-validated') == str(stamps_dir / 'services-validated')
+
+
+def test_get_files_checksum(tmp_path):
+    first, second = tmp_path / 'first.json', tmp_path / 'second.json'
+    first.write_text('{}')
+    second.write_text('[]')
+
+    checksum = helper.get_files_checksum(str(first), str(second))
+
+    assert checksum == helper.get_files_checksum(str(first), str(second))
+    second.write_text('[1]')
+    assert checksum != helper.get_files_checksum(str(first), str(second))
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from libs import jobs
+
+
+def wait_job(job_manager, job):
+    job_manager.executor.shutdown(wait=True)
+    return job_manager.get(job.id)
+
+
+def test_job_done():
+    job_manager = jobs.JobManager(max_workers=1)
+
+    def _func(job):
+        job.set_total(2)
+        job.add_progress('ace', {}, 'added')
+        job.add_progress('rmx', {}, 'skipped')
+        return {'added': ['ace']}
+
+    job = wait_job(job_manager, job_manager.submit('update', {'env_name': 'env'}, _func))
+
+    data = job.to_dict(with_result=True)
+    assert data['status'] == 'done'
+    assert data['progress'] == {'total': 2, 'done': 2, 'by_service': {'ace': 'added', 'rmx': 'skipped'}}
+    assert data['result'] == {'added': ['ace']}
+
+
+def test_job_failed():
+    job_manager = jobs.JobManager(max_workers=1)
+
+    def _func(job):
+        raise RuntimeError('Some error')
+
+    job = wait_job(job_manager, job_manager.submit('update', {'env_name': 'env'}, _func))
+
+    assert job.status == 'failed'
+    assert job.error == 'Some error'
+    assert 'result' not in job.to_dict()
+
+
+def test_job_same_params_not_duplicated():
+    job_manager = jobs.JobManager(max_workers=1)
+    release = threading.Event()
+
+    first = job_manager.submit('update', {'env_name': 'env'}, lambda job: release.wait())
+    second = job_manager.submit('update', {'env_name': 'env'}, lambda job: release.wait())
+    other = job_manager.submit('update', {'env_name': 'other'}, lambda job: release.wait())
+    release.set()
+
+    assert first is second
+    assert other is not first
+
+
+def test_job_limit():
+    job_manager = jobs.JobManager(max_workers=1, max_jobs=1)
+    release = threading.Event()
+    job_manager.submit('update', {'env_name': 'env'}, lambda job: release.wait())
+
+    with pytest.raises(jobs.JobLimitError):
+        job_manager.submit('update', {'env_name': 'other'}, lambda job: release.wait())
+    release.set()
+
+
+def test_job_eviction():
+    job_manager = jobs.JobManager(max_workers=1, max_jobs=1)
+    first = wait_job(job_manager, job_manager.submit('update', {'env_name': 'env'}, lambda job: None))
+    job_manager.executor = jobs.concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    second = job_manager.submit('update', {'env_name': 'other'}, lambda job: None)
+
+    assert job_manager.get(first.id) is None
+    assert job_manager.get(second.id) is second
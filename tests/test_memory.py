@@ -0,0 +1,69 @@
+import pytest
+
+import libs.memory as mem
+
+
+def write_files(root, files):
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def test_read_memory_info_cgroup_v2(tmp_path):
+    write_files(tmp_path, {
+        'cgroup.controllers': 'cpu memory\n',
+        'memory.current': '1000\n',
+        'memory.peak': '1500\n',
+        'memory.max': '4000\n',
+        'memory.stat': 'anon 600\nfile 400\ninactive_file 300\n',
+    })
+    assert mem.is_cgroup_v2(str(tmp_path))
+    assert mem.read_memory_info(str(tmp_path)) == {
+        'usage': 1000, 'max_usage': 1500, 'limit': 4000, 'working_set': 700}
+
+
+def test_read_memory_info_cgroup_v2_unlimited(tmp_path):
+    write_files(tmp_path, {
+        'cgroup.controllers': 'memory\n',
+        'memory.current': '1000\n',
+        'memory.max': 'max\n',
+    })
+    info = mem.read_memory_info(str(tmp_path))
+    assert info['limit'] == 0
+    assert info['max_usage'] == 0
+    assert info['working_set'] == 1000
+
+
+def test_read_memory_info_cgroup_v1(tmp_path):
+    write_files(tmp_path, {
+        'memory/memory.usage_in_bytes': '2000\n',
+        'memory/memory.max_usage_in_bytes': '2500\n',
+        'memory/memory.stat': 'cache 800\nhierarchical_memory_limit 8000\ntotal_inactive_file 500\n',
+    })
+    assert not mem.is_cgroup_v2(str(tmp_path))
+    assert mem.read_memory_info(str(tmp_path)) == {
+        'usage': 2000, 'max_usage': 2500, 'limit': 8000, 'working_set': 1500}
+
+
+def test_read_memory_info_missing(tmp_path):
+    assert mem.read_memory_info(str(tmp_path)) == {'usage': 0, 'max_usage': 0, 'limit': 0, 'working_set': 0}
+
+
+@pytest.mark.parametrize('info, expected', [
+    ({'usage': 0, 'max_usage': 0, 'limit': 0, 'working_set': 500}, 0),
+    ({'usage': 0, 'max_usage': 0, 'limit': 1000, 'working_set': 900}, 0.9),
+])
+def test_get_memory_pressure(monkeypatch, info, expected):
+    monkeypatch.setattr(mem, 'read_memory_info', lambda: info)
+    monkeypatch.setattr(mem, '_cache', {'time': None, 'info': None})
+    assert mem.get_memory_pressure() == expected
+
+
+def test_get_memory_info_cached(monkeypatch):
+    calls = []
+    monkeypatch.setattr(mem, 'read_memory_info', lambda: calls.append(1) or {'usage': len(calls)})
+    monkeypatch.setattr(mem, '_cache', {'time': None, 'info': None})
+    assert mem.get_memory_info(max_age=60)['usage'] == 1
+    assert mem.get_memory_info(max_age=60)['usage'] == 1
+    assert mem.get_memory_info(max_age=0)['usage'] == 2
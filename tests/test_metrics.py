@@ -0,0 +1,40 @@
+from prometheus_client import REGISTRY
+import pytest
+
+from libs import metrics
+
+
+def get_value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_observe_upstream():
+    @metrics.observe_upstream('test_call')
+    def _call():
+        return 'ok'
+
+    before = get_value('happysct_upstream_duration_seconds_count', call='test_call')
+    assert _call() == 'ok'
+    assert get_value('happysct_upstream_duration_seconds_count', call='test_call') == before + 1
+
+
+def test_observe_upstream_error():
+    @metrics.observe_upstream('test_failed_call')
+    def _call():
+        raise RuntimeError('Some error')
+
+    with pytest.raises(RuntimeError):
+        _call()
+    assert get_value('happysct_upstream_errors_total', call='test_failed_call') == 1
+    assert get_value('happysct_upstream_duration_seconds_count', call='test_failed_call') == 1
+
+
+def test_cache_lookup():
+    metrics.cache_lookup('test_cache', hit=True)
+    assert get_value('happysct_cache_requests_total', cache='test_cache', result='hit') == 1
+
+
+def test_export():
+    data, content_type = metrics.export()
+    assert b'happysct_upstream_duration_seconds' in data
+    assert content_type.startswith('text/plain')
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from libs import output
+
+
+def test_to_ndjson():
+    line = output.to_ndjson({'service': 'ace', 'status': True})
+    assert line.endswith("\n")
+    assert json.loads(line) == {'service': 'ace', 'status': True}
+
+
+def test_ndjson_writer_file(tmp_path):
+    file = tmp_path / "result.ndjson"
+    with output.NDJSONWriter(file=str(file)) as writer:
+        writer.write({'service': 'ace'})
+        writer.write({'service': 'rmx'})
+
+    lines = file.read_text().splitlines()
+    assert [json.loads(line)['service'] for line in lines] == ['ace', 'rmx']
+
+
+def test_ndjson_writer_stdout_reserved(capsys):
+    with output.NDJSONWriter() as writer:
+        assert output.stdout_reserved()
+        writer.write({'service': 'ace'})
+    assert not output.stdout_reserved()
+    # closed twice releases stdout once, other writer keeps it reserved
+    with output.NDJSONWriter():
+        writer.close()
+        assert output.stdout_reserved()
+    assert not output.stdout_reserved()
+
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == {'service': 'ace'}
+
+
+def test_get_writer():
+    assert output.get_writer() is None
+    with pytest.raises(ValueError):
+        output.get_writer(output='yaml')
+    with pytest.raises(ValueError):
+        output.get_writer(output_file='results.ndjson')
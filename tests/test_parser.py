@@ -1,8 +1,11 @@
 import copy
+import json
+import os
 
 import pytest
 
-from libs.parser import parse_deployment_schemes, adjust_current_config
+from libs.cache import MemoryCache
+from libs.parser import SchemesTemplate, load_schemes_template, parse_deployment_schemes, adjust_current_config
 
 
 def test_parse_deployment_schemes(test_data):
@@ -146,3 +149,46 @@ def test_adjust_current_config(test_data):
     assert "serviceVersion" in current_config[0].keys()
     assert "order" not in current_config[0].keys()
     assert current_config == test_data['service_config']
+
+
+def test_adjust_current_config_input_untouched(test_data):
+    current_config = copy.deepcopy(test_data['current_service_config'])
+    adjust_current_config(current_config)
+    assert current_config == test_data['current_service_config']
+
+
+def test_parse_deployment_schemes_keeps_template(test_data):
+    template = copy.deepcopy(test_data['deployment_schemes_template'])
+
+    for _ in range(2):
+        parsed_schemes = parse_deployment_schemes(
+            test_data['unique_pops'], test_data['unique_server_locs'], test_data['unique_pop_locs'], template
+        )
+        assert parsed_schemes == test_data['deployment_schemes']
+    assert template == test_data['deployment_schemes_template']
+
+
+def test_schemes_template_memoized_by_topology(test_data):
+    template = SchemesTemplate(test_data['deployment_schemes_template'], cache=MemoryCache(name='schemes'))
+
+    first = template.parse(test_data['unique_pops'], test_data['unique_server_locs'], test_data['unique_pop_locs'])
+    # same topology of another env, POPs above 2 don't matter
+    second = template.parse({**test_data['unique_pops'], 3: 'fra01'}, set(test_data['unique_server_locs']),
+                            set(test_data['unique_pop_locs']))
+    other = template.parse({1: 'iad41', 2: 'fra01'}, {'iad41', 'fra01'}, test_data['unique_pop_locs'])
+
+    assert first is second
+    assert first == test_data['deployment_schemes']
+    assert other != first
+    assert template.cache.stats()['size'] == 2
+
+
+def test_load_schemes_template_reloads_changed_file(tmp_path, test_data):
+    file = tmp_path / 'deployment_schemes.json'
+    file.write_text(json.dumps(test_data['deployment_schemes_template']))
+
+    template = load_schemes_template(str(file))
+    assert load_schemes_template(str(file)) is template
+
+    os.utime(file, (0, 0))
+    assert load_schemes_template(str(file)) is not template
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from libs import pool
+
+
+class Manager():
+    def __init__(self, env_name) -> None:
+        self.env_name = env_name
+        self.refreshed = 0
+
+    def refresh(self, timings=None):
+        self.refreshed += 1
+
+
+def test_pool_hit():
+    manager_pool = pool.ManagerPool(factory=Manager)
+
+    first = manager_pool.get('env1')
+    second = manager_pool.get('env1')
+
+    assert first is second
+    assert manager_pool.stats()['hits'] == 1
+    assert manager_pool.stats()['misses'] == 1
+    assert manager_pool.stats()['hit_rate'] == 0.5
+
+
+def test_pool_ttl():
+    manager_pool = pool.ManagerPool(factory=Manager, ttl=0.01)
+
+    first = manager_pool.get('env1')
+    time.sleep(0.02)
+
+    assert manager_pool.get('env1') is not first
+
+
+def test_pool_lru_eviction():
+    manager_pool = pool.ManagerPool(factory=Manager, max_size=2)
+
+    first = manager_pool.get('env1')
+    manager_pool.get('env2')
+    manager_pool.get('env1')
+    manager_pool.get('env3')
+
+    assert manager_pool.get('env1') is first
+    assert manager_pool.stats()['size'] == 2
+    assert manager_pool.stats()['evictions'] == 1
+
+
+def test_pool_refresh():
+    manager_pool = pool.ManagerPool(factory=Manager)
+
+    manager = manager_pool.get('env1')
+    manager_pool.get('env1', fresh=True)
+    manager_pool.refresh('env1')
+    manager_pool.refresh('env2')
+
+    assert manager.refreshed == 2
+
+
+def test_pool_concurrent_build():
+    calls = []
+
+    def _factory(env_name):
+        calls.append(env_name)
+        time.sleep(0.05)
+        return Manager(env_name)
+
+    manager_pool = pool.ManagerPool(factory=_factory)
+    threads = [threading.Thread(target=manager_pool.get, args=('env1',)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['env1']
+    assert not manager_pool._build_locks
+
+
+def test_pool_build_locks_dropped():
+    def _factory(env_name):
+        if env_name == 'broken':
+            raise RuntimeError('ADS is down')
+        return Manager(env_name)
+
+    manager_pool = pool.ManagerPool(factory=_factory, max_size=2)
+    for index in range(10):
+        manager_pool.get(f'env{index}')
+    with pytest.raises(RuntimeError):
+        manager_pool.get('broken')
+
+    assert manager_pool.stats()['size'] == 2
+    assert not manager_pool._build_locks
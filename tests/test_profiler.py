@@ -0,0 +1,84 @@
+import concurrent.futures
+import pstats
+import threading
+import time
+
+import pytest
+
+from libs import profiler
+
+
+@pytest.mark.parametrize(("argv", "args", "options"), [
+    (['update', 'env1', '--force'], ['update', 'env1', '--force'], None),
+    (['update', 'env1', '--profile'], ['update', 'env1'], {'prefix': ''}),
+    (['diff', '--profile=out/diff', '--profile-top=5', 'env1'], ['diff', 'env1'], {'prefix': 'out/diff', 'top': 5}),
+    (['--profile-wall'], [], {'prefix': '', 'wall_interval': 0.005}),
+    (['--profile-wall=0.01'], [], {'prefix': '', 'wall_interval': 0.01}),
+    (['update', '--profile-top', '5', 'env1'], ['update', 'env1'], {'prefix': '', 'top': 5}),
+    (['update', '--profile-wall', '0.01', 'env1'], ['update', 'env1'], {'prefix': '', 'wall_interval': 0.01}),
+    (['update', '--profile-wall', 'env1'], ['update', 'env1'], {'prefix': '', 'wall_interval': 0.005}),
+])
+def test_pop_profile_args(argv, args, options):
+    assert profiler.pop_profile_args(argv) == (args, options)
+
+
+@pytest.mark.parametrize("argv", [['update', '--profile-top'], ['--profile-top', 'env1'], ['--profile-wall=fast']])
+def test_pop_profile_args_invalid(argv):
+    with pytest.raises(ValueError, match='--profile-'):
+        profiler.pop_profile_args(argv)
+
+
+def _work(count):
+    total = sum(i * i for i in range(count))
+    time.sleep(0.02)
+    return total
+
+
+def test_profiled(tmp_path, capsys):
+    prefix = str(tmp_path / 'update')
+
+    with profiler.profiled({'prefix': prefix, 'top': 5, 'wall_interval': 0.002}):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(_work, [1000, 1000]))
+
+    functions = {func[2] for func in pstats.Stats(f'{prefix}.pstats').stats}
+    # function running in worker threads is profiled too
+    assert '_work' in functions
+    assert '_work' in (tmp_path / 'update.collapsed').read_text()
+    assert '_work' in (tmp_path / 'update.wall.collapsed').read_text()
+    assert 'top 5 by tottime' in capsys.readouterr().err
+
+
+def test_thread_runs_if_profile_fails(mocker):
+    class BusyProfile(profiler.cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            raise ValueError('Another profiling tool is already active')
+    profile = profiler.Profiler(prefix='unused')
+    profile.start()
+    # main profile is enabled already, threads get failing ones like on Python 3.12+
+    mocker.patch('libs.profiler.cProfile.Profile', BusyProfile)
+    ran = list()
+    try:
+        thread = threading.Thread(target=lambda: ran.append(_work(100)))
+        thread.start()
+        thread.join()
+    finally:
+        stats = profile.stop()
+
+    assert ran
+    assert stats.stats
+
+
+def test_profiled_disabled(tmp_path):
+    with profiler.profiled(None) as profile:
+        assert profile is None
+
+
+def test_get_collapsed_stacks():
+    profile = profiler.cProfile.Profile()
+    profile.runcall(_work, 1000)
+
+    stacks = profiler.get_collapsed_stacks(pstats.Stats(profile))
+
+    assert any('_work (test_profiler.py' in stack for stack in stacks)
+    assert all(value > 0 for value in stacks.values())
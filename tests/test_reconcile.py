@@ -0,0 +1,162 @@
+import threading
+
+import pytest
+
+import happysct
+from libs import reconcile
+from libs.executor import ExecutorOverloaded
+
+
+class FakeClock(object):
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def mock_manager(mocker):
+    mocker.patch('libs.reconcile.filter_services', return_value=['service1', 'service2', 'service3'])
+    manager = mocker.MagicMock()
+    manager.diff_services.return_value = {'add': ['service1'], 'recreate': ['service2'], 'fail': [],
+                                          'skip': ['service3'], 'by_service': {}}
+    manager.update_services.return_value = {'added': ['service1'], 'recreated': [], 'failed': [], 'skipped': []}
+    return manager
+
+
+def test_reconcile_env_applies_drift(mock_manager):
+    result = reconcile.reconcile_env(mock_manager)
+
+    # changed services are recreated by default
+    mock_manager.update_services.assert_called_once_with(['service1', 'service2'], force=True, executor=None)
+    mock_manager.refresh.assert_called_once()
+    assert result == {'add': ['service1'], 'recreate': ['service2'], 'fail': [], 'applied': ['service1'],
+                      'failed': []}
+
+
+def test_reconcile_env_add_only(mock_manager):
+    result = reconcile.reconcile_env(mock_manager, add_only=True)
+
+    # changed service2 is reported, but left as it is
+    mock_manager.update_services.assert_called_once_with(['service1'], force=False, executor=None)
+    assert result['recreate'] == ['service2']
+
+
+def test_reconcile_env_no_drift(mock_manager):
+    mock_manager.diff_services.return_value = {'add': [], 'recreate': [], 'fail': [], 'skip': ['service1'],
+                                               'by_service': {}}
+
+    result = reconcile.reconcile_env(mock_manager)
+
+    mock_manager.update_services.assert_not_called()
+    assert result['applied'] == []
+
+
+def test_reconciler_spreads_first_runs():
+    clock = FakeClock()
+    reconciler = reconcile.Reconciler(lambda env_name: {}, lambda: [f'env{i}' for i in range(100)],
+                                      interval=100, clock=clock, seed=1)
+    reconciler.refresh_envs()
+
+    next_runs = sorted(item.next_run for item in reconciler.schedule.values())
+    assert 0 <= next_runs[0] and next_runs[-1] <= 100
+    # roughly uniform: every quarter of the interval has some envs
+    assert all(any(quarter * 25 <= run < (quarter + 1) * 25 for run in next_runs) for quarter in range(4))
+
+
+def test_reconciler_backoff():
+    clock = FakeClock()
+    results = {'env1': {'applied': ['service1'], 'failed': []}}
+
+    def _reconcile(env_name):
+        if env_name not in results:
+            raise RuntimeError('ADS is down')
+        return results[env_name]
+    reconciler = reconcile.Reconciler(_reconcile, lambda: ['env1', 'env2'], interval=100, jitter=0,
+                                      max_backoff=350, clock=clock)
+
+    reconciler.run_once()
+    assert reconciler.schedule['env1'].next_run == 100
+    assert [reconciler.schedule['env2'].failures, reconciler.schedule['env2'].next_run] == [1, 200]
+
+    clock.now = 200
+    assert reconciler.run_pending(wait=True) == ['env1', 'env2']
+    assert reconciler.schedule['env2'].next_run == 200 + 350
+    assert reconciler.stats()['backing_off'] == {'env2': 2}
+    assert reconciler.stats()['applied'] == 2
+
+    results['env2'] = {'applied': [], 'failed': []}
+    clock.now = 550
+    assert reconciler.run_pending(wait=True) == ['env1', 'env2']
+    assert reconciler.schedule['env2'].failures == 0
+    assert reconciler.schedule['env2'].next_run == 650
+
+
+def test_reconciler_busy_server_defers_without_backoff():
+    clock = FakeClock()
+    busy = [True]
+
+    def _reconcile(env_name):
+        if busy[0]:
+            raise ExecutorOverloaded('Server is busy', retry_after=30)
+        return {'applied': [], 'failed': []}
+    reconciler = reconcile.Reconciler(_reconcile, lambda: ['env1'], interval=100, jitter=0, clock=clock)
+
+    reconciler.run_once()
+    assert reconciler.schedule['env1'].failures == 0
+    assert reconciler.schedule['env1'].next_run == 30
+    assert reconciler.stats()['deferred'] == 1
+    assert reconciler.stats()['failures'] == 0
+
+    busy[0] = False
+    clock.now = 30
+    assert reconciler.run_pending(wait=True) == ['env1']
+    assert reconciler.schedule['env1'].next_run == 130
+
+
+def test_reconciler_jitter_and_envs_refresh():
+    clock = FakeClock()
+    envs = ['env1', 'env2']
+    reconciler = reconcile.Reconciler(lambda env_name: {'applied': [], 'failed': []}, lambda: envs,
+                                      interval=100, jitter=0.2, clock=clock, seed=3)
+
+    reconciler.run_once()
+    assert all(80 <= item.next_run <= 120 for item in reconciler.schedule.values())
+
+    envs[:] = ['env2', 'env3']
+    reconciler.refresh_envs()
+    assert sorted(reconciler.schedule) == ['env2', 'env3']
+
+
+def test_reconciler_start_stop():
+    reconciled = threading.Event()
+
+    def _reconcile(env_name):
+        reconciled.set()
+        return {'applied': [], 'failed': []}
+    reconciler = reconcile.Reconciler(_reconcile, lambda: ['env1'], interval=0.01)
+
+    reconciler.start()
+    assert reconciler.running
+    assert reconciled.wait(timeout=5)
+    reconciler.stop(timeout=5)
+
+    assert not reconciler.running
+    assert reconciler.env_status('env1')['env'] == 'env1'
+
+
+def test_cli_reconcile_once(mocker, capsys):
+    mocker.patch('happysct.SCTManager')
+    mocker.patch('libs.reconcile.reconcile_env', side_effect=[{'add': [], 'recreate': [], 'fail': [],
+                                                               'applied': ['ace'], 'failed': []},
+                                                              RuntimeError('SCT is down')])
+
+    with pytest.raises(RuntimeError) as error:
+        happysct.CLI().reconcile(envs='env1,env2', once=True)
+    assert 'Some envs failed' in str(error.value)
+
+    mocker.patch('libs.reconcile.reconcile_env', return_value={'add': [], 'recreate': [], 'fail': [],
+                                                               'applied': ['ace'], 'failed': []})
+    happysct.CLI().reconcile(envs='env1,env2', once=True)
+    assert 'applied: ace' in capsys.readouterr().out
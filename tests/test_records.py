@@ -0,0 +1,70 @@
+import copy
+import pickle
+
+import pytest
+
+from libs.records import ServiceRecord, from_sct_services, same_config, to_sct_services
+
+
+def test_record_from_sct_and_to_dict(test_data):
+    record = ServiceRecord.from_sct(test_data['current_service_config'][0])
+
+    assert record.service_name == 'testy_static_service'
+    assert record.physical_env is None
+    assert list(record.to_dict()) == ['serviceName', 'serviceVersion', 'serviceInterface', 'deploymentScheme',
+                                      'location', 'physicalEnv', 'ssl', 'group', 'address', 'port']
+    assert ServiceRecord.from_dict(record.to_dict()) == record
+
+
+def test_record_immutable(test_data):
+    record = ServiceRecord.from_sct(test_data['current_service_config'][0])
+
+    with pytest.raises(AttributeError):
+        record.port = 80
+    with pytest.raises(AttributeError):
+        record.extra = 1
+    with pytest.raises(AttributeError):
+        del record.port
+
+
+def test_record_hash_eq_and_order():
+    first = ServiceRecord('svc', 'v1', 'rest', 'cl-2dc', None, None, False, None, 'b.host', 8080)
+    same = ServiceRecord('svc', 'v1', 'rest', 'cl-2dc', None, None, False, None, 'b.host', 8080)
+    other = ServiceRecord('svc', 'v1', 'rest', 'cl-2dc', None, None, False, None, 'a.host', 8080)
+
+    assert first == same and hash(first) == hash(same)
+    assert first != other
+    assert len({first, same, other}) == 2
+    assert sorted([first, other]) == [other, first]
+    assert first != first.to_dict()
+
+
+def test_record_copy_and_pickle():
+    record = ServiceRecord('svc', 'v1', 'rest', 'cl-2dc', None, None, False, None, 'a.host', 8080)
+
+    assert copy.deepcopy(record) == record
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_from_sct_services_sorted_by_address(test_data):
+    item = test_data['current_service_config'][0]
+    services = from_sct_services({'service': [{**item, 'address': 'z.host'}, {**item, 'address': 'a.host'}]})
+
+    assert [record.address for record in services['service']] == ['a.host', 'z.host']
+
+
+def test_to_sct_services(test_data):
+    services = from_sct_services({'service': test_data['current_service_config']})
+
+    assert from_sct_services(to_sct_services(services)) == services
+    assert to_sct_services(services)['service'][0]['name'] == 'testy_static_service'
+
+
+def test_same_config(test_data):
+    records = from_sct_services({'service': test_data['current_service_config']})['service']
+    config = [record.to_dict() for record in records]
+
+    assert same_config(records, config)
+    assert not same_config(records, [{**config[0], 'port': 80}])
+    assert not same_config(records, [])
+    assert not same_config(records, None)
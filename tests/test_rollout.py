@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 import rollout
@@ -31,3 +33,13 @@ def test_rollout_failed(mock_get_environments_list, mock_cli, caplog):
     assert caplog.records[0].message == 'ENV1'
     assert 'Completed envs - 0' in caplog.records[-1].message
     assert 'Failed envs - 1' in caplog.records[-2].message
+
+
+def test_rollout_ndjson(mock_get_environments_list, mock_cli, tmp_path):
+    file = tmp_path / "rollout.ndjson"
+    rollout.rollout(output='ndjson', output_file=str(file))
+
+    records = [json.loads(line) for line in file.read_text().splitlines()]
+    assert records[0] == {'type': 'rollout', 'env': 'ENV1', 'status': True, 'error': None}
+    assert records[-1]['type'] == 'rollout_summary'
+    assert records[-1]['completed'] == ['ENV1']
@@ -94,3 +94,33 @@ def test_invalid_sct_cred(test_data):
         f'{sct.sct_url}/service-discovery/v1/env/{test_data["env_id"]}/refs'
     )
     assert check_sct_api.headers['Content-Type'] == 'text/html'
+
+
+def test_relogin_on_expired_auth(mocker, response_class):
+    logins = []
+
+    class Session():
+        def __init__(self) -> None:
+            self.headers = mocker.MagicMock()
+            self.expired = False
+
+        def post(self, url, **kwargs):
+            logins.append(self)
+            return response_class(200, {'Content-Type': 'application/json'})
+
+        def request(self, method, url, **kwargs):
+            response = response_class(302 if self.expired else 200,
+                                      {'Content-Type': 'text/html' if self.expired else 'application/json'})
+            response.json = lambda: {'service1': []}
+            return response
+    mocker.patch('libs.sct.requests.Session', Session)
+    client = sct_wrapper.SCT()
+
+    assert client.get_services('1747') == {'service1': []}
+    logins[0].expired = True
+    assert client.get_services('1747') == {'service1': []}
+    assert len(logins) == 2
+
+    client.session_ttl = 0
+    client.get_services('1747')
+    assert len(logins) == 3
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+from libs import singleflight
+
+
+def test_single_flight_shared():
+    flight = singleflight.SingleFlight()
+    calls, results = [], []
+
+    def _func():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'add': ['ace']}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', _func))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{'add': ['ace']}] * 5
+    assert flight.stats() == {'calls': 5, 'shared': 4, 'in_flight': 0}
+
+
+def test_single_flight_not_cached():
+    flight = singleflight.SingleFlight()
+
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+
+
+def test_single_flight_error():
+    flight = singleflight.SingleFlight()
+
+    def _func():
+        raise RuntimeError('Some error')
+
+    with pytest.raises(RuntimeError):
+        flight.do('key', _func)
+    assert flight.stats()['in_flight'] == 0
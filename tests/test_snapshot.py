@@ -0,0 +1,94 @@
+import pytest
+
+import happysct
+from benchmarks.fakes import FakeWorld
+from benchmarks.generator import make_catalog
+from benchmarks.run import fake_upstreams
+from libs import snapshot
+from libs.cache import MemoryCache
+from libs.core import RolloutSession, SCTManager, filter_services
+
+
+ENV_NAME = 'lab-bench-000'
+
+
+@pytest.fixture
+def catalog():
+    return make_catalog(30, placeholder_density=0.5, group_size=3, shared_by_env=0.2)
+
+
+@pytest.fixture
+def world(catalog):
+    world = FakeWorld()
+    with fake_upstreams(world):
+        # half of the catalog is on env, so diff has both skipped and added services
+        sct_manager = SCTManager(ENV_NAME, session=RolloutSession(cache=MemoryCache(), services_config=catalog))
+        sct_manager.update_services(sorted(catalog)[:15])
+        yield world
+
+
+def diff_env(session, catalog) -> dict:
+    sct_manager = SCTManager(ENV_NAME, session=session)
+    services = filter_services(sct_manager.env_services, '', '', '', force=True, all_services=catalog)
+    result = sct_manager.diff_services(services)
+    return {state: sorted(result[state]) for state in ('add', 'recreate', 'fail', 'skip')}
+
+
+def test_snapshot_diff_matches_live(world, catalog, tmp_path):
+    file = str(tmp_path / snapshot.get_snapshot_file(ENV_NAME))
+    world.calls.clear()
+    with fake_upstreams(world):
+        data = snapshot.export_env(ENV_NAME, session=RolloutSession(cache=MemoryCache(), services_config=catalog))
+    # services are saved as manager init read them
+    assert world.calls['sct_get_services'] == 1
+    with fake_upstreams(world):
+        live = diff_env(RolloutSession(cache=MemoryCache(), services_config=catalog), catalog)
+    snapshot.save_snapshot(data, file)
+    world.calls.clear()
+
+    offline = diff_env(snapshot.SnapshotSession.from_file(file, services_config=catalog), catalog)
+
+    assert offline == live
+    assert len(live['skip']) >= 15
+    assert not world.calls
+
+
+def test_snapshot_catalog_change(world, catalog):
+    with fake_upstreams(world):
+        data = snapshot.export_env(ENV_NAME, session=RolloutSession(cache=MemoryCache(), services_config=catalog))
+    changed = {**catalog, 'svc00000': [{**catalog['svc00000'][0], 'serviceVersion': 'v99'}]}
+
+    offline = diff_env(snapshot.SnapshotSession(data, services_config=changed), changed)
+
+    assert 'svc00000' in offline['recreate']
+
+
+def test_snapshot_session_errors(world, catalog, tmp_path):
+    with fake_upstreams(world):
+        data = snapshot.export_env(ENV_NAME, session=RolloutSession(cache=MemoryCache(), services_config=catalog))
+    session = snapshot.SnapshotSession(data, services_config=catalog)
+
+    with pytest.raises(snapshot.SnapshotError):
+        SCTManager('lab-bench-001', session=session)
+    with pytest.raises(snapshot.SnapshotError):
+        session.sct.update_service('svc00000', envid=data['env']['id'], input_data=[])
+
+    file = tmp_path / 'old.json.gz'
+    snapshot.save_snapshot({**data, 'version': 0}, str(file))
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.load_snapshot(str(file))
+
+
+def test_cli_export_and_offline_show(world, catalog, tmp_path, mocker, capsys):
+    file = str(tmp_path / 'env.json.gz')
+    mocker.patch('libs.core.read_services_config', return_value=catalog)
+    with fake_upstreams(world):
+        happysct.CLI().export(ENV_NAME, file=file, variables='EXTRA.VAR')
+    assert all('EXTRA.VAR' in values for values in snapshot.load_snapshot(file)['variables'].values())
+    world.calls.clear()
+
+    happysct.CLI().show(ENV_NAME, only='svc00001', snapshot=file)
+    happysct.CLI().diff(ENV_NAME, only='svc00001', snapshot=file)
+
+    assert 'svc00001' in capsys.readouterr().out
+    assert not world.calls
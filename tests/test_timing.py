@@ -0,0 +1,22 @@
+import time
+
+from libs import timing
+
+
+def test_timings_stage():
+    timings = timing.Timings()
+
+    with timings.stage('parse'):
+        time.sleep(0.01)
+    with timings.stage('parse'):
+        time.sleep(0.01)
+
+    assert timings.to_dict()['parse'] >= 0.02
+
+
+def test_timings_merge():
+    timings = timing.Timings()
+    timings.merge({'parse': 0.5, 'diff': 0.25})
+    timings.merge({'parse': 0.5})
+
+    assert timings.to_dict() == {'parse': 1.0, 'diff': 0.25}
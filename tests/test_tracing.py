@@ -0,0 +1,156 @@
+import json
+import threading
+
+import pytest
+
+from libs import core, tracing
+
+
+def test_tracer_disabled():
+    tracer = tracing.Tracer('parser', sample_rate=1)
+    tracer.configure(sample_rate=1, enabled=False)
+
+    assert tracing.traced(tracer)(lambda port: port)(8080) == 8080
+    assert not tracer.spans
+
+
+def test_tracer_zero_sample_rate():
+    tracer = tracing.Tracer('parser')
+    tracer.configure(sample_rate=0, enabled=True)
+
+    assert not tracer.enabled
+
+
+def test_tracer_records_spans():
+    tracer = tracing.Tracer('parser')
+    tracer.configure(sample_rate=1, enabled=True)
+
+    @tracing.traced(tracer, name='get_port')
+    def get_port(port):
+        return port
+
+    assert get_port(8080) == 8080
+    assert get_port(port=80) == 80
+
+    assert [span['result'] for span in tracer.spans] == ['8080', '80']
+    assert tracer.spans[0]['args'] == '(8080,)'
+    assert tracer.spans[1]['kwargs'] == "{'port': 80}"
+    assert tracer.stats()['get_port']['count'] == 2
+
+
+def test_tracer_method_skips_self():
+    tracer = tracing.Tracer('parser')
+    tracer.configure(sample_rate=1, enabled=True)
+
+    class Parser(object):
+        @tracing.traced(tracer)
+        def get_port(self, port):
+            return port
+
+    Parser().get_port(8080)
+
+    assert tracer.spans[0]['name'] == 'test_tracer_method_skips_self.<locals>.Parser.get_port'
+    assert tracer.spans[0]['args'] == '(8080,)'
+
+
+def test_tracer_records_error():
+    tracer = tracing.Tracer('parser')
+    tracer.configure(sample_rate=1, enabled=True)
+
+    @tracing.traced(tracer)
+    def get_port(port):
+        raise ValueError('invalid port')
+
+    with pytest.raises(ValueError):
+        get_port(-1)
+
+    assert 'invalid port' in tracer.spans[0]['error']
+
+
+@pytest.fixture
+def trace_file(monkeypatch, tmp_path):
+    trace_file = tmp_path / 'trace.json'
+    monkeypatch.setattr(tracing, 'exporter', tracing.SpanExporter(str(trace_file)))
+    return trace_file
+
+
+def read_spans(trace_file):
+    assert tracing.exporter.flush()
+    traces = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    return [[span for scope in trace['resourceSpans'][0]['scopeSpans'] for span in scope['spans']]
+            for trace in traces]
+
+
+def test_span_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, 'exporter', tracing.SpanExporter(''))
+
+    with tracing.span('update') as span:
+        assert span is None
+    assert tracing.spanned()(lambda: 1)() == 1
+
+
+def test_spans_exported_with_parents_across_threads(trace_file):
+    @tracing.spanned('update')
+    def update(service):
+        tracing.set_span_attributes(service=service)
+
+    with tracing.span('update_services', env='lab-lem-ams'):
+        core.run_concurrently(update, ['ace', 'pas'])
+
+    traces = read_spans(trace_file)
+    assert len(traces) == 1
+    root = next(span for span in traces[0] if span['name'] == 'update_services')
+    children = [span for span in traces[0] if span['name'] == 'update']
+    assert 'parentSpanId' not in root
+    assert root['attributes'] == [{'key': 'env', 'value': {'stringValue': 'lab-lem-ams'}}]
+    assert len(traces[0]) == 3
+    assert {span['parentSpanId'] for span in children} == {root['spanId']}
+    assert {span['traceId'] for span in traces[0]} == {root['traceId']}
+    assert sorted(span['attributes'][0]['value']['stringValue'] for span in children) == ['ace', 'pas']
+
+
+def test_span_error_status(trace_file):
+    with pytest.raises(ValueError):
+        with tracing.span('update'):
+            raise ValueError('invalid new port')
+
+    span = read_spans(trace_file)[0][0]
+    assert span['status'] == {'code': 2, 'message': 'ValueError: invalid new port'}
+
+
+def test_export_in_background(monkeypatch, mocker):
+    exported = threading.Event()
+    release = threading.Event()
+
+    def _post(*args, **kwargs):
+        exported.set()
+        release.wait(timeout=5)
+        return mocker.MagicMock()
+    monkeypatch.setattr(tracing, 'exporter', tracing.SpanExporter('http://otel-collector:4318/v1/traces',
+                                                                  max_queue=1))
+    mocker.patch('libs.tracing.requests.post', side_effect=_post)
+
+    # slow collector doesn't block span exit, traces over the queue limit are dropped
+    with tracing.span('request'):
+        pass
+    assert exported.wait(timeout=5)
+    with tracing.span('request'):
+        pass
+    with tracing.span('request'):
+        pass
+    assert tracing.exporter.dropped == 1
+
+    release.set()
+    assert tracing.exporter.flush()
+    assert tracing.exporter.exported == 2
+
+
+def test_span_finished_after_root(trace_file):
+    with tracing.span('request'):
+        parent = tracing.current_span.get()
+    child = tracing.Span('stream', parent=parent)
+    child.end = child.start
+    tracing.exporter.finish(child)
+
+    traces = read_spans(trace_file)
+    assert [[span['name'] for span in spans] for spans in traces] == [['request'], ['stream']]